@@ -58,7 +58,7 @@ class BalloonImageInline(admin.TabularInline):
 
 @admin.register(Balloon)
 class BalloonAdmin(TranslatableAdmin):
-    list_display = ('name', 'price', 'discount_price', 'in_stock', 'category', 'author')
+    list_display = ('name', 'price', 'discount_price', 'in_stock', 'category', 'author', 'popularity')
     list_filter = ('in_stock', 'category', 'author')
     search_fields = ('name', 'category__name', 'author__phone')
     inlines = [BalloonImageInline, LiketoBalloonInline]
@@ -66,7 +66,7 @@ class BalloonAdmin(TranslatableAdmin):
 
 @admin.register(Flower)
 class FlowerAdmin(TranslatableAdmin):
-    list_display = ('name', 'price', 'discount_price', 'in_stock', 'category', 'author')
+    list_display = ('name', 'price', 'discount_price', 'in_stock', 'category', 'author', 'popularity')
     list_filter = ('in_stock', 'category', 'author')
     search_fields = ('name', 'category__name', 'author__phone')
     inlines = [SizesofFlowerInline, QuantityofFlowerInline,
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FlowersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.flowers'
+
+    def ready(self):
+        from apps.flowers import signals  # noqa: F401
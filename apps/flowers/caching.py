@@ -0,0 +1,111 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import get_language
+
+from apps.flowers.languages import get_payload_languages
+
+CATALOG_VERSION_KEY = 'catalog-version'
+
+# Names of the responses cached by catalog version, reported by the catalog_cache_stats command
+CATALOG_CACHES = (
+    'flower-list', 'flower-facets', 'distinct-product-attributes', 'category-tree', 'flower-fragments',
+    'balloon-fragments',
+)
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a lost counter never reuses the version of entries that are still cached
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, time.time_ns(), None)
+
+
+def bump_catalog_version_on_commit():
+    transaction.on_commit(bump_catalog_version)
+
+
+def model_version_key(model):
+    return f'model-version:{model._meta.concrete_model._meta.label_lower}'
+
+
+def get_model_versions(models):
+    """
+    Return the version of each model in ``models``. Versions are the time of the model's last change
+    in nanoseconds, so they double as its last-modified time.
+    """
+    keys = [model_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_model_version(model):
+    cache.set(model_version_key(model), time.time_ns(), None)
+
+
+def bump_model_version_on_commit(model):
+    transaction.on_commit(lambda: bump_model_version(model))
+
+
+def catalog_cache_key(name, request):
+    """
+    Build a cache key for a catalog response from the normalized query string, the host the
+    absolute media urls are built for, the payload or active language and the current catalog version.
+    """
+    query = urlencode(sorted((key, value) for key, values in request.GET.lists() for value in values))
+    fingerprint = hashlib.md5(f'{request.scheme}://{request.get_host()}?{query}'.encode()).hexdigest()
+    # A bare ?lang= follows Accept-Language, which the query string alone does not capture
+    language = (get_payload_languages(request) or [get_language()])[0]
+    return f'{name}:{get_catalog_version()}:{language}:{fingerprint}'
+
+
+def cached_catalog_value(name, key, compute, timeout):
+    """
+    Return the cached value under ``key``, computing and storing it on a miss.
+    Hits and misses are counted under ``name``.
+    """
+    value = cache.get(key)
+    if value is None:
+        record_cache_event(name, 'miss')
+        value = compute()
+        cache.set(key, value, timeout)
+    else:
+        record_cache_event(name, 'hit')
+    return value
+
+
+def record_cache_event(name, event, count=1):
+    if not count:
+        return
+    key = f'cache-stats:{name}:{event}'
+    try:
+        cache.incr(key, count)
+    except ValueError:
+        cache.set(key, count, None)
+
+
+def get_cache_stats(name):
+    hits = cache.get(f'cache-stats:{name}:hit', 0)
+    misses = cache.get(f'cache-stats:{name}:miss', 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else None}
+
+
+def reset_cache_stats(name):
+    cache.delete_many([f'cache-stats:{name}:hit', f'cache-stats:{name}:miss'])
@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+
+from apps.flowers.caching import (
+    bump_catalog_version_on_commit, bump_model_version_on_commit, cached_catalog_value, get_catalog_version
+)
+from apps.flowers.models import Category
+
+
+def category_path(category_id, parent_path=''):
+    return f'{parent_path}{category_id}/'
+
+
+def update_category_path(category):
+    """
+    Recompute the materialized path of ``category`` from its parent and move its whole subtree
+    along with it.
+    """
+    parent_path = ''
+    if category.parent_id:
+        parent_path = Category.objects.filter(pk=category.parent_id).values_list('path', flat=True).first() or ''
+    path = category_path(category.pk, parent_path)
+    previous_path = Category.objects.filter(pk=category.pk).values_list('path', flat=True).first()
+    if previous_path == path:
+        return
+
+    Category.objects.filter(pk=category.pk).update(path=path)
+    if previous_path:
+        Category.objects.filter(path__startswith=previous_path).exclude(pk=category.pk).update(
+            path=Concat(Value(path), Substr('path', len(previous_path) + 1))
+        )
+    category.path = path
+
+
+def rebuild_category_paths():
+    """
+    Recompute the materialized path of every category, one tree level at a time.
+    """
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    paths = {}
+    level = {category_id for category_id, parent_id in parents.items() if parent_id is None}
+    for category_id in level:
+        paths[category_id] = category_path(category_id)
+    while level:
+        level = {category_id for category_id, parent_id in parents.items()
+                 if parent_id in level and category_id not in paths}
+        for category_id in level:
+            paths[category_id] = category_path(category_id, paths[parents[category_id]])
+    with transaction.atomic():
+        Category.objects.bulk_update(
+            [Category(id=category_id, path=path) for category_id, path in paths.items()], ['path'], batch_size=500
+        )
+        bump_catalog_version_on_commit()
+        bump_model_version_on_commit(Category)
+    return len(paths)
+
+
+def build_category_tree():
+    """
+    Build the nested category tree with the translations of every language from a single query.
+
+    Ordering by path puts every parent before its children, so each node can be attached to its
+    parent as soon as it is read.
+    """
+    rows = Category.objects.order_by('path', 'id', 'translations__id').values_list(
+        'id', 'parent_id', 'path', 'image', 'translations__language_code', 'translations__name'
+    )
+    nodes = {}
+    paths = {}
+    roots = []
+    for category_id, parent_id, path, image, language_code, name in rows:
+        node = nodes.get(category_id)
+        if node is None:
+            node = nodes[category_id] = {
+                'id': category_id, 'translations': {}, 'image': image or None, 'subcategories': [],
+            }
+            paths[category_id] = path
+            parent = nodes.get(parent_id)
+            (parent['subcategories'] if parent else roots).append(node)
+        if language_code:
+            node['translations'][language_code] = {'name': name}
+    return {'roots': roots, 'paths': paths}
+
+
+def get_category_tree():
+    return cached_catalog_value(
+        'category-tree',
+        f'category-tree:{get_catalog_version()}',
+        build_category_tree,
+        settings.CATEGORY_TREE_CACHE_TIMEOUT,
+    )
+
+
+def expand_category_ids(category_ids):
+    """
+    Return ``category_ids`` together with the ids of all their descendants, read from the cached tree.
+    """
+    paths = get_category_tree()['paths']
+    prefixes = tuple(paths[category_id] for category_id in category_ids if category_id in paths)
+    expanded = set(category_ids)
+    if prefixes:
+        expanded.update(category_id for category_id, path in paths.items() if path.startswith(prefixes))
+    return expanded
+
+
+def represent_category_tree(nodes, request):
+    """
+    Copy the cached ``nodes`` with their stored image names turned into absolute urls.
+    """
+    storage = Category._meta.get_field('image').storage
+    return [
+        {
+            **node,
+            'image': request.build_absolute_uri(storage.url(node['image'])) if node['image'] else None,
+            'subcategories': represent_category_tree(node['subcategories'], request),
+        }
+        for node in nodes
+    ]
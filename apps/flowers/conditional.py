@@ -0,0 +1,31 @@
+import hashlib
+from datetime import datetime, timezone
+
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from apps.flowers.caching import get_model_versions
+from apps.flowers.languages import get_payload_languages
+
+
+def versioned_condition(*models, vary=None):
+    """
+    Decorate a GET handler of an APIView to send a strong ETag and Last-Modified built from the
+    versions of ``models``, and to answer 304 Not Modified before the handler runs when they match.
+
+    The ETag also covers the full url, which carries the filters and the host absolute media urls are
+    built for, and the payload language. ``vary(request)`` may return anything else the response depends on;
+    Last-Modified cannot capture that part, so it is left out for such endpoints.
+    """
+
+    def etag(request, *args, **kwargs):
+        parts = [request.build_absolute_uri(), str((get_payload_languages(request) or [''])[0])]
+        parts += [str(version) for version in get_model_versions(models)]
+        if vary is not None:
+            parts.append(str(vary(request)))
+        return hashlib.md5('\n'.join(parts).encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        return datetime.fromtimestamp(max(get_model_versions(models)) / 1e9, tz=timezone.utc)
+
+    return method_decorator(condition(etag_func=etag, last_modified_func=None if vary else last_modified))
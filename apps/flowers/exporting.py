@@ -0,0 +1,96 @@
+import csv
+from itertools import islice
+
+import orjson
+from parler import appsettings
+
+from apps.flowers.importing import CHILD_MODELS, CSV_LIST_SEPARATOR, FLOWER_FIELDS, TRANSLATED_FIELDS
+from apps.flowers.models import Flower, CountryFlower, PackageFlower
+
+EXPORT_CHUNK_SIZE = 1000
+
+
+def export_languages():
+    return [language['code'] for language in appsettings.PARLER_LANGUAGES.get(None, ())]
+
+
+def related_names(model):
+    """
+    Names of every ``model`` instance in the default language, the way import_flowers matches them.
+    """
+    Translation = model._parler_meta.root_model
+    return dict(
+        Translation.objects.filter(language_code=appsettings.PARLER_DEFAULT_LANGUAGE_CODE)
+        .values_list('master_id', 'name')
+    )
+
+
+def export_records(queryset):
+    """
+    Yield every flower of ``queryset`` in the import_flowers JSON Lines shape, plus its id.
+
+    Flowers are read as plain rows with a server-side cursor where the database has them, and the
+    translations and children of every EXPORT_CHUNK_SIZE of them are fetched with one query per relation.
+    """
+    countries, packages = related_names(CountryFlower), related_names(PackageFlower)
+    rows = queryset.order_by('id').values('id', 'sku', 'country_id', 'package_id', *FLOWER_FIELDS)
+    rows = rows.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    while chunk := list(islice(rows, EXPORT_CHUNK_SIZE)):
+        flower_ids = [row['id'] for row in chunk]
+        translations = {}
+        for master_id, language_code, *values in (
+            Flower._parler_meta.root_model.objects.filter(master_id__in=flower_ids).order_by('id')
+            .values_list('master_id', 'language_code', *TRANSLATED_FIELDS)
+        ):
+            translations.setdefault(master_id, {})[language_code] = dict(zip(TRANSLATED_FIELDS, values))
+        children = {key: {} for key in CHILD_MODELS}
+        for key, model in CHILD_MODELS.items():
+            for flower_id, name in model.objects.filter(flower_id__in=flower_ids).order_by('id').values_list(
+                'flower_id', 'name'
+            ):
+                children[key].setdefault(flower_id, []).append(name)
+
+        for row in chunk:
+            record = {'id': row['id'], 'sku': row['sku']}
+            for name in FLOWER_FIELDS:
+                record[name.removesuffix('_id')] = row[name]
+            record['country'] = countries.get(row['country_id'])
+            record['package'] = packages.get(row['package_id'])
+            record['translations'] = translations.get(row['id'], {})
+            for key in CHILD_MODELS:
+                record[key] = children[key].get(row['id'], [])
+            yield record
+
+
+def export_ndjson(queryset):
+    for record in export_records(queryset):
+        yield orjson.dumps(record, default=str) + b'\n'
+
+
+class LineBuffer:
+    """
+    File-like object handing back what csv.writer writes, so every row can be streamed on its own.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_csv(queryset):
+    """
+    Yield the header, then one CSV line per flower, in the columns import_flowers reads.
+    """
+    languages = export_languages()
+    writer = csv.writer(LineBuffer())
+    scalar_columns = ['id', 'sku', *[name.removesuffix('_id') for name in FLOWER_FIELDS], 'country', 'package']
+    translated_columns = [(field, language) for language in languages for field in TRANSLATED_FIELDS]
+    yield writer.writerow(
+        [*scalar_columns, *[f'{field}_{language}' for field, language in translated_columns], *CHILD_MODELS]
+    )
+    for record in export_records(queryset):
+        translations = record['translations']
+        yield writer.writerow([
+            *['' if record[column] is None else record[column] for column in scalar_columns],
+            *[translations.get(language, {}).get(field) or '' for field, language in translated_columns],
+            *[CSV_LIST_SEPARATOR.join(record[key]) for key in CHILD_MODELS],
+        ])
@@ -0,0 +1,48 @@
+from django.db.models import Count
+from django.utils.translation import get_language
+
+from apps.flowers.filters import FlowerFilter
+from apps.flowers.models import Flower
+
+# Facet name -> the field it groups by. Each facet is also the FlowerFilter parameter narrowing it,
+# and its values are what that parameter accepts: category ids, and names in the active language.
+FLOWER_FACETS = {
+    'category': 'category_id',
+    'country': 'country__translations__name',
+    'package': 'package__translations__name',
+    'plantation': 'translations__plantation',
+    'stem_height': 'stem_height',
+    'volume': 'volume',
+    'head_outer_diameter': 'head_outer_diameter',
+}
+
+
+def filtered_flower_ids(params, facet):
+    """
+    Ids of the flowers matching every filter in ``params`` except the one of ``facet`` itself,
+    so a facet keeps showing its alternatives after one of its values has been picked.
+    """
+    params = params.copy()
+    params.pop(facet, None)
+    return FlowerFilter(params, queryset=Flower.objects.all()).qs.order_by().values('id')
+
+
+def get_flower_facets(params):
+    """
+    Count the flowers per facet value with one grouped query per facet.
+    """
+    language = get_language()
+    facets = {}
+    for facet, field in FLOWER_FACETS.items():
+        relation = field.rpartition('__')[0]
+        if relation.endswith('translations'):
+            # A single filter() call, so the language and the value apply to the same translation row
+            conditions = {f'{relation}__language_code': language, f'{field}__gt': ''}
+        else:
+            conditions = {f'{field}__isnull': False}
+        rows = (
+            Flower.objects.filter(id__in=filtered_flower_ids(params, facet), **conditions)
+            .values(field).annotate(count=Count('id')).order_by(field)
+        )
+        facets[facet] = [{'value': row[field], 'count': row['count']} for row in rows]
+    return facets
@@ -1,11 +1,18 @@
 from django_filters import rest_framework as filters
+from apps.flowers.categories import expand_category_ids
 from apps.flowers.models import Flower
+from apps.flowers.search import search_flowers
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
 
 
 class FlowerFilter(filters.FilterSet):
+    q = filters.CharFilter(method="filter_search", label="Full-text search")
     name = filters.CharFilter(field_name="translations__name", lookup_expr="icontains")
-    category = filters.BaseInFilter(field_name="category__id", lookup_expr="in")
-    package = filters.CharFilter(field_name="package__name", lookup_expr="icontains")
+    category = NumberInFilter(method="filter_category", label="Category ids, including their subcategories")
+    package = filters.CharFilter(field_name="package__translations__name", lookup_expr="icontains")
     size = filters.CharFilter(field_name="flower_size__name", lookup_expr="icontains")
     compound = filters.CharFilter(field_name="flower_compound__name", lookup_expr="icontains")
     quantity = filters.NumberFilter(field_name="quantity")
@@ -13,16 +20,26 @@ class FlowerFilter(filters.FilterSet):
     showcase_online = filters.BooleanFilter(field_name="showcase_online")
     is_popular = filters.BooleanFilter(field_name="is_popular")
     is_new = filters.BooleanFilter(field_name="is_new")
-    country = filters.CharFilter(field_name="country__name", lookup_expr="icontains")
-    plantation = filters.CharFilter(field_name="plantation", lookup_expr="icontains")
+    country = filters.CharFilter(field_name="country__translations__name", lookup_expr="icontains")
+    plantation = filters.CharFilter(field_name="translations__plantation", lookup_expr="icontains")
     stem_height = filters.NumberFilter(field_name="stem_height")
     volume = filters.NumberFilter(field_name="volume")
     head_outer_diameter = filters.NumberFilter(field_name="head_outer_diameter")
     min_price = filters.NumberFilter(field_name="price", lookup_expr="gte", label="Minimum price")
     max_price = filters.NumberFilter(field_name="price", lookup_expr="lte", label="Maximum price")
+    min_rating = filters.NumberFilter(field_name="rating_average", lookup_expr="gte", label="Minimum rating")
+    ordering = filters.OrderingFilter(
+        fields=(('id', 'created'), ('price', 'price'), ('rating_average', 'rating'), ('popularity', 'popularity'))
+    )
 
     class Meta:
         model = Flower
         fields = ['name', 'category', 'package', 'size', 'compound', 'quantity', 'in_stock',
                   'showcase_online', 'is_popular', 'is_new', 'plantation', 'stem_height', 'volume',
-                  'head_outer_diameter', 'country', 'min_price', 'max_price', 'country']
+                  'head_outer_diameter', 'country', 'min_price', 'max_price', 'country', 'min_rating', 'q']
+
+    def filter_category(self, queryset, name, value):
+        return queryset.filter(category_id__in=expand_category_ids({int(category_id) for category_id in value}))
+
+    def filter_search(self, queryset, name, value):
+        return search_flowers(queryset, value)
@@ -0,0 +1,85 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from apps.flowers.caching import record_cache_event
+from apps.flowers.languages import get_payload_languages
+
+
+def fragment_version_key(model, pk):
+    return f'fragment-version:{model._meta.concrete_model._meta.label_lower}:{pk}'
+
+
+def bump_fragment_versions(model, pks):
+    now = time.time_ns()
+    cache.set_many({fragment_version_key(model, pk): now for pk in pks if pk is not None}, None)
+
+
+def bump_fragment_versions_on_commit(model, pks):
+    transaction.on_commit(lambda: bump_fragment_versions(model, pks))
+
+
+def get_fragment_versions(pairs):
+    """
+    Return the version of every ``(model, pk)`` in ``pairs`` with one cache round trip, seeding missing ones.
+    """
+    keys = {pair: fragment_version_key(*pair) for pair in pairs if pair[1] is not None}
+    versions = cache.get_many(list(keys.values()))
+    missing = {key: time.time_ns() for key in keys.values() if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return {pair: versions[key] for pair, key in keys.items()}
+
+
+def fragment_variant(request):
+    """
+    Describe everything besides the instance the representation depends on: the payload language,
+    and the host of the absolute media urls plus the sparse fieldset, hashed.
+    """
+    language = (get_payload_languages(request) or ['all'])[0]
+    params = request.query_params
+    variant = f"{request.scheme}://{request.get_host()}|{params.get('fields', '')}|{params.get('omit', '')}"
+    return f'{language}:{hashlib.md5(variant.encode()).hexdigest()[:12]}'
+
+
+def render_fragments(serializer_class, instances, context, dependencies=()):
+    """
+    Serialize ``instances`` with ``serializer_class`` from per-instance fragments cached under
+    ``<model>:<id>:<version>:<lang>``. The version covers the instance itself and the targets of the
+    ``(foreign key attname, model)`` pairs in ``dependencies``, and is bumped by signals when any of them
+    change. Hits cost one ``get_many``, misses are serialized together and stored with one ``set_many``.
+    """
+    if not instances:
+        return []
+    model = type(instances[0])
+    name = model._meta.model_name
+    pairs = {(model, instance.pk) for instance in instances}
+    pairs.update(
+        (related_model, getattr(instance, attname))
+        for instance in instances for attname, related_model in dependencies
+    )
+    versions = get_fragment_versions(pairs)
+
+    variant = fragment_variant(context['request'])
+    keys = {}
+    for instance in instances:
+        version = '.'.join(
+            str(versions.get((related_model, getattr(instance, attname)), 0))
+            for attname, related_model in (('pk', model), *dependencies)
+        )
+        keys[instance.pk] = f'{name}:{instance.pk}:{version}:{variant}'
+
+    fragments = cache.get_many(list(keys.values()))
+    missing = [instance for instance in instances if keys[instance.pk] not in fragments]
+    record_cache_event(f'{name}-fragments', 'hit', len(instances) - len(missing))
+    record_cache_event(f'{name}-fragments', 'miss', len(missing))
+    if missing:
+        rendered = serializer_class(missing, many=True, context=context).data
+        new_fragments = {keys[instance.pk]: dict(data) for instance, data in zip(missing, rendered)}
+        cache.set_many(new_fragments, settings.FRAGMENT_CACHE_TIMEOUT)
+        fragments.update(new_fragments)
+    return [dict(fragments[keys[instance.pk]]) for instance in instances]
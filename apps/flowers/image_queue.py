@@ -0,0 +1,117 @@
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import UnidentifiedImageError
+
+from apps.flowers.images import apply_variants, optimize_original, render_variants
+from apps.flowers.models import ImageProcessingTask, ImageStatus
+
+
+def enqueue_image_processing(instances):
+    """
+    Queue ``instances`` of an image model for processing, in the current transaction so a task exists
+    exactly when its image does.
+    """
+    ImageProcessingTask.objects.bulk_create([
+        ImageProcessingTask(model=instance._meta.label_lower, object_id=instance.pk) for instance in instances
+    ])
+
+
+def claim_tasks(limit):
+    """
+    Take up to ``limit`` due tasks and hide them from other workers for IMAGE_PROCESSING_LEASE seconds,
+    after which they are handed out again unless they were finished.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        tasks = list(
+            ImageProcessingTask.objects.select_for_update(skip_locked=True)
+            .filter(available_at__lte=now, attempts__lt=settings.IMAGE_PROCESSING_MAX_ATTEMPTS)[:limit]
+        )
+        ImageProcessingTask.objects.filter(pk__in=[task.pk for task in tasks]).update(
+            attempts=F('attempts') + 1, available_at=now + timedelta(seconds=settings.IMAGE_PROCESSING_LEASE)
+        )
+    return tasks
+
+
+def process_image(instance, task=None):
+    """
+    Replace the uploaded original of ``instance`` with an optimized copy and render its variants.
+
+    The copy is written before the image is switched to it, and the original deleted only after that, so
+    a failure never loses the upload. Once ``task`` has optimized the original, its retries only render
+    the variants instead of re-encoding the lossy copy again.
+    """
+    storage = instance.image.storage
+    if task is None or not task.optimized:
+        original = instance.image.name
+        try:
+            instance.image.name = optimize_original(original, storage)
+        except (FileNotFoundError, UnidentifiedImageError):
+            mark_failed(type(instance), instance.pk)
+            return
+        # A queryset update, as a save would queue the image again
+        try:
+            with transaction.atomic():
+                type(instance).objects.filter(pk=instance.pk).update(image=instance.image.name)
+                if task is not None:
+                    ImageProcessingTask.objects.filter(pk=task.pk).update(optimized=True)
+        except Exception:
+            storage.delete(instance.image.name)
+            raise
+        storage.delete(original)
+    result = render_variants(instance.image.name, storage)
+    if result is None:
+        mark_failed(type(instance), instance.pk)
+        return
+    apply_variants(instance, result)
+    instance.status = ImageStatus.READY
+    instance.save(update_fields=['status', *result])
+
+
+def mark_failed(model, pk):
+    instance = model.objects.filter(pk=pk).first()
+    if instance is not None:
+        instance.status = ImageStatus.FAILED
+        instance.save(update_fields=['status'])
+
+
+def run_task(task):
+    """
+    Process the image of ``task``. The task is deleted once done; a failure is recorded on it and retried
+    with a growing delay until IMAGE_PROCESSING_MAX_ATTEMPTS is reached, when the image is marked failed.
+    """
+    model = apps.get_model(task.model)
+    instance = model.objects.filter(pk=task.object_id).first()
+    try:
+        if instance is not None and instance.image:
+            process_image(instance, task)
+    except Exception as error:
+        # task.attempts is the count before this claim
+        attempts = task.attempts + 1
+        if attempts >= settings.IMAGE_PROCESSING_MAX_ATTEMPTS:
+            mark_failed(model, task.object_id)
+        ImageProcessingTask.objects.filter(pk=task.pk).update(
+            last_error=repr(error), available_at=timezone.now() + timedelta(seconds=30 * 2 ** attempts)
+        )
+        return False
+    task.delete()
+    return True
+
+
+def process_image_queue(batch_size=20):
+    """
+    Run the due tasks until none is left. Returns the number of tasks succeeded and failed.
+    """
+    succeeded = failed = 0
+    while tasks := claim_tasks(batch_size):
+        for task in tasks:
+            if run_task(task):
+                succeeded += 1
+            else:
+                failed += 1
+    return succeeded, failed
@@ -0,0 +1,156 @@
+import logging
+import posixpath
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from apps.flowers.models import BannerCarousel, ImagesofBalloon, ImagesofFlower
+
+logger = logging.getLogger(__name__)
+
+IMAGE_VARIANT_MODELS = (ImagesofFlower, ImagesofBalloon, BannerCarousel)
+
+# Pillow format name and file extension of every variant format
+VARIANT_FORMATS = {'webp': ('WEBP', 'webp'), 'jpeg': ('JPEG', 'jpg')}
+
+
+def variant_name(name, width, variant_format):
+    """
+    ``flower_images/rose.jpg`` -> ``flower_images/variants/rose-320w.webp``
+    """
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'variants', f'{stem}-{width}w.{VARIANT_FORMATS[variant_format][1]}')
+
+
+def variant_widths(width):
+    """
+    The configured widths, narrowed to ``width`` so images are never upscaled.
+    """
+    return sorted({min(variant_width, width) for variant_width in settings.IMAGE_VARIANT_WIDTHS})
+
+
+def render_variants(name, storage=default_storage):
+    """
+    Write the variants of the stored image ``name`` in every configured format and width, oriented by
+    and stripped of their EXIF data.
+
+    Returns ``{'width', 'height', 'variants'}`` to store on the model, or None when the file is missing or
+    is not an image. Only touches storage, so it can run in worker processes.
+    """
+    try:
+        with storage.open(name) as file:
+            image = ImageOps.exif_transpose(Image.open(file))
+            image.load()
+    except (OSError, UnidentifiedImageError) as error:
+        logger.warning("Cannot read image %s: %s", name, error)
+        return None
+
+    formats = {}
+    for variant_format in settings.IMAGE_VARIANT_FORMATS:
+        pillow_format = VARIANT_FORMATS[variant_format][0]
+        source = image.convert('RGB' if pillow_format == 'JPEG' or image.mode not in ('RGB', 'RGBA') else image.mode)
+        formats[variant_format] = {}
+        for width in variant_widths(image.width):
+            variant = source.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+            buffer = BytesIO()
+            variant.save(buffer, pillow_format, quality=settings.IMAGE_VARIANT_QUALITY, optimize=True)
+            path = variant_name(name, width, variant_format)
+            storage.delete(path)
+            formats[variant_format][str(width)] = storage.save(path, ContentFile(buffer.getvalue()))
+    return {'width': image.width, 'height': image.height, 'variants': {'source': name, 'formats': formats}}
+
+
+def optimize_original(name, storage=default_storage):
+    """
+    Write a copy of the stored image ``name`` oriented by and stripped of its EXIF data, no larger than
+    IMAGE_MAX_DIMENSION and optimized, in its own format. Returns the name the copy is stored under; the
+    original is left in place until the caller has switched to the copy.
+    """
+    with storage.open(name) as file:
+        image = Image.open(file)
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    image.thumbnail((settings.IMAGE_MAX_DIMENSION, settings.IMAGE_MAX_DIMENSION), Image.LANCZOS)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=settings.IMAGE_VARIANT_QUALITY, optimize=True)
+    # The original's name is taken, so storage picks a free one next to it
+    return storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def delete_variants(variants, storage=default_storage, keep=()):
+    for paths in variants.get('formats', {}).values():
+        for path in paths.values():
+            if path not in keep:
+                storage.delete(path)
+
+
+def needs_variants(instance):
+    return bool(instance.image) and instance.variants.get('source') != instance.image.name
+
+
+def apply_variants(instance, result):
+    """
+    Set the ``render_variants`` result on ``instance`` and delete the variants it replaces.
+    """
+    rendered = {path for paths in result['variants']['formats'].values() for path in paths.values()}
+    delete_variants(instance.variants, instance.image.storage, keep=rendered)
+    for field, value in result.items():
+        setattr(instance, field, value)
+
+
+def backfill_variants(model, workers=None, force=False, batch_size=200):
+    """
+    Render the missing variants of every ``model`` image in a pool of ``workers`` processes, or in
+    this one with ``workers=1``, and save them with ``bulk_update``. Signals are not sent.
+
+    Returns the updated instances.
+    """
+    instances = [
+        instance for instance in model.objects.exclude(image='').order_by('pk')
+        if force or needs_variants(instance)
+    ]
+    if not instances:
+        return []
+
+    names = [instance.image.name for instance in instances]
+    if workers == 1:
+        results = list(map(render_variants, names))
+    else:
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(workers, initializer=django.setup) as pool:
+            results = list(pool.map(render_variants, names, chunksize=16))
+
+    updated = []
+    for instance, result in zip(instances, results):
+        if result is not None:
+            apply_variants(instance, result)
+            updated.append(instance)
+    model.objects.bulk_update(updated, ['width', 'height', 'variants'], batch_size=batch_size)
+    return updated
+
+
+def srcset(variants, request=None):
+    """
+    ``{'webp': 'http://host/media/...-320w.webp 320w, ...', 'jpeg': ...}`` from the stored variants.
+    """
+    def url(path):
+        path = default_storage.url(path)
+        return request.build_absolute_uri(path) if request is not None else path
+
+    return {
+        variant_format: ', '.join(
+            f'{url(path)} {width}w' for width, path in sorted(paths.items(), key=lambda item: int(item[0]))
+        )
+        for variant_format, paths in variants.get('formats', {}).items()
+    }
@@ -0,0 +1,361 @@
+import csv
+import json
+from itertools import islice
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import DataError, IntegrityError, transaction
+from parler import appsettings
+from parler.cache import get_translation_cache_key
+
+from apps.flowers.caching import bump_catalog_version_on_commit, bump_model_version_on_commit
+from apps.flowers.fragments import bump_fragment_versions_on_commit
+from apps.flowers.models import (
+    Category, Flower, CountryFlower, PackageFlower, SizesofFlower, QuantityofFlower, CompoundyofFlower
+)
+from apps.flowers.search import index_flowers
+
+# Flower columns an import row may set, besides sku
+FLOWER_FIELDS = (
+    'price', 'discount_price', 'cashback', 'stem_height', 'volume', 'plant_length', 'price_per_box',
+    'head_outer_diameter', 'quantity', 'in_stock', 'showcase_online', 'is_popular', 'is_new', 'stock_number',
+    'category_id',
+)
+TRANSLATED_FIELDS = ('name', 'description', 'plantation', 'sort')
+# Row key -> the child model it replaces the rows of
+CHILD_MODELS = {'sizes': SizesofFlower, 'quantities': QuantityofFlower, 'compound': CompoundyofFlower}
+# Separator of the values of a child column in CSV files
+CSV_LIST_SEPARATOR = '|'
+
+
+class ImportRowError(Exception):
+    pass
+
+
+def read_jsonl(file):
+    for line_number, line in enumerate(file, start=1):
+        if line.strip():
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as error:
+                yield line_number, ImportRowError(f"invalid JSON: {error}")
+
+
+def language_codes():
+    return [language['code'] for language in appsettings.PARLER_LANGUAGES.get(None, ())]
+
+
+def read_csv(file):
+    """
+    Read flat CSV rows into the JSONL shape: ``<field>_<language>`` columns become translations and
+    child columns are split on ``|``.
+    """
+    languages = language_codes()
+    for line_number, row in enumerate(csv.DictReader(file), start=2):
+        record = {key: value for key, value in row.items() if key and value != ''}
+        translations = {}
+        for language in languages:
+            values = {field: record.pop(f'{field}_{language}') for field in TRANSLATED_FIELDS
+                      if f'{field}_{language}' in record}
+            if values:
+                translations[language] = values
+        if translations:
+            record['translations'] = translations
+        for key in CHILD_MODELS:
+            if key in record:
+                record[key] = record[key].split(CSV_LIST_SEPARATOR)
+        yield line_number, record
+
+
+def read_rows(file, file_format):
+    return read_csv(file) if file_format == 'csv' else read_jsonl(file)
+
+
+def row_key(record):
+    """
+    The sku of an import row, or the id of the flower it updates for rows without one, like the exported
+    flowers that were never given a sku.
+    """
+    if record.get('sku'):
+        return str(record['sku'])
+    try:
+        return int(record['id'])
+    except (TypeError, ValueError):
+        raise ImportRowError("id: must be an integer")
+
+
+def clean_value(model, name, value, key):
+    """
+    Convert ``value`` to python for the ``name`` column of ``model``, checking that it fits the column, as
+    the database would reject the whole batch otherwise.
+    """
+    field = model._meta.get_field(name)
+    try:
+        value = field.to_python(value)
+    except ValidationError as error:
+        raise ImportRowError(f"{key}: {' '.join(error.messages)}")
+    if field.max_length is not None and value is not None and len(value) > field.max_length:
+        raise ImportRowError(f"{key}: must be at most {field.max_length} characters")
+    return value
+
+
+def clean_row(record):
+    """
+    Validate an import row and convert its values to python. Returns ``(key, fields, translations, children)``,
+    where the key is a sku string or a flower id. Whether its category exists is checked per batch.
+    """
+    if isinstance(record, ImportRowError):
+        raise record
+    if not isinstance(record, dict) or not (record.get('sku') or record.get('id')):
+        raise ImportRowError("every row needs a sku or the id of an existing flower")
+    if record.get('sku'):
+        clean_value(Flower, 'sku', str(record['sku']), 'sku')
+    fields = {}
+    for name in FLOWER_FIELDS:
+        key = name.removesuffix('_id')
+        if key in record:
+            fields[name] = clean_value(Flower, name, record[key], key)
+    for key, model in (('country', CountryFlower), ('package', PackageFlower)):
+        if key in record:
+            fields[key] = clean_value(model._parler_meta.root_model, 'name', record[key] or None, key)
+    Translation = Flower._parler_meta.root_model
+    translations = {}
+    for language, values in (record.get('translations') or {}).items():
+        if language not in language_codes():
+            raise ImportRowError(f"translations: unknown language {language!r}")
+        if not isinstance(values, dict):
+            raise ImportRowError(f"translations: {language} must be an object")
+        translations[language] = {
+            field: clean_value(Translation, field, values[field], field) for field in TRANSLATED_FIELDS
+            if field in values
+        }
+    children = {
+        key: [clean_value(model, 'name', str(value), key) for value in record[key]]
+        for key, model in CHILD_MODELS.items() if key in record
+    }
+    return row_key(record), fields, translations, children
+
+
+def assign_changed(instance, values, changed_fields):
+    """
+    Set ``values`` on ``instance`` and add the names of those that differ to ``changed_fields``.
+    Returns whether any did, so unchanged rows can be left out of ``bulk_update``.
+    """
+    changed = False
+    for name, value in values.items():
+        if getattr(instance, name) != value:
+            setattr(instance, name, value)
+            changed_fields.add(name)
+            changed = True
+    return changed
+
+
+class FlowerImporter:
+    """
+    Upsert flowers by sku from a stream of rows, one transaction and a fixed number of queries per batch,
+    so memory does not grow with the input. Rows without a sku update the flower of their id. Countries
+    and packages are matched by name in the default language and created when missing.
+    """
+
+    def __init__(self, batch_size=500, author=None):
+        self.batch_size = batch_size
+        self.author = author
+        self.language = appsettings.PARLER_DEFAULT_LANGUAGE_CODE
+        self.related_ids = {CountryFlower: None, PackageFlower: None}
+        self.created = self.updated = self.unchanged = self.failed = 0
+
+    def run(self, rows, progress=None, on_error=None):
+        """
+        Import ``(line number, row)`` pairs. Invalid rows are skipped and passed to ``on_error`` with their
+        line number and the reason; ``progress`` is called with the importer after every batch.
+        """
+        rows = iter(rows)
+        while batch := list(islice(rows, self.batch_size)):
+            cleaned = {}
+            lines = {}
+            for line_number, record in batch:
+                try:
+                    key, *values = clean_row(record)
+                except ImportRowError as error:
+                    self.fail(line_number, error, on_error)
+                    continue
+                # A later row of the same sku or id wins
+                cleaned[key] = values
+                lines[key] = line_number
+            for key in self.missing_categories(cleaned):
+                category_id = cleaned.pop(key)[0]['category_id']
+                self.fail(lines[key], ImportRowError(f"category: no category has id {category_id}"), on_error)
+            if cleaned:
+                self.write_batch(cleaned, lines, on_error)
+            if progress is not None:
+                progress(self)
+
+    def write_batch(self, rows, lines, on_error):
+        """
+        Import a batch of cleaned rows. When the database rejects it, its rows are imported one at a time,
+        so only the rejected ones are skipped.
+        """
+        try:
+            missing_ids = self.import_batch(rows)
+        except (IntegrityError, DataError) as error:
+            # Countries and packages created by the batch were rolled back with it
+            self.related_ids = dict.fromkeys(self.related_ids)
+            if len(rows) == 1:
+                self.fail(lines[next(iter(rows))], ImportRowError(f"rejected by the database: {error}"), on_error)
+            else:
+                for key, values in rows.items():
+                    self.write_batch({key: values}, lines, on_error)
+            return
+        for flower_id in missing_ids:
+            self.fail(lines[flower_id], ImportRowError(f"no flower has id {flower_id}"), on_error)
+
+    def missing_categories(self, rows):
+        """
+        The keys of the cleaned rows whose category does not exist, with one query per batch.
+        """
+        category_ids = {
+            fields['category_id'] for fields, translations, children in rows.values() if fields.get('category_id')
+        }
+        if not category_ids:
+            return []
+        existing = set(Category.objects.filter(id__in=category_ids).values_list('id', flat=True))
+        return [
+            key for key, (fields, translations, children) in rows.items()
+            if fields.get('category_id') and fields['category_id'] not in existing
+        ]
+
+    def fail(self, line_number, error, on_error):
+        self.failed += 1
+        if on_error is not None:
+            on_error(line_number, error)
+
+    def related_id(self, model, name):
+        ids = self.related_ids[model]
+        if ids is None:
+            Translation = model._parler_meta.root_model
+            ids = self.related_ids[model] = dict(
+                Translation.objects.filter(language_code=self.language).values_list('name', 'master_id')
+            )
+        if name not in ids:
+            instance = model()
+            instance.set_current_language(self.language)
+            instance.name = name
+            instance.save()
+            ids[name] = instance.pk
+        return ids[name]
+
+    @transaction.atomic
+    def import_batch(self, rows):
+        """
+        Write a batch of cleaned rows. Rows of ids no flower has are left out, and their ids returned.
+        """
+        skus = [key for key in rows if isinstance(key, str)]
+        ids = [key for key in rows if isinstance(key, int)]
+        existing = {flower.sku: flower for flower in Flower.objects.filter(sku__in=skus)}
+        if ids:
+            existing.update((flower.pk, flower) for flower in Flower.objects.filter(id__in=ids))
+        missing_ids = [flower_id for flower_id in ids if flower_id not in existing]
+        rows = {key: values for key, values in rows.items() if key not in missing_ids}
+        new_flowers = []
+        changed_flowers = []
+        updated_fields = set()
+        for key, (fields, translations, children) in rows.items():
+            # The cleaned rows are kept as they are for a retry
+            fields = dict(fields)
+            for relation, model in (('country', CountryFlower), ('package', PackageFlower)):
+                if relation in fields:
+                    name = fields.pop(relation)
+                    fields[f'{relation}_id'] = self.related_id(model, name) if name else None
+            flower = existing.get(key)
+            if flower is None:
+                flower = Flower(sku=key, author=self.author, **fields)
+                new_flowers.append(flower)
+            elif assign_changed(flower, fields, updated_fields):
+                changed_flowers.append(flower)
+        Flower.objects.bulk_create(new_flowers, batch_size=self.batch_size)
+        if changed_flowers:
+            Flower.objects.bulk_update(changed_flowers, sorted(updated_fields), batch_size=self.batch_size)
+        flowers = {**existing, **{flower.sku: flower for flower in new_flowers}}
+
+        changed_ids = {flower.pk for flower in (*new_flowers, *changed_flowers)}
+        changed_ids |= self.import_translations(flowers, rows)
+        changed_ids |= self.import_children(flowers, rows)
+
+        if changed_ids:
+            flower_ids = sorted(changed_ids)
+            index_flowers(flower_ids)
+            # Bulk queries send no signals, so the caches they would have invalidated are bumped here
+            bump_catalog_version_on_commit()
+            for model in (Flower, Flower._parler_meta.root_model, *CHILD_MODELS.values()):
+                bump_model_version_on_commit(model)
+            bump_fragment_versions_on_commit(Flower, flower_ids)
+        self.created += len(new_flowers)
+        self.updated += len(changed_ids) - len(new_flowers)
+        self.unchanged += len(flowers) - len(changed_ids)
+        return missing_ids
+
+    def import_translations(self, flowers, rows):
+        """
+        Create or update the translations of the rows. Returns the ids of the flowers whose translations
+        changed, after dropping their entries from parler's translation cache, which bulk queries bypass.
+        """
+        Translation = Flower._parler_meta.root_model
+        existing = {
+            (translation.master_id, translation.language_code): translation
+            for translation in Translation.objects.filter(master_id__in=[flower.pk for flower in flowers.values()])
+        }
+        new_translations = []
+        changed_translations = []
+        updated_fields = set()
+        for key, (fields, translations, children) in rows.items():
+            for language, values in translations.items():
+                translation = existing.get((flowers[key].pk, language))
+                if translation is None:
+                    new_translations.append(Translation(master_id=flowers[key].pk, language_code=language, **values))
+                elif assign_changed(translation, values, updated_fields):
+                    changed_translations.append(translation)
+        Translation.objects.bulk_create(new_translations, batch_size=self.batch_size)
+        if changed_translations:
+            Translation.objects.bulk_update(changed_translations, sorted(updated_fields), batch_size=self.batch_size)
+
+        touched = [*new_translations, *changed_translations]
+        # New translations also replace the fallback markers parler caches for missing languages
+        cache_keys = [
+            get_translation_cache_key(Translation, translation.master_id, translation.language_code)
+            for translation in touched
+        ]
+        if cache_keys:
+            transaction.on_commit(lambda: cache.delete_many(cache_keys))
+        return {translation.master_id for translation in touched}
+
+    def import_children(self, flowers, rows):
+        """
+        Replace the children of every row that lists them. Flowers whose children are already the
+        listed ones are left alone, so re-importing a file does not churn them. Returns the ids of the
+        flowers whose children changed.
+        """
+        changed_ids = set()
+        for key, model in CHILD_MODELS.items():
+            replaced = {
+                flowers[flower_key].pk: sorted(children[key])
+                for flower_key, (fields, translations, children) in rows.items() if key in children
+            }
+            current = {}
+            for child_id, flower_id, name in model.objects.filter(flower_id__in=replaced).values_list(
+                'id', 'flower_id', 'name'
+            ):
+                current.setdefault(flower_id, []).append((name, child_id))
+            changed = {
+                flower_id: names for flower_id, names in replaced.items()
+                if sorted(name for name, child_id in current.get(flower_id, [])) != names
+            }
+            if not changed:
+                continue
+            changed_ids.update(changed)
+            stale = [child_id for flower_id in changed for name, child_id in current.get(flower_id, [])]
+            model.objects.filter(id__in=stale).delete()
+            model.objects.bulk_create(
+                [model(flower_id=flower_id, name=name) for flower_id, names in changed.items() for name in names],
+                batch_size=self.batch_size,
+            )
+        return changed_ids
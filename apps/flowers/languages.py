@@ -0,0 +1,63 @@
+from django.db.models import Case, IntegerField, OuterRef, Prefetch, Subquery, Value, When
+from django.utils.translation import get_language, get_language_from_request
+from parler import appsettings
+
+LANGUAGE_QUERY_PARAM = 'lang'
+# Attribute the scoped translation prefetch stores its rows in, so parler's own translation cache is left alone
+SCOPED_TRANSLATIONS_ATTR = 'scoped_translations'
+
+
+def get_payload_languages(request):
+    """
+    Return the languages of a single-language payload in fallback order, or None when the request
+    did not opt in and every translation should be sent.
+
+    ``?lang=en`` picks the language, a bare ``?lang=`` takes it from the Accept-Language header.
+    Unsupported languages resolve to the PARLER_LANGUAGES default.
+    """
+    if request is None:
+        return None
+    params = getattr(request, 'query_params', request.GET)
+    if LANGUAGE_QUERY_PARAM not in params:
+        return None
+    language = params[LANGUAGE_QUERY_PARAM] or get_language_from_request(request)
+    language = appsettings.PARLER_LANGUAGES.get_language(language)['code']
+    return appsettings.PARLER_LANGUAGES.get_active_choices(language)
+
+
+def get_display_languages(request):
+    """
+    Return the languages a single-language representation is shown in, in fallback order: those of
+    ``?lang=``, or else the active language and its fallbacks.
+    """
+    return get_payload_languages(request) or appsettings.PARLER_LANGUAGES.get_active_choices(get_language())
+
+
+def pick_translation(translations, languages):
+    """
+    Return the translation in the first of ``languages`` available, like parler's fallbacks do.
+    """
+    by_language = {translation.language_code: translation for translation in translations}
+    return next((by_language[language] for language in languages if language in by_language), None)
+
+
+def scoped_translations_prefetch(model, lookup, languages):
+    """
+    Prefetch only the translation each object of ``lookup`` will be shown in: the first of ``languages``
+    it has, picked by a correlated subquery so the whole page still costs one query.
+    """
+    for name in lookup.split('__'):
+        model = model._meta.get_field(name).related_model
+    preferred = preferred_translations(model, OuterRef('master_id'), languages).values('id')[:1]
+    return Prefetch(lookup, queryset=model.objects.filter(id=Subquery(preferred)), to_attr=SCOPED_TRANSLATIONS_ATTR)
+
+
+def preferred_translations(translation_model, master_id, languages):
+    """
+    Translations of ``master_id`` in ``languages``, the preferred one first.
+    """
+    preference = Case(
+        *[When(language_code=language, then=Value(index)) for index, language in enumerate(languages)],
+        output_field=IntegerField(),
+    )
+    return translation_model.objects.filter(master_id=master_id, language_code__in=languages).order_by(preference, 'id')
@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.flowers.models import LiketoFlower, LiketoBalloon
+
+
+def liked_ids_cache_key(like_model, user_id):
+    return f'liked-ids:{like_model._meta.model_name}:{user_id}'
+
+
+def get_liked_ids(user, like_model, field_name):
+    """
+    Return the set of product ids the user has liked.
+
+    The set is cached per user and dropped whenever one of their likes is created or deleted.
+    """
+    if user is None or not user.is_authenticated:
+        return frozenset()
+
+    key = liked_ids_cache_key(like_model, user.pk)
+    liked_ids = cache.get(key)
+    if liked_ids is None:
+        liked_ids = frozenset(like_model.objects.filter(author=user).values_list(field_name, flat=True))
+        cache.set(key, liked_ids, settings.LIKED_IDS_CACHE_TIMEOUT)
+    return liked_ids
+
+
+def get_liked_flower_ids(user):
+    return get_liked_ids(user, LiketoFlower, 'flower_id')
+
+
+def get_liked_balloon_ids(user):
+    return get_liked_ids(user, LiketoBalloon, 'balloon_id')
+
+
+def forget_liked_ids(like_model, user_id):
+    cache.delete(liked_ids_cache_key(like_model, user_id))
+
+
+def like_product(like_model, field_name, product, user):
+    """
+    Like ``product`` for ``user`` with one INSERT ... ON CONFLICT on the unique ``(product, author)``
+    constraint, so double taps and concurrent requests end with the same single like. Returns the like.
+    """
+    like, = like_model.objects.bulk_create(
+        [like_model(**{field_name: product}, author=user)],
+        update_conflicts=True, unique_fields=[field_name, 'author'], update_fields=['author'],
+    )
+    # bulk_create sends no post_save
+    forget_liked_ids(like_model, user.pk)
+    return like
+
+
+def unlike_product(like_model, field_name, product_id, user):
+    """
+    Remove the like of ``product_id`` by ``user``, if there is one.
+    """
+    like_model.objects.filter(**{f'{field_name}_id': product_id}, author=user).delete()
@@ -0,0 +1,139 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils.translation import get_language
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from apps.flowers.caching import bump_catalog_version
+from apps.flowers.languages import get_display_languages
+from apps.flowers.models import Flower, SizesofFlower, ImagesofFlower, Review
+from apps.flowers.pagination import FlowerPagination
+from apps.flowers.serializers import FlowerCardSerializer, FlowerDetailSerializer
+from apps.flowers.utils import get_distinct_product_attributes, query_distinct_product_attributes
+from config.renderers import FastJSONRenderer
+
+
+def seed_flowers(count):
+    """
+    Bulk-insert ``count`` flowers with translations and children. Signals are not sent.
+    """
+    rng = random.Random(count)
+    flowers = Flower.objects.bulk_create([
+        Flower(
+            price=Decimal(rng.randint(100, 50000)) / 100, volume=rng.randint(0, 20), stem_height=rng.choice([0, 40, 50, 60, 70]),
+            head_outer_diameter=Decimal(rng.randint(0, 90)) / 10,
+        )
+        for _ in range(count)
+    ])
+    Translation = Flower._parler_meta.root_model
+    Translation.objects.bulk_create([
+        Translation(
+            master_id=flower.id, language_code=language_code, name=f'Flower {flower.id} {language_code}',
+            description='Lorem ipsum dolor sit amet ' * 8, plantation=f'Plantation {rng.randint(1, 40)}', sort='Premium',
+        )
+        for flower in flowers for language_code in ('ru', 'en')
+    ])
+    SizesofFlower.objects.bulk_create([SizesofFlower(flower=flower, name='M') for flower in flowers])
+    ImagesofFlower.objects.bulk_create([
+        ImagesofFlower(flower=flower, image=f'flower_images/{flower.id}-{index}.jpg')
+        for flower in flowers for index in range(3)
+    ])
+    Review.objects.bulk_create([
+        Review(flower=flower, full_name='Bench', rating=rng.randint(1, 5), content='Fine')
+        for flower in flowers for _ in range(2)
+    ])
+    return flowers
+
+
+def distinct_attributes(flowers):
+    language = get_language()
+    return lambda: query_distinct_product_attributes(language)
+
+
+def distinct_attributes_cached(flowers):
+    return get_distinct_product_attributes
+
+
+def page_context():
+    return {'request': Request(RequestFactory().get('/api/v1/flower/flowers/all/')), 'liked_flower_ids': frozenset()}
+
+
+def flower_page_detail(flowers):
+    """
+    Serialize the largest page of the flower list the way the default list does.
+    """
+    def run():
+        page = Flower.objects.order_by('-id')[:FlowerPagination.max_page_size]
+        return FlowerDetailSerializer(page, many=True, context=page_context()).data
+    return run
+
+
+def flower_page_card(flowers):
+    """
+    Serialize the largest page of the flower list as cards, with ?view=card.
+    """
+    def run():
+        context = page_context()
+        rows = FlowerCardSerializer.card_rows(Flower.objects.order_by('-id'), get_display_languages(context['request']))
+        return FlowerCardSerializer(rows[:FlowerPagination.max_page_size], many=True, context=context).data
+    return run
+
+
+def render_page(renderer_class):
+    """
+    Render the largest serialized page of the flower list to JSON with ``renderer_class``; the page
+    is serialized once, beforehand.
+    """
+    def scenario(flowers):
+        data = {'count': len(flowers), 'next': None, 'previous': None, 'results': flower_page_detail(flowers)()}
+        renderer = renderer_class()
+        return lambda: renderer.render(data)
+    return scenario
+
+
+SCENARIOS = {
+    'distinct-attributes': distinct_attributes,
+    'distinct-attributes-cached': distinct_attributes_cached,
+    'flower-page-detail': flower_page_detail,
+    'flower-page-card': flower_page_card,
+    'render-page-json': render_page(JSONRenderer),
+    'render-page-fast-json': render_page(FastJSONRenderer),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Time catalog code paths on generated flowers, at several catalog sizes. Everything runs inside a "
+        "transaction that is rolled back, but use a development database all the same."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000', help="Comma-separated catalog sizes.")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per scenario; the best one is reported.")
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help="Limit to these scenarios.")
+
+    def handle(self, *args, **options):
+        scenarios = options['scenario'] or list(SCENARIOS)
+        for size in [int(size) for size in options['sizes'].split(',')]:
+            with transaction.atomic():
+                flowers = seed_flowers(size)
+                bump_catalog_version()
+                for name in scenarios:
+                    run = SCENARIOS[name](flowers)
+                    timings = []
+                    for _ in range(options['repeat']):
+                        with CaptureQueriesContext(connection) as queries:
+                            started = time.perf_counter()
+                            run()
+                            timings.append(time.perf_counter() - started)
+                    self.stdout.write(
+                        f"{name:<28} {size:>7} flowers {len(queries.captured_queries):>5} queries "
+                        f"{min(timings) * 1000:>9.2f} ms"
+                    )
+                transaction.set_rollback(True)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.flowers.caching import CATALOG_CACHES, get_cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters of the catalog response caches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Reset the counters after printing them.")
+
+    def handle(self, *args, **options):
+        for name in CATALOG_CACHES:
+            stats = get_cache_stats(name)
+            hit_rate = '-' if stats['hit_rate'] is None else f"{stats['hit_rate']:.1%}"
+            self.stdout.write(f"{name}: {stats['hits']} hits, {stats['misses']} misses, hit rate {hit_rate}")
+            if options['reset']:
+                reset_cache_stats(name)
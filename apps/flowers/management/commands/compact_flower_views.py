@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.flowers.view_events import compact_flower_views
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the flower views of every user but their latest ones, which are all the recently viewed "
+        "list shows. Meant to run periodically, e.g. nightly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep', type=int, default=settings.RECENTLY_VIEWED_SIZE,
+            help="Views kept per user (default: RECENTLY_VIEWED_SIZE)."
+        )
+
+    def handle(self, *args, **options):
+        deleted = compact_flower_views(keep=options['keep'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} old flower views."))
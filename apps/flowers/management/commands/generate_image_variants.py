@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from apps.flowers.caching import bump_catalog_version, bump_model_version
+from apps.flowers.fragments import bump_fragment_versions
+from apps.flowers.images import IMAGE_VARIANT_MODELS, backfill_variants
+from apps.flowers.signals import FRAGMENT_SOURCES
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the resized variants of flower, balloon and banner images that do not have them yet, "
+        "in a pool of worker processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes, one per CPU by default.")
+        parser.add_argument('--force', action='store_true', help="Render images that already have variants again.")
+
+    def handle(self, *args, **options):
+        total = 0
+        for model in IMAGE_VARIANT_MODELS:
+            updated = backfill_variants(model, workers=options['workers'], force=options['force'])
+            total += len(updated)
+            if updated:
+                # bulk_update sends no signals, so the caches are invalidated here
+                bump_model_version(model)
+                if model in FRAGMENT_SOURCES:
+                    fragment_model, attname = FRAGMENT_SOURCES[model]
+                    bump_fragment_versions(fragment_model, {getattr(instance, attname) for instance in updated})
+            self.stdout.write(self.style.SUCCESS(
+                f"Generated variants for {len(updated)} {model._meta.label} images."
+            ))
+        if total:
+            bump_catalog_version()
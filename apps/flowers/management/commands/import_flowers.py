@@ -0,0 +1,59 @@
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.flowers.importing import FlowerImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update flowers by sku from a CSV or JSON Lines file, with their translations, sizes, "
+        "quantities, compound, country and package. Rows without a sku update the flower of their id. The "
+        "file is streamed and written in batches, so memory use does not depend on its size."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for standard input.")
+        parser.add_argument(
+            '--format', choices=['csv', 'jsonl'], help="Input format; guessed from the file extension by default."
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows written per transaction.")
+        parser.add_argument('--author', type=int, help="ID of the user new flowers are attributed to.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        author = None
+        if options['author'] is not None:
+            author = get_user_model().objects.filter(pk=options['author']).first()
+            if author is None:
+                raise CommandError(f"User {options['author']} does not exist.")
+
+        importer = FlowerImporter(batch_size=options['batch_size'], author=author)
+        started = time.perf_counter()
+
+        def progress(importer):
+            processed = importer.created + importer.updated + importer.unchanged + importer.failed
+            self.stdout.write(
+                f"{processed} rows: {importer.created} created, {importer.updated} updated, "
+                f"{importer.unchanged} unchanged, {importer.failed} skipped, "
+                f"{processed / (time.perf_counter() - started):.0f} rows/s"
+            )
+
+        def on_error(line_number, error):
+            self.stderr.write(f"Line {line_number}: {error}")
+
+        file = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            importer.run(read_rows(file, file_format), progress=progress, on_error=on_error)
+        finally:
+            if file is not sys.stdin:
+                file.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {importer.created + importer.updated + importer.unchanged} flowers ({importer.created} created, "
+            f"{importer.updated} updated, {importer.unchanged} unchanged, {importer.failed} skipped) "
+            f"in {time.perf_counter() - started:.1f} s."
+        ))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.flowers.image_queue import process_image_queue
+
+
+class Command(BaseCommand):
+    help = (
+        "Process uploaded images from the image queue: optimize the originals and render their variants. "
+        "Runs as a long-lived worker next to the web processes unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Process the due tasks and exit.")
+        parser.add_argument('--interval', type=float, default=2, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--batch-size', type=int, default=20, help="Tasks claimed at a time.")
+
+    def handle(self, *args, **options):
+        while True:
+            succeeded, failed = process_image_queue(options['batch_size'])
+            if succeeded or failed or options['once']:
+                self.stdout.write(self.style.SUCCESS(f"Processed {succeeded} images, {failed} failed."))
+            if options['once']:
+                return
+            time.sleep(options['interval'])
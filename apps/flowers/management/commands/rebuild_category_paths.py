@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.flowers.categories import rebuild_category_paths
+
+
+class Command(BaseCommand):
+    help = "Recompute the materialized path of every category from Category.parent."
+
+    def handle(self, *args, **options):
+        updated = rebuild_category_paths()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt paths for {updated} categories."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.flowers.ratings import rebuild_flower_ratings
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute rating_sum, rating_count, rating_average and the star histogram of every flower "
+        "from its reviews."
+    )
+
+    def handle(self, *args, **options):
+        updated = rebuild_flower_ratings()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ratings for {updated} flowers."))
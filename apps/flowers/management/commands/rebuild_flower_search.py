@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.flowers.search import is_search_supported, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of flowers from their translations."
+
+    def handle(self, *args, **options):
+        if not is_search_supported():
+            raise CommandError("Full-text search is only supported on SQLite and PostgreSQL.")
+        indexed = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} flowers."))
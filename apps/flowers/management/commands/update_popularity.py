@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.flowers.popularity import POPULARITY_MODELS, update_popularity
+
+
+class Command(BaseCommand):
+    help = (
+        "Update the time-decayed popularity scores of flowers and balloons from their views, likes and "
+        "orders, flag the most popular ones and refresh the trending rankings. Only orders recorded since "
+        "the previous run are read, and likes and views when they changed, so it is meant to run every few "
+        "minutes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true', help="Recompute the scores from every order instead of the new ones."
+        )
+        parser.add_argument(
+            '--interval', type=float, help="Keep running, updating the scores every this many seconds."
+        )
+
+    def handle(self, *args, **options):
+        rebuild = options['rebuild']
+        while True:
+            for model in POPULARITY_MODELS:
+                started = time.perf_counter()
+                updated = update_popularity(model, rebuild=rebuild)
+                self.stdout.write(self.style.SUCCESS(
+                    f"Scored {updated} {model._meta.verbose_name_plural} in {time.perf_counter() - started:.2f} s."
+                ))
+            if options['interval'] is None:
+                return
+            rebuild = False
+            time.sleep(options['interval'])
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:05
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+
+def fill_flower_ratings(apps, schema_editor):
+    Flower = apps.get_model('flowers', 'Flower')
+    Review = apps.get_model('flowers', 'Review')
+    reviews = Review.objects.filter(flower=OuterRef('pk')).order_by().values('flower')
+    Flower.objects.update(
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+        rating_count=Coalesce(Subquery(reviews.annotate(total=Count('pk')).values('total')), 0),
+    )
+    Flower.objects.update(rating_average=Case(
+        When(rating_count=0, then=Value(0.0)),
+        default=Cast('rating_sum', FloatField()) / F('rating_count'),
+        output_field=FloatField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flowers', '0009_liketoballoon'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='bannercarousel',
+            options={'ordering': ['id'], 'verbose_name': '7. Карусели баннеров', 'verbose_name_plural': '7. Карусели баннеров'},
+        ),
+        migrations.AlterModelOptions(
+            name='bannercarouseltranslation',
+            options={'default_permissions': (), 'managed': True, 'verbose_name': '7. Карусели баннеров Translation'},
+        ),
+        migrations.AddField(
+            model_name='flower',
+            name='rating_average',
+            field=models.FloatField(db_index=True, default=0, editable=False, verbose_name='Средний рейтинг'),
+        ),
+        migrations.AddField(
+            model_name='flower',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество отзывов'),
+        ),
+        migrations.AddField(
+            model_name='flower',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.RunPython(fill_flower_ratings, migrations.RunPython.noop),
+    ]
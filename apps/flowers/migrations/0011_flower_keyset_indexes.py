@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flowers', '0010_flower_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flower',
+            index=models.Index(fields=['price', 'id'], name='flowers_flo_price_1508c5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flower',
+            index=models.Index(fields=['rating_average', 'id'], name='flowers_flo_rating__5cce5d_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+SEARCH_TABLE = 'flowers_flower_search'
+SEARCH_FIELDS = ('name', 'description', 'sort', 'plantation')
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE TABLE {SEARCH_TABLE} ("
+            f"flower_id bigint PRIMARY KEY REFERENCES flowers_flower (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            f"document tsvector NOT NULL)"
+        )
+        schema_editor.execute(f"CREATE INDEX {SEARCH_TABLE}_document_gin ON {SEARCH_TABLE} USING GIN (document)")
+        insert = f"INSERT INTO {SEARCH_TABLE} (flower_id, document) VALUES (%s, to_tsvector('simple', %s))"
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(document, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        insert = f"INSERT INTO {SEARCH_TABLE} (rowid, document) VALUES (%s, %s)"
+    else:
+        return
+
+    Flower = apps.get_model('flowers', 'Flower')
+    FlowerTranslation = apps.get_model('flowers', 'FlowerTranslation')
+    documents = {flower_id: [] for flower_id in Flower.objects.values_list('id', flat=True)}
+    for master_id, *values in FlowerTranslation.objects.order_by('id').values_list('master_id', *SEARCH_FIELDS):
+        documents[master_id].extend(value for value in values if value)
+    with connection.cursor() as cursor:
+        cursor.executemany(insert, [(flower_id, ' '.join(values)) for flower_id, values in documents.items()])
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flowers', '0011_flower_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:17
+
+from django.db import migrations, models
+
+
+def fill_category_paths(apps, schema_editor):
+    Category = apps.get_model('flowers', 'Category')
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    paths = {}
+    level = {category_id for category_id, parent_id in parents.items() if parent_id is None}
+    for category_id in level:
+        paths[category_id] = f'{category_id}/'
+    while level:
+        level = {category_id for category_id, parent_id in parents.items()
+                 if parent_id in level and category_id not in paths}
+        for category_id in level:
+            paths[category_id] = f'{paths[parents[category_id]]}{category_id}/'
+    Category.objects.bulk_update(
+        [Category(id=category_id, path=path) for category_id, path in paths.items()], ['path'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flowers', '0012_flower_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255, verbose_name='Путь'),
+        ),
+        migrations.RunPython(fill_category_paths, migrations.RunPython.noop),
+    ]
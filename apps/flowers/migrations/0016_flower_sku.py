@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flowers', '0015_image_processing_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flower',
+            name='sku',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True, verbose_name='Артикул'),
+        ),
+    ]
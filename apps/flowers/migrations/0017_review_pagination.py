@@ -0,0 +1,61 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:49
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_rating_histograms(apps, schema_editor):
+    Flower = apps.get_model('flowers', 'Flower')
+    Review = apps.get_model('flowers', 'Review')
+    reviews = Review.objects.filter(flower=OuterRef('pk')).order_by().values('flower')
+    Flower.objects.update(**{
+        f'rating_{value}': Coalesce(
+            Subquery(reviews.filter(rating=value).annotate(total=Count('pk')).values('total')), 0
+        )
+        for value in range(1, 6)
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flowers', '0016_flower_sku'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flower',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок 1'),
+        ),
+        migrations.AddField(
+            model_name='flower',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок 2'),
+        ),
+        migrations.AddField(
+            model_name='flower',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок 3'),
+        ),
+        migrations.AddField(
+            model_name='flower',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок 4'),
+        ),
+        migrations.AddField(
+            model_name='flower',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок 5'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['flower', 'created_at'], name='flowers_rev_flower__0c55a1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['flower', 'rating'], name='flowers_rev_flower__40b9ac_idx'),
+        ),
+        migrations.RunPython(fill_rating_histograms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:52
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def delete_duplicate_views(apps, schema_editor):
+    ViewUsertoFlower = apps.get_model('flowers', 'ViewUsertoFlower')
+    first_views = (
+        ViewUsertoFlower.objects.filter(flower__isnull=False, author__isnull=False)
+        .values('flower', 'author').annotate(first_id=Min('id')).values('first_id')
+    )
+    ViewUsertoFlower.objects.filter(flower__isnull=False, author__isnull=False).exclude(
+        id__in=first_views
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flowers', '0017_review_pagination'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_views, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='viewusertoflower',
+            constraint=models.UniqueConstraint(fields=('flower', 'author'), name='unique_flower_view_per_author'),
+        ),
+    ]
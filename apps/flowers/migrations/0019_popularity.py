@@ -0,0 +1,52 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flowers', '0018_flower_view_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularityCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100, unique=True, verbose_name='Модель')),
+                ('decayed_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата пересчёта')),
+                ('last_ids', models.JSONField(blank=True, default=dict, verbose_name='Последние учтённые события')),
+            ],
+            options={
+                'verbose_name': 'Пересчёт популярности',
+                'verbose_name_plural': 'Пересчёт популярности',
+            },
+        ),
+        migrations.AddField(
+            model_name='balloon',
+            name='popularity',
+            field=models.FloatField(db_index=True, default=0, editable=False, verbose_name='Популярность'),
+        ),
+        migrations.AddField(
+            model_name='flower',
+            name='popularity',
+            field=models.FloatField(default=0, editable=False, verbose_name='Популярность'),
+        ),
+        migrations.AlterField(
+            model_name='balloon',
+            name='is_popular',
+            field=models.BooleanField(blank=True, default=False, editable=False, null=True, verbose_name='Популярное'),
+        ),
+        migrations.AlterField(
+            model_name='flower',
+            name='is_popular',
+            field=models.BooleanField(blank=True, default=False, editable=False, null=True, verbose_name='Популярное'),
+        ),
+        migrations.AddIndex(
+            model_name='flower',
+            index=models.Index(fields=['popularity', 'id'], name='flowers_flo_popular_a9e8ec_idx'),
+        ),
+    ]
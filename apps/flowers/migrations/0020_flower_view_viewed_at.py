@@ -0,0 +1,34 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:00
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Cast
+
+
+def fill_viewed_at(apps, schema_editor):
+    ViewUsertoFlower = apps.get_model('flowers', 'ViewUsertoFlower')
+    ViewUsertoFlower.objects.filter(created_at__isnull=False).update(
+        viewed_at=Cast('created_at', models.DateTimeField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flowers', '0019_popularity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='viewusertoflower',
+            name='viewed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Последний просмотр'),
+        ),
+        migrations.AddIndex(
+            model_name='viewusertoflower',
+            index=models.Index(fields=['author', '-viewed_at'], name='flowers_vie_author__76686c_idx'),
+        ),
+        migrations.RunPython(fill_viewed_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:03
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def delete_duplicate_likes(apps, schema_editor):
+    for model_name, field_name in (('LiketoFlower', 'flower'), ('LiketoBalloon', 'balloon')):
+        Like = apps.get_model('flowers', model_name)
+        likes = Like.objects.filter(**{f'{field_name}__isnull': False}, author__isnull=False)
+        first_likes = likes.values(field_name, 'author').annotate(first_id=Min('id')).values('first_id')
+        likes.exclude(id__in=first_likes).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flowers', '0020_flower_view_viewed_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_likes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='liketoballoon',
+            constraint=models.UniqueConstraint(fields=('balloon', 'author'), name='unique_balloon_like_per_author'),
+        ),
+        migrations.AddConstraint(
+            model_name='liketoflower',
+            constraint=models.UniqueConstraint(fields=('flower', 'author'), name='unique_flower_like_per_author'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flowers', '0021_unique_likes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageprocessingtask',
+            name='optimized',
+            field=models.BooleanField(default=False, verbose_name='Оригинал оптимизирован'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:29
+
+from django.db import migrations, models
+
+
+def reset_popularity(apps, schema_editor):
+    # The scores counted every like and view ever recorded, the next update_popularity run rebuilds them
+    for name in ('Flower', 'Balloon'):
+        apps.get_model('flowers', name).objects.update(popularity=0)
+    apps.get_model('flowers', 'PopularityCheckpoint').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flowers', '0022_imageprocessingtask_optimized'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flower',
+            name='event_popularity',
+            field=models.FloatField(default=0, editable=False, verbose_name='Популярность по заказам'),
+        ),
+        migrations.AddField(
+            model_name='popularitycheckpoint',
+            name='fingerprints',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Состояние учтённых строк'),
+        ),
+        migrations.RunPython(reset_popularity, migrations.RunPython.noop),
+    ]
@@ -2,11 +2,52 @@ from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from parler.models import TranslatableModel, TranslatedFields, TranslatableManager
 
 user = settings.AUTH_USER_MODEL
 
 
+class ImageStatus(models.TextChoices):
+    PENDING = 'pending', "Обрабатывается"
+    READY = 'ready', "Готово"
+    FAILED = 'failed', "Ошибка"
+
+
+class ImageVariantsModel(models.Model):
+    """
+    Dimensions of ``image`` and its resized variants, filled in by apps.flowers.image_queue after upload.
+    """
+    status = models.CharField(max_length=10, choices=ImageStatus.choices, default=ImageStatus.READY, editable=False,
+                              verbose_name="Статус обработки")
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Ширина")
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Высота")
+    variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Варианты изображения")
+
+    class Meta:
+        abstract = True
+
+
+class ComputedFieldsModel(models.Model):
+    """
+    Leaves ``computed_fields`` out of the fields a save of an existing instance writes. They are maintained
+    with UPDATE queries, so a stale instance, as edited in the admin or by a serializer, must not write them
+    back.
+    """
+    computed_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.computed_fields
+            ]
+        super().save(*args, **kwargs)
+
+    class Meta:
+        abstract = True
+
+
 class Category(TranslatableModel):
     translations = TranslatedFields(
         name=models.CharField(_("Название категория"), max_length=250, null=True, blank=True),
@@ -21,6 +62,8 @@ class Category(TranslatableModel):
         related_name='subcategories'
     )
     created_at = models.DateField(auto_now_add=True, null=True, blank=True, verbose_name="Дата публикации")
+    # Materialized path of ancestor ids, e.g. "1/5/12/", maintained by the category signals
+    path = models.CharField(max_length=255, default='', editable=False, db_index=True, verbose_name="Путь")
 
     objects = TranslatableManager()
 
@@ -28,8 +71,14 @@ class Category(TranslatableModel):
         return str(self.safe_translation_getter('name', any_language=True))
 
 
+class TopLevelCategoryManager(TranslatableManager):
+
+    def get_queryset(self):
+        return super().get_queryset().filter(parent__isnull=True)
+
+
 class TopLevelCategory(Category):
-    objects = TranslatableManager()
+    objects = TopLevelCategoryManager()
 
     class Meta:
         proxy = True
@@ -68,13 +117,14 @@ class CountryFlower(TranslatableModel):
         verbose_name_plural = "3. Страна"
 
 
-class Flower(TranslatableModel):
+class Flower(ComputedFieldsModel, TranslatableModel):
     translations = TranslatedFields(
         name=models.CharField(_("Название цвета"), max_length=250, null=True, blank=True),
         description=models.TextField(null=True, blank=True, verbose_name="Краткое описание"),
         plantation=models.CharField(_("Плантация"), max_length=250, null=True, blank=True),
         sort=models.CharField(_("Cорт"), max_length=250, null=True, blank=True),
     )
+    sku = models.CharField(_("Артикул"), max_length=100, unique=True, null=True, blank=True)
     stem_height = models.IntegerField(default=0, null=True, blank=True, verbose_name='Высота стебля')
     volume = models.IntegerField(default=0, null=True, blank=True, verbose_name='Объём')
     plant_length = models.IntegerField(default=0, null=True, blank=True, verbose_name='Длина растения')
@@ -92,18 +142,37 @@ class Flower(TranslatableModel):
     quantity = models.IntegerField(default=0, null=True, blank=True, verbose_name="Количество цветов")
     in_stock = models.BooleanField(default=True, null=True, blank=True, verbose_name="В наличи или нет")
     showcase_online = models.BooleanField(default=False, null=True, blank=True, verbose_name='Витрина Онлайн')
-    is_popular = models.BooleanField(default=False, null=True, blank=True, verbose_name='Популярное')
+    is_popular = models.BooleanField(default=False, null=True, blank=True, editable=False, verbose_name='Популярное')
     is_new = models.BooleanField(default=False, null=True, blank=True, verbose_name='Новинки')
     stock_number = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True, verbose_name="Процент акции")
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name="Сумма оценок")
+    rating_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество отзывов")
+    rating_average = models.FloatField(default=0, editable=False, db_index=True, verbose_name="Средний рейтинг")
+    rating_1 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Оценок 1")
+    rating_2 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Оценок 2")
+    rating_3 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Оценок 3")
+    rating_4 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Оценок 4")
+    rating_5 = models.PositiveIntegerField(default=0, editable=False, verbose_name="Оценок 5")
+    popularity = models.FloatField(default=0, editable=False, verbose_name="Популярность")
+    event_popularity = models.FloatField(default=0, editable=False, verbose_name="Популярность по заказам")
 
     objects = TranslatableManager()
 
+    # Maintained by apps.flowers.ratings and apps.flowers.popularity
+    computed_fields = ('rating_sum', 'rating_count', 'rating_average', 'rating_1', 'rating_2', 'rating_3', 'rating_4',
+                       'rating_5', 'popularity', 'event_popularity', 'is_popular')
+
     def __str__(self):
         return self.safe_translation_getter('name', any_language=True) or 'Безымянный'
 
     class Meta:
         verbose_name = "4. Цветы"
         verbose_name_plural = "4. Цветы"
+        indexes = [
+            models.Index(fields=['price', 'id']),
+            models.Index(fields=['rating_average', 'id']),
+            models.Index(fields=['popularity', 'id']),
+        ]
 
 
 class SizesofFlower(models.Model):
@@ -139,7 +208,7 @@ class CompoundyofFlower(models.Model):
         return self.name
 
 
-class ImagesofFlower(models.Model):
+class ImagesofFlower(ImageVariantsModel):
     image = models.ImageField(upload_to='flower_images/', null=True, blank=True, verbose_name="Изображение")
     flower = models.ForeignKey(Flower, on_delete=models.CASCADE, null=True, blank=True, verbose_name="Выбрать цветок",
                                related_name='images')
@@ -170,9 +239,13 @@ class Review(models.Model):
     class Meta:
         verbose_name = _("5. Отзыв")
         verbose_name_plural = _("5. Отзывы")
+        indexes = [
+            models.Index(fields=['flower', 'created_at']),
+            models.Index(fields=['flower', 'rating']),
+        ]
 
 
-class BannerCarousel(TranslatableModel):
+class BannerCarousel(ImageVariantsModel, TranslatableModel):
     translations = TranslatedFields(
         title=models.CharField(_("Название баннера"), max_length=250, null=True, blank=True),
         text=models.TextField(null=True, blank=True, verbose_name="Краткое описание"),
@@ -199,6 +272,9 @@ class LiketoFlower(models.Model):
         ordering = ["id"]
         verbose_name = _("Лайк за цветы ")
         verbose_name_plural = _("Лайк за цветы")
+        constraints = [
+            models.UniqueConstraint(fields=['flower', 'author'], name='unique_flower_like_per_author'),
+        ]
 
 
 class ViewUsertoFlower(models.Model):
@@ -206,6 +282,7 @@ class ViewUsertoFlower(models.Model):
                                related_name='flower_views')
     author = models.ForeignKey(user, on_delete=models.CASCADE, null=True, blank=True, verbose_name="Автор")
     created_at = models.DateField(auto_now_add=True, null=True, blank=True, verbose_name="Дата публикации")
+    viewed_at = models.DateTimeField(default=timezone.now, verbose_name="Последний просмотр")
 
     objects = models.Manager()
 
@@ -213,9 +290,15 @@ class ViewUsertoFlower(models.Model):
         ordering = ["id"]
         verbose_name = _("Увиденные цветы ")
         verbose_name_plural = _("Увиденные цветы")
+        constraints = [
+            models.UniqueConstraint(fields=['flower', 'author'], name='unique_flower_view_per_author'),
+        ]
+        indexes = [
+            models.Index(fields=['author', '-viewed_at']),
+        ]
 
 
-class Balloon(TranslatableModel):
+class Balloon(ComputedFieldsModel, TranslatableModel):
     translations = TranslatedFields(
         name=models.CharField(_("Название цвета"), max_length=250, null=True, blank=True),
         description=models.TextField(null=True, blank=True, verbose_name="Краткое описание"),
@@ -229,13 +312,17 @@ class Balloon(TranslatableModel):
     quantity = models.IntegerField(default=0, null=True, blank=True, verbose_name="Количество цветов")
     in_stock = models.BooleanField(default=True, null=True, blank=True, verbose_name="В наличи или нет")
     showcase_online = models.BooleanField(default=False, null=True, blank=True, verbose_name='Витрина Онлайн')
-    is_popular = models.BooleanField(default=False, null=True, blank=True, verbose_name='Популярное')
+    is_popular = models.BooleanField(default=False, null=True, blank=True, editable=False, verbose_name='Популярное')
     is_new = models.BooleanField(default=False, null=True, blank=True, verbose_name='Новинки')
     stock_number = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True,
                                        verbose_name="Процент акции")
+    popularity = models.FloatField(default=0, editable=False, db_index=True, verbose_name="Популярность")
 
     objects = TranslatableManager()
 
+    # Maintained by apps.flowers.popularity
+    computed_fields = ('popularity', 'is_popular')
+
     def __str__(self):
         return self.safe_translation_getter('name', any_language=True) or 'Безымянный'
 
@@ -244,7 +331,7 @@ class Balloon(TranslatableModel):
         verbose_name_plural = "6. Воздушные шары"
 
 
-class ImagesofBalloon(models.Model):
+class ImagesofBalloon(ImageVariantsModel):
     image = models.ImageField(upload_to='balloon_images/', null=True, blank=True, verbose_name="Изображение")
     balloon = models.ForeignKey(Balloon, on_delete=models.CASCADE, null=True, blank=True, verbose_name="Выбрать",
                                related_name='images_balloon')
@@ -267,3 +354,43 @@ class LiketoBalloon(models.Model):
         ordering = ["id"]
         verbose_name = _("Лайк за воздушный шар ")
         verbose_name_plural = _("Лайк за воздушный шар")
+        constraints = [
+            models.UniqueConstraint(fields=['balloon', 'author'], name='unique_balloon_like_per_author'),
+        ]
+
+
+class ImageProcessingTask(models.Model):
+    """
+    Durable queue of uploaded images waiting for apps.flowers.image_queue to process them.
+    """
+    model = models.CharField(max_length=100, verbose_name="Модель")
+    object_id = models.PositiveBigIntegerField(verbose_name="ID изображения")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попытки")
+    optimized = models.BooleanField(default=False, verbose_name="Оригинал оптимизирован")
+    available_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name="Доступна с")
+    last_error = models.TextField(blank=True, default='', verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+
+    objects = models.Manager()
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name = _("Задача обработки изображения")
+        verbose_name_plural = _("Задачи обработки изображений")
+
+
+class PopularityCheckpoint(models.Model):
+    """
+    Progress of the popularity scores of one product model: when they were last decayed, the last id of
+    every event model already counted in them, and the state of the rows they were last scored from.
+    """
+    model = models.CharField(max_length=100, unique=True, verbose_name="Модель")
+    decayed_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата пересчёта")
+    last_ids = models.JSONField(default=dict, blank=True, verbose_name="Последние учтённые события")
+    fingerprints = models.JSONField(default=dict, blank=True, verbose_name="Состояние учтённых строк")
+
+    objects = models.Manager()
+
+    class Meta:
+        verbose_name = _("Пересчёт популярности")
+        verbose_name_plural = _("Пересчёт популярности")
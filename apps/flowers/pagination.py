@@ -1,7 +1,156 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class RecentlyViewedPagination(PageNumberPagination):
+    """
+    Pages of the recently viewed list, which is a bounded slice in view order, so it has no cursor mode.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
 
 
 class FlowerPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
+
+    mode_query_param = 'pagination'
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    # Orderings supported by the cursor mode, mapped to the model field of their keyset
+    cursor_orderings = {'created': 'id', 'price': 'price', 'rating': 'rating_average', 'popularity': 'popularity'}
+    default_cursor_ordering = 'created'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = request.query_params.get(self.mode_query_param) == 'cursor'
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_queryset_by_cursor(queryset, request)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.next_link,
+            'previous': self.previous_link,
+            'results': data,
+        })
+
+    def paginate_queryset_by_cursor(self, queryset, request):
+        """
+        Keyset pagination over ``(sort_key, id)``.
+
+        Instead of counting rows and skipping an OFFSET, every page filters on the sort key of the
+        last row seen, so deep pages cost the same as the first one.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        name, descending = self.get_cursor_ordering(request)
+        self.field = queryset.model._meta.get_field(self.cursor_orderings[name])
+        self.descending = descending
+
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor['reverse']
+        if cursor is not None:
+            lookup = self.keyset_before if reverse else self.keyset_after
+            queryset = queryset.filter(lookup(cursor['value'], cursor['id']))
+
+        rows = list(queryset.order_by(*self.keyset_ordering(reverse))[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, cursor is not None
+        self.next_link = self.encode_cursor(rows[-1], reverse=False) if rows and has_next else None
+        self.previous_link = self.encode_cursor(rows[0], reverse=True) if rows and has_previous else None
+        return rows
+
+    def get_cursor_ordering(self, request):
+        """
+        Return the requested cursor ordering name and whether it is descending, or the default one.
+        """
+        for name in (request.query_params.get(self.ordering_query_param, '').split(',')[0].strip(),
+                     self.default_cursor_ordering):
+            if name.lstrip('-') in self.cursor_orderings:
+                return name.lstrip('-'), name.startswith('-')
+
+    def keyset_ordering(self, reverse):
+        # NULL sort keys come last, so they come first when walking backwards
+        nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+        if self.descending != reverse:
+            return F(self.field.name).desc(**nulls), '-id'
+        return F(self.field.name).asc(**nulls), 'id'
+
+    def keyset_after(self, value, pk):
+        """
+        Rows that come after ``(value, pk)`` in the requested ordering, where NULL sort keys come last.
+        """
+        beyond = 'lt' if self.descending else 'gt'
+        name = self.field.name
+        if value is None:
+            return Q(**{f'{name}__isnull': True, f'id__{beyond}': pk})
+        after = Q(**{f'{name}__{beyond}': value}) | Q(**{name: value, f'id__{beyond}': pk})
+        if self.field.null:
+            after |= Q(**{f'{name}__isnull': True})
+        return after
+
+    def keyset_before(self, value, pk):
+        before = 'gt' if self.descending else 'lt'
+        name = self.field.name
+        if value is None:
+            return Q(**{f'{name}__isnull': False}) | Q(**{f'{name}__isnull': True, f'id__{before}': pk})
+        return Q(**{f'{name}__{before}': value}) | Q(**{name: value, f'id__{before}': pk})
+
+    def encode_cursor(self, row, reverse):
+        # Rows are model instances, or dicts when the page was read with values()
+        if isinstance(row, dict):
+            value, pk = row[self.field.attname], row['id']
+        else:
+            value, pk = getattr(row, self.field.attname), row.id
+        payload = {
+            'value': None if value is None else str(value),
+            'id': pk,
+            'reverse': reverse,
+        }
+        token = urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(urlsafe_b64decode(token.encode()))
+            value = payload['value']
+            return {
+                'value': None if value is None else self.field.to_python(value),
+                'id': int(payload['id']),
+                'reverse': bool(payload['reverse']),
+            }
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class ReviewPagination(FlowerPagination):
+    """
+    Reviews are always paged by cursor, newest first unless ``?ordering=`` asks for another order.
+    """
+    cursor_orderings = {'created': 'created_at', 'rating': 'rating'}
+    default_cursor_ordering = '-created'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = True
+        return self.paginate_queryset_by_cursor(queryset, request)
@@ -0,0 +1,214 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    Case, Count, DateTimeField, F, FloatField, Max, OuterRef, Q, Subquery, Sum, Value, When
+)
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from apps.flowers.caching import bump_catalog_version_on_commit, bump_model_version_on_commit
+from apps.flowers.fragments import bump_fragment_versions_on_commit
+from apps.flowers.models import Balloon, Flower, LiketoBalloon, LiketoFlower, PopularityCheckpoint, ViewUsertoFlower
+from apps.order.models import OrderFlowers
+
+# Product model -> the append-only event models it is scored from, each event counted once when it comes in:
+# (event model, product foreign key attname, POPULARITY_WEIGHTS key). Their part of the score is kept in
+# ``event_popularity``.
+POPULARITY_EVENT_SOURCES = {
+    Flower: (
+        (OrderFlowers, 'flower_id', 'order'),
+    ),
+}
+# Product model -> the models whose current rows are scored again whenever they change, as likes are deleted
+# and a repeat view moves the ``viewed_at`` of its row: (model, product foreign key attname, date field,
+# POPULARITY_WEIGHTS key)
+POPULARITY_STATE_SOURCES = {
+    Flower: (
+        (ViewUsertoFlower, 'flower_id', 'viewed_at', 'view'),
+        (LiketoFlower, 'flower_id', 'created_at', 'like'),
+    ),
+    Balloon: (
+        (LiketoBalloon, 'balloon_id', 'created_at', 'like'),
+    ),
+}
+POPULARITY_MODELS = tuple(POPULARITY_STATE_SOURCES)
+# Rows older than this many half-lives weigh less than 0.1% of a new one and are not scored
+HORIZON_HALF_LIVES = 10
+
+
+def decay_factor(days):
+    return 0.5 ** (max(days, 0) / settings.POPULARITY_HALF_LIFE_DAYS)
+
+
+def trending_cache_key(model):
+    return f'trending:{model._meta.label_lower}'
+
+
+def decayed_weight(weight, days, today, default):
+    """
+    The ``weight`` of a row, decayed from its ``day`` to ``today``, as a CASE over the ``days`` the rows span.
+    """
+    return Case(
+        *[When(day=day, then=Value(weight * decay_factor((today - day).days))) for day in days],
+        default=Value(default), output_field=FloatField(),
+    )
+
+
+def add_event_scores(model, last_ids, today):
+    """
+    Add the decayed weights of the append-only events newer than ``last_ids`` to the scores of their
+    products, with one UPDATE per event model that sums them per product in a correlated subquery.
+    Returns the number of events counted and the new last ids.
+    """
+    counted = 0
+    new_last_ids = dict(last_ids)
+    for source, attname, kind in POPULARITY_EVENT_SOURCES.get(model, ()):
+        label = source._meta.label_lower
+        last_id = last_ids.get(label, 0)
+        # Events added while this runs are past max_id and left to the next run
+        new_events = source.objects.filter(id__gt=last_id).aggregate(max_id=Max('id'), count=Count('id'))
+        if new_events['max_id'] is None:
+            continue
+        events = source.objects.filter(
+            id__gt=last_id, id__lte=new_events['max_id'], **{f'{attname}__isnull': False}
+        ).annotate(day=F('created_at')).order_by()
+        weight = settings.POPULARITY_WEIGHTS[kind]
+        days = events.exclude(day=None).values_list('day', flat=True).distinct()
+        event_score = decayed_weight(weight, days, today, default=float(weight))
+        scores = events.filter(**{attname: OuterRef('pk')}).values(attname).annotate(score=Sum(event_score))
+        delta = Coalesce(Subquery(scores.values('score')), Value(0.0))
+        model.objects.filter(pk__in=events.values(attname)).update(
+            event_popularity=F('event_popularity') + delta, popularity=F('popularity') + delta
+        )
+        counted += new_events['count']
+        new_last_ids[label] = new_events['max_id']
+    return counted, new_last_ids
+
+
+def state_rows(source, attname, date_field, today):
+    """
+    The rows of a state source within the horizon, or without a date, annotated with their day.
+    """
+    since = today - timedelta(days=HORIZON_HALF_LIVES * settings.POPULARITY_HALF_LIFE_DAYS)
+    is_datetime = isinstance(source._meta.get_field(date_field), DateTimeField)
+    return source.objects.annotate(day=TruncDate(date_field) if is_datetime else F(date_field)).filter(
+        Q(day__gte=since) | Q(day=None), **{f'{attname}__isnull': False}
+    ).order_by()
+
+
+def state_fingerprints(model, today):
+    """
+    What the state sources of ``model`` looked like: a like or a compaction changes the count or the last id
+    of its model, and a repeat view its latest date. Includes the day, as the scores decay by whole days.
+    """
+    fingerprints = {'day': today.isoformat()}
+    for source, attname, date_field, kind in POPULARITY_STATE_SOURCES[model]:
+        state = source.objects.aggregate(count=Count('id'), max_id=Max('id'), latest=Max(date_field))
+        fingerprints[source._meta.label_lower] = [state['count'], state['max_id'], str(state['latest'])]
+    return fingerprints
+
+
+def score_state(model, today):
+    """
+    Set the scores of ``model`` to their event part plus the decayed weights of the current rows of its state
+    sources, summed per product by one correlated subquery per source. Only products with rows within the
+    horizon, or with a state part to drop, are written. Returns the number of rows scored.
+    """
+    base = F('event_popularity') if model in POPULARITY_EVENT_SOURCES else Value(0.0)
+    score = base
+    scored = 0
+    products = Q(pk__in=[])
+    for source, attname, date_field, kind in POPULARITY_STATE_SOURCES[model]:
+        weight = settings.POPULARITY_WEIGHTS[kind]
+        rows = state_rows(source, attname, date_field, today)
+        days = rows.exclude(day=None).values_list('day', flat=True).distinct()
+        row_score = decayed_weight(weight, days, today, default=float(weight))
+        scores = rows.filter(**{attname: OuterRef('pk')}).values(attname).annotate(score=Sum(row_score))
+        score = score + Coalesce(Subquery(scores.values('score')), Value(0.0))
+        products |= Q(pk__in=rows.values(attname))
+        scored += rows.count()
+    model.objects.filter(products | ~Q(popularity=base)).update(popularity=score)
+    return scored
+
+
+def update_popularity(model, rebuild=False, now=None):
+    """
+    Bring the popularity scores of ``model`` up to date.
+
+    A score is the sum of the POPULARITY_WEIGHTS of the product's views, likes and orders, each halved every
+    POPULARITY_HALF_LIFE_DAYS. Orders are never removed: a run decays their part of the scores by the time
+    since the previous run with one UPDATE and adds the orders recorded since then. Likes and views are scored
+    from their current rows instead, again whenever those changed or the day did, so an unlike takes its like
+    back, a repeat view refreshes its weight and one user counts once per product. ``rebuild`` starts over
+    from every order.
+
+    The POPULAR_PRODUCTS_COUNT best scored products get ``is_popular``, and the TRENDING_SIZE best ids are
+    cached for the trending endpoint. The catalog caches are only invalidated when events were counted,
+    rows changed or flags changed. Returns the number of events and rows counted.
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    scored_fields = ['popularity', 'event_popularity'] if model in POPULARITY_EVENT_SOURCES else ['popularity']
+    with transaction.atomic():
+        checkpoint, _ = PopularityCheckpoint.objects.select_for_update().get_or_create(
+            model=model._meta.label_lower
+        )
+        if rebuild:
+            model.objects.update(**{name: 0 for name in scored_fields})
+            checkpoint.last_ids = checkpoint.fingerprints = {}
+        elif checkpoint.decayed_at is not None and model in POPULARITY_EVENT_SOURCES:
+            # Only the event part decays here, the state part is scored again by the day
+            factor = decay_factor((now - checkpoint.decayed_at).total_seconds() / (60 * 60 * 24))
+            model.objects.filter(event_popularity__gt=0).update(
+                event_popularity=F('event_popularity') * factor,
+                popularity=F('popularity') - F('event_popularity') + F('event_popularity') * factor,
+            )
+
+        counted, checkpoint.last_ids = add_event_scores(model, checkpoint.last_ids, today)
+        fingerprints = state_fingerprints(model, today)
+        rescored = fingerprints != checkpoint.fingerprints
+        if rescored:
+            counted += score_state(model, today)
+            checkpoint.fingerprints = fingerprints
+        checkpoint.decayed_at = now
+        checkpoint.save()
+
+        ranking = list(
+            model.objects.filter(popularity__gt=0).order_by('-popularity', 'id')
+            .values_list('id', flat=True)[:max(settings.TRENDING_SIZE, settings.POPULAR_PRODUCTS_COUNT)]
+        )
+        popular_ids = ranking[:settings.POPULAR_PRODUCTS_COUNT]
+        changed_ids = [
+            *model.objects.filter(is_popular=True).exclude(id__in=popular_ids).values_list('id', flat=True),
+            *model.objects.filter(id__in=popular_ids).exclude(is_popular=True).values_list('id', flat=True),
+        ]
+        if changed_ids:
+            model.objects.filter(id__in=changed_ids).update(is_popular=Case(
+                When(id__in=popular_ids, then=Value(True)), default=Value(False)
+            ))
+            bump_fragment_versions_on_commit(model, changed_ids)
+        # The scores order the catalog lists. Decaying them all by the same factor keeps that order, so only
+        # new events, changed rows or flags can change it.
+        if counted or rescored or changed_ids:
+            bump_catalog_version_on_commit()
+            bump_model_version_on_commit(model)
+        transaction.on_commit(lambda: cache.set(trending_cache_key(model), ranking[:settings.TRENDING_SIZE], None))
+    return counted
+
+
+def get_trending_ids(model, limit):
+    """
+    Return the ids of the ``limit`` best scored products of ``model``, from the ranking cached by the last
+    update_popularity run.
+    """
+    ranking = cache.get(trending_cache_key(model))
+    if ranking is None:
+        ranking = list(
+            model.objects.filter(popularity__gt=0).order_by('-popularity', 'id')
+            .values_list('id', flat=True)[:settings.TRENDING_SIZE]
+        )
+        cache.set(trending_cache_key(model), ranking, None)
+    return ranking[:limit]
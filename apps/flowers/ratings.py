@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, OuterRef, Prefetch, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+from apps.flowers.models import Flower, Review
+
+RATING_VALUES = range(1, 6)
+# Attribute the latest reviews of each flower are prefetched to
+LATEST_REVIEWS_ATTR = 'latest_reviews'
+
+
+def rating_average_expression():
+    return Case(
+        When(rating_count=0, then=Value(0.0)),
+        default=Cast('rating_sum', FloatField()) / F('rating_count'),
+        output_field=FloatField(),
+    )
+
+
+def rating_histogram(flower):
+    return {str(value): getattr(flower, f'rating_{value}') for value in RATING_VALUES}
+
+
+def latest_reviews(flower):
+    return flower.flower_review.order_by('-created_at', '-id')[:settings.REVIEW_EMBED_LIMIT]
+
+
+def latest_reviews_prefetch():
+    """
+    Prefetch only the REVIEW_EMBED_LIMIT newest reviews of every flower, with a window function over
+    the ``(flower, created_at)`` index instead of loading all of them.
+    """
+    return Prefetch(
+        'flower_review',
+        queryset=Review.objects.order_by('-created_at', '-id')[:settings.REVIEW_EMBED_LIMIT],
+        to_attr=LATEST_REVIEWS_ATTR,
+    )
+
+
+def apply_rating_change(flower_id, added=None, removed=None):
+    """
+    Record on one flower that a review rated ``added`` appeared and/or one rated ``removed`` went away,
+    shifting its stored sum, count and star histogram.
+
+    The counters are updated with F() expressions, so concurrent reviews never overwrite each other.
+    """
+    if flower_id is None or added == removed:
+        return
+
+    changes = {}
+    for rating, delta in ((added, 1), (removed, -1)):
+        if rating is not None:
+            changes['rating_sum'] = changes.get('rating_sum', 0) + rating * delta
+            changes['rating_count'] = changes.get('rating_count', 0) + delta
+            changes[f'rating_{rating}'] = delta
+    flowers = Flower.objects.filter(pk=flower_id)
+    with transaction.atomic():
+        flowers.update(**{name: F(name) + delta for name, delta in changes.items()})
+        flowers.update(rating_average=rating_average_expression())
+
+
+def rebuild_flower_ratings():
+    """
+    Recompute the stored rating aggregates of every flower from its reviews.
+    """
+    reviews = Review.objects.filter(flower=OuterRef('pk')).order_by().values('flower')
+    histogram = {
+        f'rating_{value}': Coalesce(
+            Subquery(reviews.filter(rating=value).annotate(total=Count('pk')).values('total')), 0
+        )
+        for value in RATING_VALUES
+    }
+    with transaction.atomic():
+        updated = Flower.objects.update(
+            rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+            rating_count=Coalesce(Subquery(reviews.annotate(total=Count('pk')).values('total')), 0),
+            **histogram,
+        )
+        Flower.objects.update(rating_average=rating_average_expression())
+    return updated
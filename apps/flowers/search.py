@@ -0,0 +1,98 @@
+import re
+
+from django.db import connection
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+from apps.flowers.models import Flower
+
+SEARCH_TABLE = 'flowers_flower_search'
+SEARCH_FIELDS = ('name', 'description', 'sort', 'plantation')
+SEARCH_CHUNK_SIZE = 500
+
+
+def is_search_supported():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def build_documents(flower_ids):
+    """
+    Join the searchable translated fields of every language into one document per flower.
+    """
+    documents = {flower_id: [] for flower_id in flower_ids}
+    translations = Flower._parler_meta.root_model.objects.filter(master_id__in=flower_ids).order_by('id')
+    for master_id, *values in translations.values_list('master_id', *SEARCH_FIELDS):
+        documents[master_id].extend(value for value in values if value)
+    return {flower_id: ' '.join(values) for flower_id, values in documents.items()}
+
+
+def index_flowers(flower_ids):
+    if not flower_ids or not is_search_supported():
+        return
+
+    documents = build_documents(flower_ids)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (flower_id, document) VALUES (%s, to_tsvector('simple', %s)) "
+                f"ON CONFLICT (flower_id) DO UPDATE SET document = EXCLUDED.document",
+                list(documents.items()),
+            )
+        else:
+            remove_flowers(flower_ids)
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, document) VALUES (%s, %s)", list(documents.items())
+            )
+
+
+def remove_flowers(flower_ids):
+    if not flower_ids or not is_search_supported():
+        return
+
+    column = 'flower_id' if connection.vendor == 'postgresql' else 'rowid'
+    placeholders = ', '.join(['%s'] * len(flower_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE {column} IN ({placeholders})", list(flower_ids))
+
+
+def rebuild_search_index():
+    flower_ids = list(Flower.objects.order_by('id').values_list('id', flat=True))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+    for start in range(0, len(flower_ids), SEARCH_CHUNK_SIZE):
+        index_flowers(flower_ids[start:start + SEARCH_CHUNK_SIZE])
+    return len(flower_ids)
+
+
+def search_flowers(queryset, text):
+    """
+    Filter ``queryset`` down to flowers matching every word of ``text`` as a prefix and
+    order them by relevance.
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return queryset
+    if not is_search_supported():
+        for word in words:
+            queryset = queryset.filter(translations__name__icontains=word)
+        return queryset.distinct()
+
+    flower_column = f'{connection.ops.quote_name(Flower._meta.db_table)}.{connection.ops.quote_name("id")}'
+    if connection.vendor == 'postgresql':
+        query = ' & '.join(f'{word}:*' for word in words)
+        matches = f"SELECT flower_id FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('simple', %s)"
+        rank = (
+            f"SELECT ts_rank(document, to_tsquery('simple', %s)) FROM {SEARCH_TABLE} "
+            f"WHERE flower_id = {flower_column}"
+        )
+    else:
+        query = ' '.join(f'"{word}"*' for word in words)
+        matches = f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s"
+        # bm25() is lower for better matches
+        rank = f"SELECT -bm25({SEARCH_TABLE}) FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND rowid = {flower_column}"
+
+    return queryset.filter(
+        id__in=RawSQL(matches, (query,))
+    ).annotate(
+        search_rank=RawSQL(rank, (query,), output_field=FloatField())
+    ).order_by('-search_rank', 'id')
@@ -1,28 +1,176 @@
 
-from django.db.models import Avg
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, prefetch_related_objects
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
+from django.utils.functional import cached_property
 from rest_framework import serializers
 from apps.account.serializers import CustomUserDeatilSerializer
+from apps.flowers.image_queue import enqueue_image_processing
+from apps.flowers.images import srcset
+from apps.flowers.languages import (
+    SCOPED_TRANSLATIONS_ATTR, get_payload_languages, pick_translation, preferred_translations,
+    scoped_translations_prefetch
+)
+from apps.flowers.likes import get_liked_flower_ids, get_liked_balloon_ids, like_product
+from apps.flowers.ratings import LATEST_REVIEWS_ATTR, latest_reviews, latest_reviews_prefetch, rating_histogram
 from apps.flowers.models import (
     SizesofFlower, ImagesofFlower, QuantityofFlower,
-    Flower, TopLevelCategory, Category, Review, CompoundyofFlower, PackageFlower, CountryFlower,
-    BannerCarousel, LiketoFlower, ViewUsertoFlower, Balloon, ImagesofBalloon, LiketoBalloon
+    Flower, Review, PackageFlower, CountryFlower,
+    BannerCarousel, LiketoFlower, ViewUsertoFlower, Balloon, ImagesofBalloon, LiketoBalloon, ImageStatus
 )
 from parler_rest.serializers import TranslatableModelSerializer
 from parler_rest.fields import TranslatedFieldsField
 
 
-class TopLevelCategoryWithSubCategoriesSerializer(TranslatableModelSerializer):
-    translations = TranslatedFieldsField(shared_model=TopLevelCategory)
+def get_query_param_names(request, name):
+    return {part.strip() for part in request.query_params.get(name, '').split(',') if part.strip()}
 
-    class Meta:
-        model = TopLevelCategory
-        fields = ['id', 'translations', 'image']
 
-    def get_text(self, instance):
+class PrefetchListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        instances = list(data.all() if hasattr(data, 'all') else data)
+        self.child.prefetch(instances)
+        return super().to_representation(instances)
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    The stored image variants as one ``srcset`` string per format.
+    """
+
+    def to_representation(self, value):
+        return srcset(value, self.context.get('request'))
+
+
+class LanguageScopedTranslatedFieldsField(TranslatedFieldsField):
+    """
+    ``TranslatedFieldsField`` that only serializes the translation of the payload language when the
+    request asked for one.
+    """
+
+    def get_attribute(self, instance):
+        languages = self.parent.payload_languages
+        if not languages:
+            return super().get_attribute(instance)
+        translations = getattr(instance, SCOPED_TRANSLATIONS_ATTR, None)
+        if translations is None:
+            translations = getattr(instance, self.source).filter(language_code__in=languages)
+        return pick_translation(translations, languages)
+
+    def to_representation(self, value):
+        if not self.parent.payload_languages:
+            return super().to_representation(value)
+        return self.serializer_class(context=self.context).to_representation(value)
+
+
+class LanguageScopedSerializerMixin:
+    """
+    Serialize ``translations`` with every language by default, or, when the request opts in with
+    ``?lang=``, as flat fields in a single language picked with the PARLER_LANGUAGES fallbacks.
+    """
+    # Serializer field -> the lookups to prefetch for it, or callables building them, skipped when the
+    # field is left out
+    prefetch_lookups = {'translations': ('translations',)}
+
+    @property
+    def payload_languages(self):
+        if 'payload_languages' not in self.context:
+            self.context['payload_languages'] = get_payload_languages(self.context.get('request'))
+        return self.context['payload_languages']
+
+    @property
+    def translated_field_names(self):
+        return self.Meta.model._parler_meta.get_translated_fields()
+
+    def get_prefetch_lookups(self):
+        languages = self.payload_languages
+        lookups = [
+            lookup() if callable(lookup) else lookup
+            for name, field_lookups in self.prefetch_lookups.items() if name in self.fields
+            for lookup in field_lookups
+        ]
+        if not languages:
+            return lookups
+        return [
+            scoped_translations_prefetch(self.Meta.model, lookup, languages)
+            if isinstance(lookup, str) and lookup.split('__')[-1] == 'translations' else lookup
+            for lookup in lookups
+        ]
+
+    def prefetch(self, instances):
+        """
+        Load every related row needed by this serializer for all ``instances`` at once,
+        so a page costs a fixed number of queries instead of several per object.
+        """
+        prefetch_related_objects(instances, *self.get_prefetch_lookups())
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if 'translations' not in data:
+            return data
+        names = self.translated_field_names
+        if not self.payload_languages:
+            if data['translations'] and len(names) < len(self.Meta.model._parler_meta.get_translated_fields()):
+                data['translations'] = {
+                    language: {name: fields.get(name) for name in names}
+                    for language, fields in data['translations'].items()
+                }
+            return data
+        translated = data['translations'] or {}
+        flat = {}
+        for name, value in data.items():
+            if name == 'translations':
+                flat.update((translated_name, translated.get(translated_name)) for translated_name in names)
+            else:
+                flat[name] = value
+        return flat
+
+
+class SparseFieldsetMixin:
+    """
+    Let clients narrow the top-level serializer with ``?fields=`` (keep only these) and ``?omit=``
+    (drop these). Translated field names narrow ``translations``, or the flat fields of ``?lang=``.
+    ``id`` is always kept.
+
+    Left out fields are removed before serialization, so their method fields, nested serializers and
+    prefetches never run.
+    """
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+    required_fields = ('id',)
+
+    @cached_property
+    def sparse_fieldset(self):
+        parent = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        request = self.context.get('request')
+        if parent is not None or request is None:
+            return set(), set()
+        return (
+            get_query_param_names(request, self.fields_query_param),
+            get_query_param_names(request, self.omit_query_param),
+        )
+
+    def is_selected(self, name):
+        requested, omitted = self.sparse_fieldset
+        return name in self.required_fields or (not requested or name in requested) and name not in omitted
+
+    @property
+    def translated_field_names(self):
+        requested, omitted = self.sparse_fieldset
+        return [
+            name for name in super().translated_field_names
+            if (self.is_selected(name) or 'translations' in requested) and name not in omitted
+        ]
+
+    def get_fields(self):
+        fields = super().get_fields()
+        _, omitted = self.sparse_fieldset
         return {
-            "en": instance.name_en,
-            "ru": instance.name_ru,
+            name: field for name, field in fields.items()
+            if self.is_selected(name)
+            or (name == 'translations' and name not in omitted and self.translated_field_names)
         }
 
 
@@ -34,9 +182,10 @@ class ReviewSerializer(serializers.ModelSerializer):
         fields = ['id', 'full_name', 'rating', 'flower', 'content', 'image', 'created_at']
 
     def create(self, validated_data):
-        review = Review.objects.create(
-            **validated_data
-        )
+        with transaction.atomic():
+            review = Review.objects.create(
+                **validated_data
+            )
         return review
 
 
@@ -51,25 +200,18 @@ class LiketoFlowerSerializer(serializers.ModelSerializer):
     class Meta:
         model = LiketoFlower
         fields = ['id', 'flower']
+        extra_kwargs = {'flower': {'required': True, 'allow_null': False}}
 
     def create(self, validated_data):
-        user = self.context.get('request').user
-        flower = validated_data.get('flower')
+        return like_product(LiketoFlower, 'flower', validated_data['flower'], self.context.get('request').user)
 
-        if LiketoFlower.objects.filter(flower=flower, author=user).exists():
-            raise serializers.ValidationError({'error': "You have already liked this flower"})
 
-        like_create = LiketoFlower.objects.create(
-            **validated_data, author=user
-        )
-        return like_create
-
-
-class PackageFlowerSerializer(TranslatableModelSerializer):
-    translations = TranslatedFieldsField(shared_model=PackageFlower)
+class PackageFlowerSerializer(LanguageScopedSerializerMixin, TranslatableModelSerializer):
+    translations = LanguageScopedTranslatedFieldsField(shared_model=PackageFlower)
 
     class Meta:
         model = PackageFlower
+        list_serializer_class = PrefetchListSerializer
         fields = ['id', 'translations']
 
     def get_text(self, instance):
@@ -79,12 +221,14 @@ class PackageFlowerSerializer(TranslatableModelSerializer):
         }
 
 
-class BannerCarouselSerializer(TranslatableModelSerializer):
-    translations = TranslatedFieldsField(shared_model=BannerCarousel)
+class BannerCarouselSerializer(LanguageScopedSerializerMixin, TranslatableModelSerializer):
+    translations = LanguageScopedTranslatedFieldsField(shared_model=BannerCarousel)
+    variants = ImageVariantsField()
 
     class Meta:
         model = BannerCarousel
-        fields = ['id', 'translations', 'image']
+        list_serializer_class = PrefetchListSerializer
+        fields = ['id', 'translations', 'image', 'status', 'width', 'height', 'variants']
 
     def get_text(self, instance):
         return {
@@ -93,11 +237,12 @@ class BannerCarouselSerializer(TranslatableModelSerializer):
         }
 
 
-class CountryFlowerSerializer(TranslatableModelSerializer):
-    translations = TranslatedFieldsField(shared_model=CountryFlower)
+class CountryFlowerSerializer(LanguageScopedSerializerMixin, TranslatableModelSerializer):
+    translations = LanguageScopedTranslatedFieldsField(shared_model=CountryFlower)
 
     class Meta:
         model = CountryFlower
+        list_serializer_class = PrefetchListSerializer
         fields = ['id', 'translations', 'image']
 
     def get_text(self, instance):
@@ -126,9 +271,11 @@ class CompoundyofFlowerSerializer(serializers.ModelSerializer):
 
 
 class ImagesofFlowerSerializer(serializers.ModelSerializer):
+    variants = ImageVariantsField()
+
     class Meta:
         model = ImagesofFlower
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'status', 'width', 'height', 'variants']
 
 
 class FlowerListSerializer(serializers.ModelSerializer):
@@ -156,11 +303,15 @@ class FlowerListSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         uploaded_images = validated_data.pop("uploaded_images")
         user = self.context.get('request').user
-        flower = Flower.objects.create(
-            **validated_data, author=user
-        )
-        for image in uploaded_images:
-            ImagesofFlower.objects.create(image=image, flower=flower)
+        with transaction.atomic():
+            flower = Flower.objects.create(
+                **validated_data, author=user
+            )
+            # Only the uploads are written here; resizing and optimizing them is left to the image queue
+            images = ImagesofFlower.objects.bulk_create([
+                ImagesofFlower(image=image, flower=flower, status=ImageStatus.PENDING) for image in uploaded_images
+            ])
+            enqueue_image_processing(images)
 
         return flower
 
@@ -172,8 +323,8 @@ class FlowerListSerializer(serializers.ModelSerializer):
         return instance
 
 
-class FlowerDetailSerializer(TranslatableModelSerializer):
-    translations = TranslatedFieldsField(shared_model=Flower)
+class FlowerDetailSerializer(SparseFieldsetMixin, LanguageScopedSerializerMixin, TranslatableModelSerializer):
+    translations = LanguageScopedTranslatedFieldsField(shared_model=Flower)
     images = ImagesofFlowerSerializer(many=True, read_only=True)
     size = serializers.SerializerMethodField()
     quantity_of_flower = serializers.SerializerMethodField()
@@ -184,63 +335,127 @@ class FlowerDetailSerializer(TranslatableModelSerializer):
     author = CustomUserDeatilSerializer(read_only=True)
     like = serializers.SerializerMethodField()
     review_count = serializers.SerializerMethodField()
+    rating_histogram = serializers.SerializerMethodField()
+
+    prefetch_lookups = {
+        'translations': ('translations',),
+        'images': ('images',),
+        'size': ('flower_size',),
+        'quantity_of_flower': ('flower_quantity',),
+        'compound': ('flower_compound',),
+        'review': (latest_reviews_prefetch,),
+        'country': ('country__translations',),
+        'author': ('author__groups',),
+    }
 
     class Meta:
         model = Flower
+        list_serializer_class = PrefetchListSerializer
         fields = [
             'id', 'translations', 'plant_length', 'price_per_box',
             'head_outer_diameter', 'price', 'discount_price', 'cashback',
             'images', 'size', 'category', 'author', 'in_stock',
             'package', 'quantity', 'quantity_of_flower', 'compound', 'average_rating',
             'review', 'is_popular', 'showcase_online', 'stock_number', 'is_new',
-            'country', 'volume', 'stem_height', 'like', 'review_count'
+            'country', 'volume', 'stem_height', 'like', 'review_count', 'rating_histogram'
         ]
 
+    def to_representation(self, instance):
+        self.prefetch([instance])
+        return super().to_representation(instance)
+
     def get_average_rating(self, obj):
-        reviews = obj.flower_review.all()
-        if reviews.exists():
-            return reviews.aggregate(Avg('rating'))['rating__avg']
+        if obj.rating_count:
+            return obj.rating_sum / obj.rating_count
         return None
 
     def get_size(self, obj):
-        queryset = SizesofFlower.objects.select_related('flower').filter(
-            flower=obj.id
+        serializer = SizesofFlowerSerializer(
+            obj.flower_size.all(), many=True, context={"request": self.context.get('request')}
         )
-        serializer = SizesofFlowerSerializer(queryset, many=True, context={"request": self.context.get('request')})
         return serializer.data
 
     def get_quantity_of_flower(self, obj):
-        queryset = QuantityofFlower.objects.select_related('flower').filter(
-            flower=obj.id
+        serializer = QuantityofFlowerSerializer(
+            obj.flower_quantity.all(), many=True, context={"request": self.context.get('request')}
         )
-        serializer = QuantityofFlowerSerializer(queryset, many=True, context={"request": self.context.get('request')})
         return serializer.data
 
     def get_compound(self, obj):
-        queryset = CompoundyofFlower.objects.select_related('flower').filter(
-            flower=obj.id
+        serializer = CompoundyofFlowerSerializer(
+            obj.flower_compound.all(), many=True, context={"request": self.context.get('request')}
         )
-        serializer = CompoundyofFlowerSerializer(queryset, many=True, context={"request": self.context.get('request')})
         return serializer.data
 
     def get_review(self, obj):
-        queryset = Review.objects.select_related('flower').filter(
-            flower=obj.id
-        )
-        serializer = ReviewListSerializer(queryset, many=True, context={"request": self.context.get('request')})
+        # Only the newest reviews are embedded, the rest are paged from reviews/?flower=
+        reviews = getattr(obj, LATEST_REVIEWS_ATTR, None)
+        if reviews is None:
+            reviews = latest_reviews(obj)
+        serializer = ReviewListSerializer(reviews, many=True, context={"request": self.context.get('request')})
         return serializer.data
 
     def get_like(self, obj):
-        request = self.context.get('request')
-        if request and hasattr(request, 'user') and request.user.is_authenticated:
-            return LiketoFlower.objects.filter(flower=obj.id, author=request.user).exists()
-        return False
+        if 'liked_flower_ids' not in self.context:
+            request = self.context.get('request')
+            self.context['liked_flower_ids'] = get_liked_flower_ids(getattr(request, 'user', None))
+        return obj.id in self.context['liked_flower_ids']
 
     def get_review_count(self, obj):
-        queryset = Review.objects.select_related('flower').filter(
-            flower=obj.id
+        return obj.rating_count
+
+    def get_rating_histogram(self, obj):
+        return rating_histogram(obj)
+
+
+class FlowerCardSerializer(serializers.Serializer):
+    """
+    Compact flower card for listings, serialized from the plain rows of ``card_rows()`` rather than
+    from model instances and parler translations.
+    """
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    discount_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    effective_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    image = serializers.SerializerMethodField()
+    average_rating = serializers.SerializerMethodField()
+    review_count = serializers.IntegerField(source='rating_count')
+    in_stock = serializers.BooleanField()
+    like = serializers.SerializerMethodField()
+
+    @staticmethod
+    def card_rows(queryset, languages):
+        """
+        Narrow a flower queryset to the values of a card, with the name in the first of ``languages``
+        available and the first image, so a page is read with a single query.
+        """
+        Translation = Flower._parler_meta.root_model
+        images = ImagesofFlower.objects.filter(flower=OuterRef('pk')).order_by('id')
+        return queryset.annotate(
+            name=Subquery(preferred_translations(Translation, OuterRef('pk'), languages).values('name')[:1]),
+            image=Subquery(images.values('image')[:1]),
+            effective_price=Coalesce('discount_price', 'price'),
+        ).values(
+            'id', 'name', 'price', 'discount_price', 'effective_price', 'image', 'rating_average', 'rating_count',
+            'in_stock',
         )
-        return queryset.count()
+
+    def get_average_rating(self, row):
+        return row['rating_average'] if row['rating_count'] else None
+
+    def get_image(self, row):
+        if not row['image']:
+            return None
+        url = ImagesofFlower._meta.get_field('image').storage.url(row['image'])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def get_like(self, row):
+        if 'liked_flower_ids' not in self.context:
+            request = self.context.get('request')
+            self.context['liked_flower_ids'] = get_liked_flower_ids(getattr(request, 'user', None))
+        return row['id'] in self.context['liked_flower_ids']
 
 
 class ViewUsertoFlowerSerializer(serializers.ModelSerializer):
@@ -248,22 +463,30 @@ class ViewUsertoFlowerSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ViewUsertoFlower
-        fields = ['id', 'flower']
+        fields = ['id', 'flower', 'viewed_at']
 
 
 class ImagesofBalloonSerializer(serializers.ModelSerializer):
+    variants = ImageVariantsField()
+
     class Meta:
         model = ImagesofBalloon
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'status', 'width', 'height', 'variants']
 
 
-class BalloonSerializer(TranslatableModelSerializer):
+class BalloonSerializer(SparseFieldsetMixin, LanguageScopedSerializerMixin, TranslatableModelSerializer):
     images_balloon = ImagesofBalloonSerializer(read_only=True, many=True)
-    translations = TranslatedFieldsField(shared_model=Balloon)
+    translations = LanguageScopedTranslatedFieldsField(shared_model=Balloon)
     like = serializers.SerializerMethodField()
 
+    prefetch_lookups = {
+        'translations': ('translations',),
+        'images_balloon': ('images_balloon',),
+    }
+
     class Meta:
         model = Balloon
+        list_serializer_class = PrefetchListSerializer
         fields = ['id', 'translations', 'images_balloon', 'price', 'discount_price',
                   'category', 'author', 'in_stock', 'quantity', 'showcase_online',
                   'is_popular', 'is_new', 'stock_number', 'like']
@@ -275,25 +498,17 @@ class BalloonSerializer(TranslatableModelSerializer):
         }
 
     def get_like(self, obj):
-        user = self.context.get('request').user
-        if user.is_authenticated:
-            return LiketoBalloon.objects.filter(balloon=obj.id, author=user).exists()
-        return False
+        if 'liked_balloon_ids' not in self.context:
+            request = self.context.get('request')
+            self.context['liked_balloon_ids'] = get_liked_balloon_ids(getattr(request, 'user', None))
+        return obj.id in self.context['liked_balloon_ids']
 
 
 class LiketoBalloonSerializer(serializers.ModelSerializer):
     class Meta:
         model = LiketoBalloon
         fields = ['id', 'balloon']
+        extra_kwargs = {'balloon': {'required': True, 'allow_null': False}}
 
     def create(self, validated_data):
-        user = self.context.get('request').user
-        balloon = validated_data.get('balloon')
-
-        if LiketoBalloon.objects.filter(balloon=balloon, author=user).exists():
-            raise serializers.ValidationError({'error': "You have already liked this flower"})
-
-        like_create = LiketoBalloon.objects.create(
-            **validated_data, author=user
-        )
-        return like_create
+        return like_product(LiketoBalloon, 'balloon', validated_data['balloon'], self.context.get('request').user)
@@ -0,0 +1,182 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models.signals import m2m_changed, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from apps.flowers.caching import bump_catalog_version_on_commit, bump_model_version_on_commit
+from apps.flowers.categories import update_category_path
+from apps.flowers.fragments import bump_fragment_versions_on_commit
+from apps.flowers.image_queue import enqueue_image_processing
+from apps.flowers.images import IMAGE_VARIANT_MODELS, delete_variants, needs_variants
+from apps.flowers.likes import forget_liked_ids
+from apps.flowers.models import (
+    Category, TopLevelCategory, BannerCarousel, Flower, CountryFlower, PackageFlower, ImagesofFlower, SizesofFlower,
+    QuantityofFlower, CompoundyofFlower, Review, LiketoFlower, LiketoBalloon, Balloon, ImagesofBalloon, ImageStatus
+)
+from apps.flowers.ratings import apply_rating_change
+from apps.flowers.search import index_flowers, remove_flowers
+from apps.flowers.view_events import flush_view_events
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    if instance.pk and not raw:
+        instance._previous_rating = Review.objects.filter(pk=instance.pk).values_list('flower_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_review_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    previous = getattr(instance, '_previous_rating', None)
+    if previous is None:
+        apply_rating_change(instance.flower_id, added=instance.rating)
+    elif previous[0] == instance.flower_id:
+        apply_rating_change(instance.flower_id, added=instance.rating, removed=previous[1])
+    else:
+        apply_rating_change(previous[0], removed=previous[1])
+        apply_rating_change(instance.flower_id, added=instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_review_delete(sender, instance, **kwargs):
+    apply_rating_change(instance.flower_id, removed=instance.rating)
+
+
+@receiver([post_save, post_delete], sender=LiketoFlower)
+@receiver([post_save, post_delete], sender=LiketoBalloon)
+def forget_liked_ids_on_like_change(sender, instance, **kwargs):
+    forget_liked_ids(sender, instance.author_id)
+
+
+@receiver(request_finished)
+def flush_view_events_after_response(sender, **kwargs):
+    # Without the flusher thread, views are written once a response has been sent, so clients never wait
+    if not settings.VIEW_EVENT_BACKGROUND_FLUSH:
+        flush_view_events()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=TopLevelCategory)
+def update_category_path_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        update_category_path(instance)
+
+
+CATALOG_MODELS = (
+    Category, TopLevelCategory, Category._parler_meta.root_model,
+    Flower, Flower._parler_meta.root_model, CountryFlower, CountryFlower._parler_meta.root_model,
+    PackageFlower, PackageFlower._parler_meta.root_model, ImagesofFlower, SizesofFlower, QuantityofFlower, CompoundyofFlower, Review,
+)
+
+
+def bump_catalog_version_on_change(sender, **kwargs):
+    bump_catalog_version_on_commit()
+
+
+for catalog_model in CATALOG_MODELS:
+    post_save.connect(bump_catalog_version_on_change, sender=catalog_model)
+    post_delete.connect(bump_catalog_version_on_change, sender=catalog_model)
+
+# Models with their own version, the ETag and Last-Modified source of the endpoints serving them
+VERSIONED_MODELS = CATALOG_MODELS + (BannerCarousel, BannerCarousel._parler_meta.root_model)
+
+
+def bump_model_version_on_change(sender, **kwargs):
+    bump_model_version_on_commit(sender)
+
+
+for versioned_model in VERSIONED_MODELS:
+    post_save.connect(bump_model_version_on_change, sender=versioned_model)
+    post_delete.connect(bump_model_version_on_change, sender=versioned_model)
+
+
+User = get_user_model()
+
+# Model -> the model whose cached fragments it is part of, and the attribute holding that instance's id
+FRAGMENT_SOURCES = {
+    Flower: (Flower, 'pk'),
+    Flower._parler_meta.root_model: (Flower, 'master_id'),
+    ImagesofFlower: (Flower, 'flower_id'),
+    SizesofFlower: (Flower, 'flower_id'),
+    QuantityofFlower: (Flower, 'flower_id'),
+    CompoundyofFlower: (Flower, 'flower_id'),
+    Review: (Flower, 'flower_id'),
+    CountryFlower: (CountryFlower, 'pk'),
+    CountryFlower._parler_meta.root_model: (CountryFlower, 'master_id'),
+    User: (User, 'pk'),
+    Balloon: (Balloon, 'pk'),
+    Balloon._parler_meta.root_model: (Balloon, 'master_id'),
+    ImagesofBalloon: (Balloon, 'balloon_id'),
+}
+
+
+def bump_fragment_version_on_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    model, attname = FRAGMENT_SOURCES[sender]
+    pks = {getattr(instance, attname)}
+    previous = getattr(instance, '_previous_rating', None)
+    if previous is not None:
+        # A review moved to another flower changes both of them
+        pks.add(previous[0])
+    bump_fragment_versions_on_commit(model, pks)
+
+
+for fragment_model in FRAGMENT_SOURCES:
+    post_save.connect(bump_fragment_version_on_change, sender=fragment_model)
+    post_delete.connect(bump_fragment_version_on_change, sender=fragment_model)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def bump_fragment_version_on_groups_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_fragment_versions_on_commit(User, [instance.pk])
+    elif pk_set:
+        bump_fragment_versions_on_commit(User, pk_set)
+
+
+@receiver(post_save, sender=Flower)
+def index_flower_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_flowers([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Flower._parler_meta.root_model)
+def index_flower_on_translation_change(sender, instance, raw=False, **kwargs):
+    if not raw and instance.master_id:
+        index_flowers([instance.master_id])
+
+
+@receiver(post_delete, sender=Flower)
+def remove_flower_from_search(sender, instance, **kwargs):
+    remove_flowers([instance.pk])
+
+
+def mark_image_pending(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'image' not in update_fields):
+        return
+    if needs_variants(instance):
+        instance.status = ImageStatus.PENDING
+
+
+def enqueue_image_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'image' not in update_fields) or not needs_variants(instance):
+        return
+    enqueue_image_processing([instance])
+
+
+def delete_image_variants_on_delete(sender, instance, **kwargs):
+    transaction.on_commit(lambda: delete_variants(instance.variants))
+
+
+for image_model in IMAGE_VARIANT_MODELS:
+    pre_save.connect(mark_image_pending, sender=image_model)
+    post_save.connect(enqueue_image_on_save, sender=image_model)
+    post_delete.connect(delete_image_variants_on_delete, sender=image_model)
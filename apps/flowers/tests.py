@@ -1,3 +1,1420 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from apps.account.models import CustomUser
+from apps.flowers.caching import bump_catalog_version, get_cache_stats, get_catalog_version
+from apps.flowers.image_queue import run_task
+from apps.flowers.models import (
+    BannerCarousel, Category, Flower, CountryFlower, ImagesofFlower, SizesofFlower, QuantityofFlower, CompoundyofFlower, Review,
+    LiketoFlower, Balloon, LiketoBalloon, ImageStatus, ImageProcessingTask, ViewUsertoFlower, PopularityCheckpoint
+)
+from apps.flowers.popularity import update_popularity
+from apps.order.models import OrderFlowers
+from apps.flowers.view_events import flush_view_events, record_flower_view, view_events
+from config.renderers import FastJSONRenderer
+
+
+class FlowerTestMixin:
+
+    @classmethod
+    def setUpTestData(cls):
+        # parler caches translations by id, and ids are reused once a test's rows are rolled back
+        cache.clear()
+        cls.user = CustomUser.objects.create_user(phone='998900000001', email='user@example.com', password='secret')
+        cls.user.groups.add(Group.objects.create(name='seller'))
+        cls.country = CountryFlower.objects.create(image='country_images/uz.png')
+        cls.country.set_current_language('ru')
+        cls.country.name = 'Узбекистан'
+        cls.country.save()
+        cls.flowers = [cls.create_flower(index) for index in range(25)]
+
+    def setUp(self):
+        cache.clear()
+        # A flusher thread would write views outside the test's transaction
+        settings_override = override_settings(VIEW_EVENT_BACKGROUND_FLUSH=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    @classmethod
+    def create_flower(cls, index, **kwargs):
+        kwargs.setdefault('price', '100.00')
+        flower = Flower(author=cls.user, country=cls.country, **kwargs)
+        flower.set_current_language('ru')
+        flower.name = f'Роза {index}'
+        flower.save()
+        ImagesofFlower.objects.create(flower=flower, image=f'flower_images/{index}.jpg')
+        SizesofFlower.objects.create(flower=flower, name='M')
+        QuantityofFlower.objects.create(flower=flower, name='15')
+        CompoundyofFlower.objects.create(flower=flower, name='Роза')
+        Review.objects.create(flower=flower, full_name='Анна', rating=index % 5 + 1)
+        Review.objects.create(flower=flower, full_name='Иван', rating=4)
+        return flower
+
+
+class FlowerListQueryCountTest(FlowerTestMixin, APITestCase):
+    url = reverse('flower-list-public')
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        with self.assertNumQueries(12):
+            small_page = self.client.get(self.url, {'page_size': 5})
+        with self.assertNumQueries(12):
+            large_page = self.client.get(self.url, {'page_size': 25})
+
+        self.assertEqual(len(small_page.data['results']), 5)
+        self.assertEqual(len(large_page.data['results']), 25)
+
+    def test_authenticated_like_is_merged_into_cached_page(self):
+        LiketoFlower.objects.create(flower=self.flowers[0], author=self.user)
+        self.client.force_authenticate(self.user)
+
+        with self.assertNumQueries(13):
+            self.client.get(self.url, {'page_size': 25})
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'page_size': 25})
+
+        likes = {item['id']: item['like'] for item in response.data['results']}
+        self.assertTrue(likes.pop(self.flowers[0].id))
+        self.assertFalse(any(likes.values()))
+
+    def test_like_changes_invalidate_cached_liked_ids(self):
+        self.client.force_authenticate(self.user)
+        self.client.get(self.url)
+
+        self.client.post('/api/v1/flower/like/', {'flower': self.flowers[1].id})
+        response = self.client.get(self.url, {'page_size': 25})
+        self.assertTrue(next(item['like'] for item in response.data['results'] if item['id'] == self.flowers[1].id))
+
+        self.client.delete(f'/api/v1/flower/like/{self.flowers[1].id}/')
+        response = self.client.get(self.url, {'page_size': 25})
+        self.assertFalse(any(item['like'] for item in response.data['results']))
+
+    def test_rating_fields_are_computed_from_prefetched_reviews(self):
+        response = self.client.get(self.url, {'page_size': 25})
+        item = next(item for item in response.data['results'] if item['id'] == self.flowers[1].id)
+
+        self.assertEqual(item['review_count'], 2)
+        self.assertEqual(item['average_rating'], 3.0)
+        self.assertEqual(item['author']['groups'], [{'id': self.user.groups.get().id, 'name': 'seller'}])
+        self.assertEqual(item['country']['translations']['ru']['name'], 'Узбекистан')
+
+
+class FlowerRatingAggregateTest(FlowerTestMixin, APITestCase):
+
+    def assertRating(self, flower, rating_sum, rating_count):
+        flower.refresh_from_db()
+        self.assertEqual((flower.rating_sum, flower.rating_count), (rating_sum, rating_count))
+        self.assertEqual(flower.rating_average, rating_sum / rating_count if rating_count else 0)
+
+    def test_review_writes_update_flower_aggregates(self):
+        flower, other = self.flowers[0], self.flowers[1]
+        self.assertRating(flower, 5, 2)
+
+        review = Review.objects.create(flower=flower, full_name='Ольга', rating=2)
+        self.assertRating(flower, 7, 3)
+
+        review.rating = 5
+        review.save()
+        self.assertRating(flower, 10, 3)
+
+        review.flower = other
+        review.save()
+        self.assertRating(flower, 5, 2)
+        self.assertRating(other, 11, 3)
+
+        review.delete()
+        self.assertRating(other, 6, 2)
+
+    def test_saving_a_stale_flower_keeps_aggregates(self):
+        flower = Flower.objects.get(pk=self.flowers[0].pk)
+        Review.objects.create(flower=flower, full_name='Ольга', rating=2)
+
+        flower.price = 120
+        flower.save()
+
+        self.assertRating(flower, 7, 3)
+
+    def assertHistogram(self, flower, histogram):
+        flower.refresh_from_db()
+        self.assertEqual([getattr(flower, f'rating_{value}') for value in range(1, 6)], histogram)
+
+    def test_review_writes_update_star_histogram(self):
+        flower, other = self.flowers[0], self.flowers[1]
+        self.assertHistogram(flower, [1, 0, 0, 1, 0])
+
+        review = Review.objects.create(flower=flower, full_name='Ольга', rating=2)
+        self.assertHistogram(flower, [1, 1, 0, 1, 0])
+
+        review.rating = 5
+        review.save()
+        self.assertHistogram(flower, [1, 0, 0, 1, 1])
+
+        review.flower = other
+        review.save()
+        self.assertHistogram(flower, [1, 0, 0, 1, 0])
+        self.assertHistogram(other, [0, 1, 0, 1, 1])
+
+        review.delete()
+        self.assertHistogram(other, [0, 1, 0, 1, 0])
+
+    def test_rebuild_command_recomputes_aggregates(self):
+        flower = self.flowers[2]
+        Flower.objects.filter(pk=flower.pk).update(rating_sum=0, rating_count=0, rating_average=0, rating_3=0)
+
+        call_command('rebuild_flower_ratings', stdout=StringIO())
+
+        self.assertRating(flower, 7, 2)
+        self.assertHistogram(flower, [0, 0, 1, 1, 0])
+
+    def test_min_rating_filter_and_rating_ordering(self):
+        response = self.client.get(reverse('flower-list-public'), {'min_rating': 4, 'ordering': '-rating'})
+
+        ratings = [item['average_rating'] for item in response.data['results']]
+        self.assertEqual(response.data['count'], 10)
+        self.assertEqual(ratings, sorted(ratings, reverse=True))
+        self.assertTrue(all(rating >= 4 for rating in ratings))
+
+
+class ReviewListTest(FlowerTestMixin, APITestCase):
+    url = reverse('review-create')
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.flower = cls.flowers[0]
+        for index in range(10):
+            Review.objects.create(flower=cls.flower, full_name=f'Покупатель {index}', rating=index % 5 + 1)
+
+    def test_reviews_are_paged_by_cursor_newest_first(self):
+        expected = list(Review.objects.filter(flower=self.flower).order_by('-created_at', '-id').values_list(
+            'id', flat=True
+        ))
+        ids = []
+        url, params = self.url, {'flower': self.flower.id, 'page_size': 5}
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url, params)
+            ids += [review['id'] for review in response.data['results']]
+            url, params = response.data['next'], None
+
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(ids), 12)
+
+        previous = self.client.get(response.data['previous'])
+        self.assertEqual([review['id'] for review in previous.data['results']], expected[5:10])
+
+    def test_reviews_can_be_sorted_by_rating(self):
+        response = self.client.get(self.url, {'flower': self.flower.id, 'ordering': '-rating', 'page_size': 100})
+
+        ratings = [review['rating'] for review in response.data['results']]
+        self.assertEqual(ratings, sorted(ratings, reverse=True))
+        self.assertEqual(len(ratings), 12)
+
+    def test_flower_is_required(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('flower', response.data)
+
+    def test_flower_responses_embed_latest_reviews_and_histogram(self):
+        latest = list(Review.objects.filter(flower=self.flower).order_by('-created_at', '-id').values_list(
+            'id', flat=True
+        )[:5])
+
+        detail = self.client.get(reverse('flower-detail-update', args=[self.flower.id])).data
+        page = self.client.get(reverse('flower-list-public'), {'page_size': 25}).data
+
+        item = next(item for item in page['results'] if item['id'] == self.flower.id)
+        for data in (detail, item):
+            self.assertEqual([review['id'] for review in data['review']], latest)
+            self.assertEqual(data['review_count'], 12)
+            self.assertEqual(data['rating_histogram'], {'1': 3, '2': 2, '3': 2, '4': 3, '5': 2})
+
+
+class FlowerListCacheTest(FlowerTestMixin, APITestCase):
+    url = reverse('flower-list-public')
+
+    def test_repeated_query_is_served_from_cache(self):
+        first = self.client.get(self.url, {'page_size': 5, 'in_stock': 'true'})
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url, {'in_stock': 'true', 'page_size': 5})
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(get_cache_stats('flower-list'), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_catalog_change_invalidates_cached_pages(self):
+        self.client.get(self.url, {'page_size': 25})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SizesofFlower.objects.create(flower=self.flowers[0], name='XL')
+        response = self.client.get(self.url, {'page_size': 25})
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        item = next(item for item in response.data['results'] if item['id'] == self.flowers[0].id)
+        self.assertEqual([size['name'] for size in item['size']], ['M', 'XL'])
+
+
+class FlowerCursorPaginationTest(FlowerTestMixin, APITestCase):
+    url = reverse('flower-list-public')
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        prices = [None, '50.00', '50.00', '10.00'] * 6 + ['75.00']
+        for flower, price in zip(cls.flowers, prices):
+            flower.price = price
+            flower.save()
+
+    def walk(self, params):
+        ids, response = [], self.client.get(self.url, {'pagination': 'cursor', 'page_size': 4, **params})
+        pages = [response]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(response)
+        for page in pages:
+            self.assertNotIn('count', page.data)
+            ids.extend(item['id'] for item in page.data['results'])
+        return ids, pages
+
+    def expected_ids(self, key, descending=False):
+        flowers = sorted(self.flowers, key=lambda flower: flower.id, reverse=descending)
+        present = [flower for flower in flowers if key(flower) is not None]
+        missing = [flower for flower in flowers if key(flower) is None]
+        present.sort(key=key, reverse=descending)
+        return [flower.id for flower in present + missing]
+
+    def test_walks_every_supported_ordering_without_gaps(self):
+        price = lambda flower: None if flower.price is None else Decimal(flower.price)
+        cases = {
+            'created': self.expected_ids(lambda flower: flower.id),
+            '-created': self.expected_ids(lambda flower: flower.id, descending=True),
+            'price': self.expected_ids(price),
+            '-price': self.expected_ids(price, descending=True),
+        }
+        for ordering, expected in cases.items():
+            with self.subTest(ordering=ordering):
+                ids, pages = self.walk({'ordering': ordering})
+                self.assertEqual(ids, expected)
+                self.assertEqual(len(pages), 7)
+
+    def test_previous_cursor_returns_the_preceding_page(self):
+        _, pages = self.walk({'ordering': 'price'})
+
+        response = self.client.get(pages[3].data['previous'])
+
+        self.assertEqual(response.data['results'], pages[2].data['results'])
+        self.assertIsNone(pages[0].data['previous'])
+
+    def test_deep_page_costs_the_same_as_the_first(self):
+        params = {'pagination': 'cursor', 'ordering': '-rating', 'page_size': 2}
+        _, pages = self.walk(params)
+
+        cache.clear()
+        with self.assertNumQueries(11):
+            self.client.get(self.url, params)
+        with self.assertNumQueries(11):
+            self.client.get(pages[-2].data['next'])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(self.url, {'pagination': 'cursor', 'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, 404)
+
+
+class FlowerSearchTest(FlowerTestMixin, APITestCase):
+    url = reverse('flower-list-public')
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.tulip = cls.create_flower(100)
+        cls.tulip.set_current_language('ru')
+        cls.tulip.name = 'Тюльпан'
+        cls.tulip.description = 'Красный тюльпан из Голландии'
+        cls.tulip.save()
+        cls.tulip.set_current_language('en')
+        cls.tulip.name = 'Tulip'
+        cls.tulip.plantation = 'Holland Farms'
+        cls.tulip.save()
+
+    def search(self, text, **params):
+        response = self.client.get(self.url, {'q': text, 'page_size': 50, **params})
+        return [item['id'] for item in response.data['results']]
+
+    def test_matches_word_prefixes_in_every_language(self):
+        self.assertEqual(self.search('тюльп'), [self.tulip.id])
+        self.assertEqual(self.search('holland'), [self.tulip.id])
+        self.assertEqual(self.search('Tulip ГОЛЛАНД'), [self.tulip.id])
+        self.assertEqual(self.search('tulip rose'), [])
+
+    def test_orders_by_relevance(self):
+        rose = self.flowers[3]
+        rose.set_current_language('ru')
+        rose.description = 'Тюльпан? Нет, роза'
+        rose.save()
+
+        self.assertEqual(self.search('тюльпан'), [self.tulip.id, rose.id])
+        self.assertEqual(self.search('тюльпан', ordering='created'), [rose.id, self.tulip.id])
+
+    def test_index_follows_translation_changes_and_deletes(self):
+        self.tulip.set_current_language('en')
+        self.tulip.name = 'Lily'
+        self.tulip.save()
+        self.assertEqual(self.search('lily'), [self.tulip.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tulip.delete()
+        self.assertEqual(self.search('lily'), [])
+
+    def test_rebuild_command_restores_the_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM flowers_flower_search')
+
+        call_command('rebuild_flower_search', stdout=StringIO())
+
+        self.assertEqual(self.search('тюльпан'), [self.tulip.id])
+
+
+class FlowerFacetsTest(FlowerTestMixin, APITestCase):
+    url = reverse('flower-facets')
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for index, flower in enumerate(cls.flowers):
+            flower.volume = index % 3
+            flower.plantation = ['Алма', 'Бета'][index % 2]
+            flower.save()
+
+    def test_counts_values_of_every_facet(self):
+        with self.assertNumQueries(7):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.data['volume'], [
+            {'value': 0, 'count': 9}, {'value': 1, 'count': 8}, {'value': 2, 'count': 8},
+        ])
+        self.assertEqual(response.data['plantation'], [{'value': 'Алма', 'count': 13}, {'value': 'Бета', 'count': 12}])
+        self.assertEqual(response.data['country'], [{'value': 'Узбекистан', 'count': 25}])
+
+    def test_facets_apply_every_filter_but_their_own(self):
+        response = self.client.get(self.url, {'volume': 1, 'plantation': 'Алма'})
+
+        self.assertEqual(response.data['volume'], [
+            {'value': 0, 'count': 5}, {'value': 1, 'count': 4}, {'value': 2, 'count': 4},
+        ])
+        self.assertEqual(response.data['plantation'], [{'value': 'Алма', 'count': 4}, {'value': 'Бета', 'count': 4}])
+        self.assertEqual(response.data['stem_height'], [{'value': 0, 'count': 4}])
+
+    def test_facets_are_cached_by_catalog_version(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flowers[0].volume = 7
+            self.flowers[0].save()
+        response = self.client.get(self.url)
+
+        self.assertIn({'value': 7, 'count': 1}, response.data['volume'])
+
+
+class DistinctProductAttributesTest(FlowerTestMixin, APITestCase):
+    url = reverse('distinct-product-attributes')
+
+    def test_query_count_does_not_grow_with_the_catalog(self):
+        for index, flower in enumerate(self.flowers):
+            flower.volume = index % 4
+            flower.plantation = f'Плантация {index % 3}'
+            flower.save()
+
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url)
+        for index in range(25, 50):
+            self.create_flower(index, volume=index)
+        cache.clear()
+        with self.assertNumQueries(5):
+            self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        self.assertEqual(response.data['volume'], [1, 2, 3])
+        self.assertEqual(response.data['plantation'], ['Плантация 0', 'Плантация 1', 'Плантация 2'])
+
+    def test_plantation_falls_back_to_another_language(self):
+        flower = self.flowers[0]
+        flower.translations.all().delete()
+        flower.set_current_language('en')
+        flower.plantation = 'Green Valley'
+        flower.save()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.data['plantation'], ['Green Valley'])
+
+
+class CategoryTreeTest(FlowerTestMixin, APITestCase):
+    url = reverse('category-list')
+    flowers_url = reverse('flower-list-public')
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.bouquets = cls.create_category('Букеты')
+        cls.roses = cls.create_category('Розы', parent=cls.bouquets)
+        cls.red_roses = cls.create_category('Красные розы', parent=cls.roses)
+        cls.gifts = cls.create_category('Подарки')
+        for flower, category in zip(cls.flowers, [cls.bouquets, cls.roses, cls.red_roses, cls.gifts]):
+            flower.category = category
+            flower.save()
+
+    @classmethod
+    def create_category(cls, name, parent=None):
+        category = Category(parent=parent)
+        category.set_current_language('ru')
+        category.name = name
+        category.save()
+        return category
+
+    def category_flower_ids(self, *categories):
+        response = self.client.get(self.flowers_url, {'category': ','.join(str(category.id) for category in categories)})
+        return {item['id'] for item in response.data['results']}
+
+    def test_paths_follow_parents(self):
+        self.red_roses.refresh_from_db()
+        self.assertEqual(self.red_roses.path, f'{self.bouquets.id}/{self.roses.id}/{self.red_roses.id}/')
+
+    def test_tree_is_nested_and_built_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        self.assertEqual([node['id'] for node in response.data], [self.bouquets.id, self.gifts.id])
+        roses = response.data[0]['subcategories'][0]
+        self.assertEqual(roses['translations'], {'ru': {'name': 'Розы'}})
+        self.assertEqual([node['id'] for node in roses['subcategories']], [self.red_roses.id])
+
+    def test_category_filter_includes_descendants(self):
+        flowers = self.flowers
+        self.assertEqual(self.category_flower_ids(self.bouquets), {flowers[0].id, flowers[1].id, flowers[2].id})
+        self.assertEqual(self.category_flower_ids(self.roses, self.gifts), {flowers[1].id, flowers[2].id, flowers[3].id})
+        self.assertEqual(self.category_flower_ids(self.red_roses), {flowers[2].id})
+
+    def test_moving_a_category_moves_its_subtree(self):
+        self.category_flower_ids(self.bouquets)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.roses.parent = self.gifts
+            self.roses.save()
+
+        self.red_roses.refresh_from_db()
+        self.assertEqual(self.red_roses.path, f'{self.gifts.id}/{self.roses.id}/{self.red_roses.id}/')
+        self.assertEqual(self.category_flower_ids(self.bouquets), {self.flowers[0].id})
+        self.assertEqual(
+            self.category_flower_ids(self.gifts), {self.flowers[1].id, self.flowers[2].id, self.flowers[3].id}
+        )
+
+
+class LanguageScopedPayloadTest(FlowerTestMixin, APITestCase):
+    url = reverse('flower-list-public')
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.flowers[0].set_current_language('en')
+        cls.flowers[0].name = 'Rose 0'
+        cls.flowers[0].save()
+
+    def results(self, **kwargs):
+        response = self.client.get(self.url, {'page_size': 25, **kwargs.pop('params', {})}, **kwargs)
+        return {item['id']: item for item in response.data['results']}
+
+    def test_lang_flattens_translations_with_fallbacks(self):
+        with self.assertNumQueries(12):
+            results = self.results(params={'lang': 'en'})
+
+        first, second = results[self.flowers[0].id], results[self.flowers[1].id]
+        self.assertNotIn('translations', first)
+        self.assertEqual((first['name'], second['name']), ('Rose 0', 'Роза 1'))
+        self.assertEqual(first['country']['name'], 'Узбекистан')
+
+    def test_bare_lang_follows_accept_language(self):
+        english = self.results(params={'lang': ''}, HTTP_ACCEPT_LANGUAGE='en')
+        russian = self.results(params={'lang': ''}, HTTP_ACCEPT_LANGUAGE='ru')
+
+        self.assertEqual(english[self.flowers[0].id]['name'], 'Rose 0')
+        self.assertEqual(russian[self.flowers[0].id]['name'], 'Роза 0')
+
+    def test_every_translation_is_sent_by_default(self):
+        translations = self.results()[self.flowers[0].id]['translations']
+
+        self.assertEqual(set(translations), {'ru', 'en'})
+
+
+class ConditionalGetTest(FlowerTestMixin, APITestCase):
+
+    def test_matching_etag_is_answered_without_queries(self):
+        BannerCarousel.objects.create(image='banner/1.jpg')
+        url = reverse('banner-carousel')
+        response = self.client.get(url)
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BannerCarousel.objects.create(image='banner/2.jpg')
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(len(changed.data), 2)
+
+    def test_etag_follows_the_query_and_the_models_of_the_endpoint(self):
+        url = reverse('country-flowers')
+        etag = self.client.get(url)['ETag']
+
+        self.assertNotEqual(self.client.get(url, {'lang': 'en'})['ETag'], etag)
+        with self.captureOnCommitCallbacks(execute=True):
+            BannerCarousel.objects.create(image='banner/1.jpg')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_flower_list_etag_covers_the_users_likes(self):
+        url = reverse('flower-list-public')
+        self.client.force_authenticate(self.user)
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        LiketoFlower.objects.create(flower=self.flowers[0], author=self.user)
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class SparseFieldsetTest(FlowerTestMixin, APITestCase):
+    url = reverse('flower-list-public')
+
+    def test_fields_skip_the_work_of_left_out_fields(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url, {'page_size': 25, 'fields': 'name,price,discount_price,images'})
+
+        item = response.data['results'][0]
+        self.assertEqual(list(item), ['id', 'translations', 'price', 'discount_price', 'images'])
+        self.assertEqual(list(item['translations']['ru']), ['name'])
+
+    def test_omit_drops_fields_and_flat_translations(self):
+        with self.assertNumQueries(9):
+            response = self.client.get(self.url, {'page_size': 25, 'omit': 'review,author,like,description'})
+        flat = self.client.get(self.url, {'fields': 'name,sort', 'omit': 'sort', 'lang': 'ru'})
+
+        self.assertFalse({'review', 'author', 'like'} & set(response.data['results'][0]))
+        self.assertEqual(flat.data['results'][0], {'id': self.flowers[0].id, 'name': 'Роза 0'})
+
+    def test_balloon_and_detail_endpoints_accept_fields(self):
+        response = self.client.get(reverse('flower-detail-update', args=[self.flowers[0].id]), {'fields': 'like'})
+
+        self.assertEqual(response.data, {'id': self.flowers[0].id, 'like': False})
+        self.assertEqual(self.client.get(reverse('balloon'), {'omit': 'translations'}).status_code, 200)
+
+
+class FlowerCardTest(FlowerTestMixin, APITestCase):
+    url = reverse('flower-list-public')
+
+    def test_cards_are_read_with_one_query_per_page(self):
+        flower = self.flowers[1]
+        flower.discount_price = Decimal('80.00')
+        flower.save()
+        ImagesofFlower.objects.create(flower=flower, image='flower_images/second.jpg')
+
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'view': 'card', 'page_size': 25})
+
+        card = next(item for item in response.data['results'] if item['id'] == flower.id)
+        self.assertEqual(card, {
+            'id': flower.id, 'name': 'Роза 1', 'price': '100.00', 'discount_price': '80.00',
+            'effective_price': '80.00', 'image': 'http://testserver/media/flower_images/1.jpg',
+            'average_rating': 3.0, 'review_count': 2, 'in_stock': True, 'like': False,
+        })
+
+    def test_card_name_follows_lang_and_likes_are_merged(self):
+        self.flowers[0].set_current_language('en')
+        self.flowers[0].name = 'Rose 0'
+        self.flowers[0].save()
+        LiketoFlower.objects.create(flower=self.flowers[0], author=self.user)
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(self.url, {'view': 'card', 'lang': 'en', 'pagination': 'cursor', 'page_size': 2})
+
+        self.assertEqual([card['name'] for card in response.data['results']], ['Rose 0', 'Роза 1'])
+        self.assertEqual([card['like'] for card in response.data['results']], [True, False])
+        self.assertEqual(self.client.get(response.data['next']).status_code, 200)
+
+
+class FragmentCacheTest(FlowerTestMixin, APITestCase):
+    url = reverse('flower-list-public')
+
+    def test_page_is_assembled_from_cached_fragments(self):
+        first = self.client.get(self.url, {'page_size': 25})
+        bump_catalog_version()
+
+        with self.assertNumQueries(2):
+            second = self.client.get(self.url, {'page_size': 25})
+
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(get_cache_stats('flower-fragments'), {'hits': 25, 'misses': 25, 'hit_rate': 0.5})
+
+    def test_changes_re_render_only_the_affected_flowers(self):
+        self.client.get(self.url, {'page_size': 25})
+        with self.captureOnCommitCallbacks(execute=True):
+            SizesofFlower.objects.create(flower=self.flowers[3], name='XL')
+
+        response = self.client.get(self.url, {'page_size': 25})
+
+        flower = next(item for item in response.data['results'] if item['id'] == self.flowers[3].id)
+        self.assertEqual([size['name'] for size in flower['size']], ['M', 'XL'])
+        self.assertEqual(get_cache_stats('flower-fragments')['misses'], 26)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.country.name = 'Эквадор'
+            self.country.save()
+
+        response = self.client.get(self.url, {'page_size': 25})
+
+        self.assertEqual(response.data['results'][0]['country']['translations']['ru']['name'], 'Эквадор')
+        self.assertEqual(get_cache_stats('flower-fragments')['misses'], 51)
+
+    def test_balloon_list_merges_likes_into_cached_fragments(self):
+        balloons = [Balloon.objects.create(price='10.00') for _ in range(2)]
+        LiketoBalloon.objects.create(balloon=balloons[1], author=self.user)
+        self.client.get(reverse('balloon'))
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(reverse('balloon'))
+
+        self.assertEqual([item['like'] for item in response.data], [False, True])
+        self.assertEqual(get_cache_stats('balloon-fragments'), {'hits': 2, 'misses': 2, 'hit_rate': 0.5})
+
+
+class FastJSONRendererTest(FlowerTestMixin, APITestCase):
+
+    def test_output_matches_the_stock_renderer(self):
+        page = self.client.get(reverse('flower-list-public'), {'page_size': 25}).data
+        extra = {
+            'price': Decimal('12.50'), 'created': Review.objects.values_list('created_at', flat=True).first(),
+            'histogram': {5: 1, 4: 2}, 'note': 'line\u2028break',
+        }
+        for data in (page, extra):
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class ImageVariantsTest(FlowerTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, IMAGE_VARIANT_WIDTHS=(320, 640, 1280))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def image_bytes(self, size=(800, 600), image_format='PNG', **options):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, image_format, **options)
+        return buffer.getvalue()
+
+    def upload(self, name, size=(800, 600)):
+        return default_storage.save(name, ContentFile(self.image_bytes(size)))
+
+    def test_variants_are_generated_on_upload_and_served(self):
+        image = ImagesofFlower.objects.create(flower=self.flowers[0], image=self.upload('flower_images/rose.png'))
+        self.assertEqual(image.status, ImageStatus.PENDING)
+
+        call_command('process_image_queue', once=True, stdout=StringIO())
+        image.refresh_from_db()
+
+        # The optimized copy replaces the original under a name of its own
+        stem = os.path.splitext(os.path.basename(image.image.name))[0]
+        self.assertTrue(stem.startswith('rose_'))
+        self.assertFalse(default_storage.exists('flower_images/rose.png'))
+        self.assertEqual(image.status, ImageStatus.READY)
+        self.assertEqual((image.width, image.height), (800, 600))
+        self.assertEqual(image.variants['formats']['webp'], {
+            width: f'flower_images/variants/{stem}-{width}w.webp' for width in ('320', '640', '800')
+        })
+        with default_storage.open(image.variants['formats']['jpeg']['320']) as file:
+            self.assertEqual(Image.open(file).size, (320, 240))
+
+        response = self.client.get(reverse('flower-list-public'), {'page_size': 25})
+
+        flower = next(item for item in response.data['results'] if item['id'] == self.flowers[0].id)
+        served = next(item for item in flower['images'] if item['id'] == image.id)
+        self.assertEqual(served['width'], 800)
+        self.assertEqual(served['variants']['webp'], ', '.join(
+            f'http://testserver/media/flower_images/variants/{stem}-{width}w.webp {width}w' for width in (320, 640, 800)
+        ))
+
+    def test_command_backfills_existing_images(self):
+        banner = BannerCarousel.objects.create(image=self.upload('banner/spring.png', (2000, 500)))
+        self.assertEqual(banner.variants, {})
+
+        call_command('generate_image_variants', workers=1, stdout=StringIO())
+
+        banner.refresh_from_db()
+        self.assertEqual(banner.height, 500)
+        self.assertEqual(sorted(banner.variants['formats']['jpeg'], key=int), ['320', '640', '1280'])
+        self.assertTrue(default_storage.exists('banner/variants/spring-1280w.jpg'))
+
+    @override_settings(IMAGE_MAX_DIMENSION=1000)
+    def test_created_flower_images_are_processed_by_the_queue(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotated 90 degrees
+        upload = SimpleUploadedFile(
+            'photo.jpg', self.image_bytes((1600, 1200), 'JPEG', exif=exif), content_type='image/jpeg'
+        )
+        self.client.force_authenticate(self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('flower-list-create'), {
+                'name': 'Тюльпан', 'price': '10.00', 'uploaded_images': [upload],
+            }, format='multipart')
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual([image['status'] for image in response.data['images']], ['pending'])
+        task = ImageProcessingTask.objects.get(object_id=response.data['images'][0]['id'])
+        self.assertEqual(task.model, 'flowers.imagesofflower')
+
+        call_command('process_image_queue', once=True, stdout=StringIO())
+
+        image = ImagesofFlower.objects.get(flower_id=response.data['id'])
+        self.assertEqual((image.status, image.width, image.height), (ImageStatus.READY, 750, 1000))
+        with image.image.open() as file:
+            self.assertNotIn(0x0112, Image.open(file).getexif())
+        self.assertFalse(ImageProcessingTask.objects.filter(pk=task.pk).exists())
+
+    def test_failed_processing_keeps_the_upload_and_retries_do_not_reencode(self):
+        image = ImagesofFlower.objects.create(flower=self.flowers[0], image=self.upload('flower_images/rose.png'))
+        task = ImageProcessingTask.objects.get(object_id=image.pk)
+
+        with mock.patch('django.core.files.storage.FileSystemStorage.save', side_effect=OSError):
+            self.assertFalse(run_task(task))
+        image.refresh_from_db()
+        self.assertEqual((image.image.name, image.status), ('flower_images/rose.png', ImageStatus.PENDING))
+        self.assertTrue(default_storage.exists('flower_images/rose.png'))
+
+        task.refresh_from_db()
+        with mock.patch('apps.flowers.image_queue.render_variants', side_effect=OSError):
+            self.assertFalse(run_task(task))
+        image.refresh_from_db()
+        self.assertFalse(default_storage.exists('flower_images/rose.png'))
+        self.assertTrue(default_storage.exists(image.image.name))
+
+        task.refresh_from_db()
+        with mock.patch('apps.flowers.image_queue.optimize_original') as optimize_original:
+            self.assertTrue(run_task(task))
+        optimize_original.assert_not_called()
+        image.refresh_from_db()
+        self.assertEqual(image.status, ImageStatus.READY)
+
+    def test_unreadable_uploads_are_marked_failed(self):
+        image = ImagesofFlower.objects.create(flower=self.flowers[0], image='flower_images/missing.png')
+
+        call_command('process_image_queue', once=True, stdout=StringIO())
+
+        image.refresh_from_db()
+        self.assertEqual(image.status, ImageStatus.FAILED)
+        self.assertFalse(ImageProcessingTask.objects.filter(object_id=image.pk).exists())
+
+
+class ImportFlowersTest(FlowerTestMixin, APITestCase):
+
+    def write(self, name, content):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def test_jsonl_rows_are_upserted_by_sku(self):
+        Flower.objects.filter(pk=self.flowers[0].pk).update(sku='A-1')
+        rows = [
+            {'sku': 'A-1', 'price': '150.00', 'translations': {'en': {'name': 'Rose 0'}}, 'sizes': ['S', 'L']},
+            {
+                'sku': 'B-2', 'price': '20', 'in_stock': False, 'country': 'Кения', 'package': 'Коробка',
+                'translations': {'ru': {'name': 'Лилия', 'plantation': 'Наиваша'}}, 'compound': ['Лилия'],
+            },
+            {'price': '1.00'},
+            {'sku': 'C-3', 'price': 'cheap'},
+        ]
+        path = self.write('catalog.jsonl', '\n'.join(json.dumps(row, ensure_ascii=False) for row in rows))
+        stdout, stderr = StringIO(), StringIO()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_flowers', path, batch_size=2, stdout=stdout, stderr=stderr)
+
+        self.assertIn('2 flowers (1 created, 1 updated, 0 unchanged, 2 skipped)', stdout.getvalue())
+        self.assertIn('Line 3: every row needs a sku or the id of an existing flower', stderr.getvalue())
+        self.assertIn('Line 4: price:', stderr.getvalue())
+
+        updated = Flower.objects.get(sku='A-1')
+        self.assertEqual(updated.price, Decimal('150.00'))
+        self.assertEqual(updated.safe_translation_getter('name', language_code='ru'), 'Роза 0')
+        self.assertEqual(updated.safe_translation_getter('name', language_code='en'), 'Rose 0')
+        self.assertEqual(sorted(updated.flower_size.values_list('name', flat=True)), ['L', 'S'])
+        self.assertEqual(updated.flower_quantity.count(), 1)
+
+        created = Flower.objects.get(sku='B-2')
+        self.assertEqual((created.price, created.in_stock), (Decimal('20'), False))
+        self.assertEqual(created.country.safe_translation_getter('name'), 'Кения')
+        self.assertEqual(created.package.safe_translation_getter('name'), 'Коробка')
+        self.assertEqual(list(created.flower_compound.values_list('name', flat=True)), ['Лилия'])
+        response = self.client.get(reverse('flower-list-public'), {'q': 'Наиваша'})
+        self.assertEqual([item['id'] for item in response.data['results']], [created.id])
+
+    def test_reimport_reports_unchanged_rows_and_renames_are_read_back(self):
+        flower = self.flowers[0]
+        Flower.objects.filter(pk=flower.pk).update(sku='A-1')
+        # Warm parler's translation cache
+        self.assertEqual(str(Flower.objects.get(pk=flower.pk)), 'Роза 0')
+        rename = self.write('rename.jsonl', json.dumps({'sku': 'A-1', 'translations': {'ru': {'name': 'Пион'}}}))
+        same = self.write('same.jsonl', json.dumps({'sku': 'A-1', 'price': '100.00'}))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_flowers', rename, stdout=StringIO())
+        stdout = StringIO()
+        call_command('import_flowers', same, stdout=stdout)
+
+        self.assertEqual(Flower.objects.get(pk=flower.pk).name, 'Пион')
+        self.assertEqual(str(Flower.objects.get(pk=flower.pk)), 'Пион')
+        self.assertIn('1 flowers (0 created, 0 updated, 1 unchanged, 0 skipped)', stdout.getvalue())
+
+    def test_rows_the_database_would_reject_are_skipped(self):
+        category = Category.objects.create()
+        rows = [
+            {'sku': 'E-5', 'category': category.id, 'translations': {'en': {'name': 'Tulip'}}},
+            {'sku': 'E-6', 'category': 999999},
+            {'sku': 'E-7', 'translations': {'ru': {'name': 'x' * 251}}},
+            {'sku': 'E-' + '8' * 100},
+            {'sku': 'E-9', 'translations': {'zz': {'name': 'x'}}},
+        ]
+        path = self.write('catalog.jsonl', '\n'.join(json.dumps(row) for row in rows))
+        stdout, stderr = StringIO(), StringIO()
+
+        # One lookup of the categories of the batch, and no write of the rejected rows
+        with self.assertNumQueries(10):
+            call_command('import_flowers', path, stdout=stdout, stderr=stderr)
+
+        self.assertIn('1 flowers (1 created, 0 updated, 0 unchanged, 4 skipped)', stdout.getvalue())
+        self.assertIn('Line 2: category: no category has id 999999', stderr.getvalue())
+        self.assertIn('Line 3: name: must be at most 250 characters', stderr.getvalue())
+        self.assertIn('Line 4: sku: must be at most 100 characters', stderr.getvalue())
+        self.assertIn("Line 5: translations: unknown language 'zz'", stderr.getvalue())
+        self.assertEqual(list(Flower.objects.filter(sku__startswith='E-').values_list('sku', flat=True)), ['E-5'])
+
+    def test_batches_the_database_rejects_are_retried_row_by_row(self):
+        rows = [{'sku': 'F-1', 'country': 'Чили'}, {'sku': 'F-2', 'country': 'Чили'}]
+        path = self.write('catalog.jsonl', '\n'.join(json.dumps(row, ensure_ascii=False) for row in rows))
+        stdout, stderr = StringIO(), StringIO()
+
+        def index_flowers(flower_ids):
+            if Flower.objects.filter(id__in=flower_ids, sku='F-2').exists():
+                raise IntegrityError('CHECK constraint failed')
+
+        with mock.patch('apps.flowers.importing.index_flowers', index_flowers):
+            call_command('import_flowers', path, stdout=stdout, stderr=stderr)
+
+        self.assertIn('1 flowers (1 created, 0 updated, 0 unchanged, 1 skipped)', stdout.getvalue())
+        self.assertIn('Line 2: rejected by the database: CHECK constraint failed', stderr.getvalue())
+        # The country created by the rolled back batch is created again
+        self.assertEqual(Flower.objects.get(sku='F-1').country.safe_translation_getter('name'), 'Чили')
+        self.assertFalse(Flower.objects.filter(sku='F-2').exists())
+
+    def test_csv_columns_map_to_translations_and_children(self):
+        path = self.write('catalog.csv', (
+            'sku,price,name_ru,name_en,sizes,country\n'
+            'D-4,30.50,Пион,Peony,M|L,Узбекистан\n'
+        ))
+
+        call_command('import_flowers', path, stdout=StringIO())
+
+        flower = Flower.objects.get(sku='D-4')
+        self.assertEqual(flower.safe_translation_getter('name', language_code='en'), 'Peony')
+        self.assertEqual(flower.country_id, self.country.id)
+        self.assertEqual(sorted(flower.flower_size.values_list('name', flat=True)), ['L', 'M'])
+
+
+class FlowerExportTest(FlowerTestMixin, APITestCase):
+    url = reverse('flower-export')
+
+    def setUp(self):
+        super().setUp()
+        self.staff = CustomUser.objects.create_user(phone='998900000002', email='staff@example.com', password='secret')
+        self.staff.is_staff = True
+        self.staff.save()
+        self.client.force_authenticate(self.staff)
+
+    def test_export_is_staff_only(self):
+        self.client.force_authenticate(self.user)
+
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_ndjson_streams_one_flower_per_line(self):
+        Flower.objects.filter(pk=self.flowers[0].pk).update(sku='A-1')
+
+        with self.assertNumQueries(7):
+            response = self.client.get(self.url)
+            lines = b''.join(response.streaming_content).splitlines()
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(len(lines), 25)
+        self.assertEqual(json.loads(lines[0]), {
+            'id': self.flowers[0].id, 'sku': 'A-1', 'price': '100.00', 'discount_price': None, 'cashback': 10,
+            'stem_height': 0, 'volume': 0, 'plant_length': 0, 'price_per_box': 0, 'head_outer_diameter': None,
+            'quantity': 0, 'in_stock': True, 'showcase_online': False, 'is_popular': False, 'is_new': False,
+            'stock_number': None, 'category': None, 'country': 'Узбекистан', 'package': None,
+            'translations': {'ru': {'name': 'Роза 0', 'description': None, 'plantation': None, 'sort': None}},
+            'sizes': ['M'], 'quantities': ['15'], 'compound': ['Роза'],
+        })
+
+    def test_csv_export_can_be_imported_back(self):
+        Flower.objects.filter(pk=self.flowers[3].pk).update(sku='D-4', price='12.00')
+        response = self.client.get(self.url, {'output': 'csv', 'name': 'Роза 3'})
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(len(content.splitlines()), 2)
+
+        Flower.objects.filter(pk=self.flowers[3].pk).update(price='99.00')
+        SizesofFlower.objects.filter(flower=self.flowers[3]).delete()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'flowers.csv')
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            file.write(content)
+        call_command('import_flowers', path, stdout=StringIO())
+
+        flower = Flower.objects.get(pk=self.flowers[3].pk)
+        self.assertEqual(flower.price, Decimal('12.00'))
+        self.assertEqual(list(flower.flower_size.values_list('name', flat=True)), ['M'])
+
+    def test_flowers_without_sku_are_imported_back_by_id(self):
+        content = b''.join(self.client.get(self.url).streaming_content).decode()
+        Flower.objects.filter(pk=self.flowers[5].pk).update(price='99.00')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'flowers.jsonl')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content + json.dumps({'id': 0, 'price': '1.00'}) + '\n')
+            file.write(json.dumps({'id': Flower.objects.order_by('-id').first().id + 1, 'price': '1.00'}))
+        stdout, stderr = StringIO(), StringIO()
+
+        call_command('import_flowers', path, stdout=stdout, stderr=stderr)
+
+        self.assertIn('25 flowers (0 created, 1 updated, 24 unchanged, 2 skipped)', stdout.getvalue())
+        self.assertIn('Line 27: no flower has id', stderr.getvalue())
+        self.assertEqual(Flower.objects.get(pk=self.flowers[5].pk).price, Decimal('100.00'))
+        self.assertEqual(Flower.objects.count(), 25)
+
+    def test_unknown_output_is_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'output': 'xml'}).status_code, 400)
+
+    def test_invalid_filters_are_rejected(self):
+        response = self.client.get(self.url, {'min_rating': 'high'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('min_rating', response.data)
+
+
+class MediaServingTest(APITestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        os.makedirs(os.path.join(media_root, 'flower_images'))
+        for name in ('rose.jpg', 'rose.0123456789abcdef.jpg'):
+            with open(os.path.join(media_root, 'flower_images', name), 'wb') as file:
+                file.write(b'0123456789')
+
+    def test_files_are_served_with_validators_and_cache_headers(self):
+        response = self.client.get('/media/flower_images/rose.jpg')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        revalidated = self.client.get('/media/flower_images/rose.jpg', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+        hashed = self.client.get('/media/flower_images/rose.0123456789abcdef.jpg')
+        self.assertEqual(hashed['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_cross_origin_requests_get_cors_headers(self):
+        response = self.client.get('/media/flower_images/rose.jpg', HTTP_ORIGIN='https://shop.example.com')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Access-Control-Allow-Origin'], 'https://shop.example.com')
+
+    def test_byte_ranges(self):
+        response = self.client.get('/media/flower_images/rose.jpg', HTTP_RANGE='bytes=2-5')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+
+        suffix = self.client.get('/media/flower_images/rose.jpg', HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(suffix.streaming_content), b'789')
+
+        unsatisfiable = self.client.get('/media/flower_images/rose.jpg', HTTP_RANGE='bytes=20-')
+        self.assertEqual((unsatisfiable.status_code, unsatisfiable['Content-Range']), (416, 'bytes */10'))
+
+        stale = self.client.get('/media/flower_images/rose.jpg', HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"old"')
+        self.assertEqual(stale.status_code, 200)
+
+    def test_missing_files_are_plain_404s(self):
+        for path in ('/media/flower_images/tulip.jpg', '/media/flower_images/', '/media/../settings.py'):
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 404, path)
+            self.assertNotEqual(response.get('Content-Type'), 'application/json')
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect')
+    def test_sendfile_offload(self):
+        response = self.client.get('/media/flower_images/rose.jpg')
+
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/flower_images/rose.jpg')
+        self.assertEqual(response.content, b'')
+        self.assertIn('ETag', response)
+
+
+class FlowerViewEventTest(FlowerTestMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        view_events.events.clear()
+        self.client.force_authenticate(self.user)
+
+    def view(self, flower):
+        return self.client.get(reverse('flower-detail-update', args=[flower.id]))
+
+    def test_detail_view_is_read_only_and_views_are_written_in_one_batch(self):
+        for flower in self.flowers[:3] + self.flowers[:3]:
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.view(flower).status_code, 200)
+            self.assertFalse([query for query in context.captured_queries if 'INSERT' in query['sql']])
+        self.assertFalse(ViewUsertoFlower.objects.exists())
+
+        with self.assertNumQueries(1):
+            self.assertEqual(flush_view_events(force=True), 3)
+        self.view(self.flowers[0])
+        flush_view_events(force=True)
+
+        self.assertEqual(
+            list(ViewUsertoFlower.objects.values_list('flower_id', flat=True)),
+            [flower.id for flower in self.flowers[:3]]
+        )
+
+    @override_settings(VIEW_EVENT_BATCH_SIZE=2)
+    def test_full_buffer_is_flushed_after_the_response(self):
+        self.view(self.flowers[0])
+        self.assertFalse(ViewUsertoFlower.objects.exists())
+
+        self.view(self.flowers[1])
+
+        self.assertEqual(ViewUsertoFlower.objects.filter(author=self.user).count(), 2)
+        self.assertEqual(len(view_events), 0)
+
+    def test_seen_list_includes_buffered_views(self):
+        self.view(self.flowers[4])
+
+        response = self.client.get(reverse('flower-seen'))
+
+        self.assertEqual([item['flower']['id'] for item in response.data['results']], [self.flowers[4].id])
+
+    @override_settings(RECENTLY_VIEWED_SIZE=4)
+    def test_seen_list_is_bounded_and_ordered_by_last_view(self):
+        for flower in [*self.flowers[:6], self.flowers[1]]:
+            self.view(flower)
+            flush_view_events(force=True)
+        LiketoFlower.objects.create(flower=self.flowers[1], author=self.user)
+
+        with self.assertNumQueries(14):
+            self.client.get(reverse('flower-seen'), {'page_size': 3})
+        # Flowers are rendered from the fragment cache: a count, the page and one query for its flowers
+        with self.assertNumQueries(3):
+            first_page = self.client.get(reverse('flower-seen'), {'page_size': 3})
+        second_page = self.client.get(reverse('flower-seen'), {'page_size': 3, 'page': 2})
+
+        self.assertEqual(first_page.data['count'], 4)
+        self.assertEqual(
+            [item['flower']['id'] for item in first_page.data['results'] + second_page.data['results']],
+            [self.flowers[index].id for index in (1, 5, 4, 3)]
+        )
+        self.assertTrue(first_page.data['results'][0]['flower']['like'])
+
+    def test_seen_list_ignores_the_cursor_mode(self):
+        self.view(self.flowers[4])
+        flush_view_events(force=True)
+
+        response = self.client.get(reverse('flower-seen'), {'pagination': 'cursor', 'ordering': 'price'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual([item['flower']['id'] for item in response.data['results']], [self.flowers[4].id])
+
+    @override_settings(RECENTLY_VIEWED_SIZE=2)
+    def test_compaction_keeps_the_latest_views_of_every_user(self):
+        other_user = CustomUser.objects.create_user(phone='998900000002', email='other@example.com', password='x')
+        for flower in self.flowers[:4]:
+            record_flower_view(flower.id, self.user.id)
+            record_flower_view(flower.id, other_user.id)
+            flush_view_events(force=True)
+        record_flower_view(self.flowers[0].id, self.user.id)
+        flush_view_events(force=True)
+
+        call_command('compact_flower_views', stdout=StringIO())
+
+        self.assertEqual(
+            set(ViewUsertoFlower.objects.values_list('author_id', 'flower_id')),
+            {(self.user.id, self.flowers[0].id), (self.user.id, self.flowers[3].id),
+             (other_user.id, self.flowers[2].id), (other_user.id, self.flowers[3].id)}
+        )
+
+
+@override_settings(VIEW_EVENT_FLUSH_INTERVAL=0.05)
+class ViewEventFlusherTest(APITransactionTestCase):
+
+    def test_idle_process_writes_views_from_its_flusher_thread(self):
+        user = CustomUser.objects.create_user(phone='998900000001', email='user@example.com', password='secret')
+        flower = Flower.objects.create(price='10.00')
+        view_events.events.clear()
+
+        record_flower_view(flower.id, user.id)
+        deadline = time.monotonic() + 5
+        while view_events.events and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with override_settings(VIEW_EVENT_BACKGROUND_FLUSH=False):
+            view_events.wakeup.set()
+            view_events.flusher.join(5)
+
+        self.assertFalse(view_events.flusher.is_alive())
+        self.assertEqual(list(ViewUsertoFlower.objects.values_list('flower_id', 'author_id')), [(flower.id, user.id)])
+
+
+class PopularityTest(FlowerTestMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_user = CustomUser.objects.create_user(phone='998900000002', email='other@example.com', password='x')
+        cls.balloon = Balloon.objects.create(price='10.00')
+        first, second = cls.flowers[0], cls.flowers[1]
+        ViewUsertoFlower.objects.create(flower=first, author=cls.user)
+        ViewUsertoFlower.objects.create(flower=first, author=cls.other_user)
+        LiketoFlower.objects.create(flower=first, author=cls.user)
+        ViewUsertoFlower.objects.create(flower=second, author=cls.user)
+        OrderFlowers.objects.create(flower=second, quantity=1)
+        LiketoBalloon.objects.create(balloon=cls.balloon, author=cls.user)
+
+    def scores(self):
+        # Runs decay by the exact time since the previous one, a little more than the days it was moved back
+        return {
+            pk: round(popularity, 3) for pk, popularity in Flower.objects.filter(popularity__gt=0).values_list(
+                'id', 'popularity'
+            )
+        }
+
+    @override_settings(POPULAR_PRODUCTS_COUNT=1)
+    def test_scores_are_weighted_event_counts_and_flag_the_most_popular(self):
+        first, second = self.flowers[0], self.flowers[1]
+        Flower.objects.filter(pk=first.pk).update(is_popular=True)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(update_popularity(Flower), 5)
+            update_popularity(Balloon)
+
+        self.assertEqual(self.scores(), {first.id: 5.0, second.id: 6.0})
+        self.assertEqual(list(Flower.objects.filter(is_popular=True).values_list('id', flat=True)), [second.id])
+        self.assertEqual(Balloon.objects.get().popularity, 3.0)
+
+    def move_back(self, days):
+        earlier = timezone.localdate() - timedelta(days=days)
+        ViewUsertoFlower.objects.update(viewed_at=F('viewed_at') - timedelta(days=days))
+        for model in (LiketoFlower, OrderFlowers):
+            model.objects.update(created_at=earlier)
+        PopularityCheckpoint.objects.update(decayed_at=F('decayed_at') - timedelta(days=days))
+
+    def test_runs_decay_old_scores_and_only_read_new_orders(self):
+        first, second = self.flowers[0], self.flowers[1]
+        update_popularity(Flower)
+        self.move_back(7)
+        LiketoFlower.objects.create(flower=second, author=self.other_user)
+
+        with self.assertNumQueries(16):
+            # No new order, and the 3 views and 2 likes scored again
+            self.assertEqual(update_popularity(Flower), 5)
+
+        self.assertEqual(self.scores(), {first.id: 2.5, second.id: 6.0})
+
+        Flower.objects.update(popularity=0, event_popularity=0)
+        update_popularity(Flower, rebuild=True)
+        self.assertEqual(self.scores(), {first.id: 2.5, second.id: 6.0})
+
+    def test_unlikes_take_their_like_back(self):
+        first = self.flowers[0]
+        update_popularity(Flower)
+
+        for _ in range(3):
+            LiketoFlower.objects.filter(flower=first, author=self.user).delete()
+            update_popularity(Flower)
+            LiketoFlower.objects.create(flower=first, author=self.user)
+            update_popularity(Flower)
+        self.assertEqual(self.scores()[first.id], 5.0)
+
+        LiketoFlower.objects.filter(flower=first).delete()
+        update_popularity(Flower)
+        self.assertEqual(self.scores()[first.id], 2.0)
+
+    def test_repeat_views_refresh_their_weight(self):
+        first, second = self.flowers[0], self.flowers[1]
+        update_popularity(Flower)
+        self.move_back(7)
+
+        ViewUsertoFlower.objects.filter(flower=first, author=self.user).update(viewed_at=timezone.now())
+        update_popularity(Flower)
+
+        # One view of today, one of a week ago and the like of a week ago
+        self.assertEqual(self.scores(), {first.id: 3.0, second.id: 3.0})
+
+    def test_runs_without_new_events_keep_the_catalog_caches(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            update_popularity(Flower)
+        version = get_catalog_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(update_popularity(Flower), 0)
+
+        self.assertEqual(get_catalog_version(), version)
+
+    def test_saving_a_stale_product_keeps_its_scores(self):
+        flower, balloon = Flower.objects.get(pk=self.flowers[0].pk), Balloon.objects.get(pk=self.balloon.pk)
+        Flower.objects.filter(pk=flower.pk).update(popularity=42, is_popular=True)
+        Balloon.objects.filter(pk=balloon.pk).update(popularity=42, is_popular=True)
+
+        flower.price = balloon.price = 20
+        flower.save()
+        balloon.save()
+
+        self.assertEqual(list(Flower.objects.filter(pk=flower.pk).values_list('popularity', 'is_popular')), [(42, True)])
+        self.assertEqual(list(Balloon.objects.filter(pk=balloon.pk).values_list('popularity', 'is_popular')), [(42, True)])
+        self.assertEqual(Balloon.objects.get(pk=balloon.pk).price, 20)
+
+    def test_popularity_ordering_and_trending_endpoint(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            update_popularity(Flower)
+            update_popularity(Balloon)
+
+        page = self.client.get(reverse('flower-list-public'), {'ordering': '-popularity', 'page_size': 2})
+        cursor_page = self.client.get(
+            reverse('flower-list-public'), {'ordering': '-popularity', 'page_size': 2, 'pagination': 'cursor'}
+        )
+        self.client.force_authenticate(self.user)
+        trending = self.client.get(reverse('trending'), {'limit': 5})
+
+        expected = [self.flowers[1].id, self.flowers[0].id]
+        self.assertEqual([item['id'] for item in page.data['results']], expected)
+        self.assertEqual([item['id'] for item in cursor_page.data['results']], expected)
+        self.assertEqual([item['id'] for item in trending.data['flowers']], expected)
+        self.assertEqual([item['like'] for item in trending.data['flowers']], [False, True])
+        self.assertEqual([item['id'] for item in trending.data['balloons']], [self.balloon.id])
+
+
+class LikeTest(FlowerTestMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.balloon = Balloon.objects.create(price='10.00')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def test_liking_twice_keeps_one_like(self):
+        flower = self.flowers[0]
+
+        # Validating the flower, then one upsert
+        with self.assertNumQueries(2):
+            first = self.client.post('/api/v1/flower/like/', {'flower': flower.id})
+        second = self.client.post('/api/v1/flower/like/', {'flower': flower.id})
+        balloon = self.client.post('/api/v1/flower/like/balloon', {'balloon': self.balloon.id})
+        self.client.post('/api/v1/flower/like/balloon', {'balloon': self.balloon.id})
+
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(list(LiketoFlower.objects.values_list('id', 'flower_id')), [(first.data['id'], flower.id)])
+        self.assertEqual(balloon.status_code, 201)
+        self.assertEqual(LiketoBalloon.objects.count(), 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            LiketoFlower.objects.create(flower=flower, author=self.user)
+
+    def test_likes_need_a_product(self):
+        flower = self.client.post('/api/v1/flower/like/', {})
+        balloon = self.client.post('/api/v1/flower/like/balloon', {'balloon': ''})
+
+        self.assertEqual((flower.status_code, balloon.status_code), (400, 400))
+        self.assertFalse(LiketoFlower.objects.exists() or LiketoBalloon.objects.exists())
+
+    def test_unliking_twice_succeeds(self):
+        LiketoFlower.objects.create(flower=self.flowers[0], author=self.user)
+
+        responses = [self.client.delete(f'/api/v1/flower/like/{self.flowers[0].id}/') for _ in range(2)]
+        balloon = self.client.delete(f'/api/v1/flower/like/balloon/{self.balloon.id}/')
+
+        self.assertEqual([response.status_code for response in responses], [204, 204])
+        self.assertFalse(LiketoFlower.objects.exists())
+        self.assertEqual(balloon.status_code, 204)
+
+    def test_like_status_of_many_products(self):
+        LiketoFlower.objects.create(flower=self.flowers[1], author=self.user)
+        LiketoBalloon.objects.create(balloon=self.balloon, author=self.user)
+        ids = ','.join(str(flower.id) for flower in self.flowers[:3])
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('like-status'), {'ids': ids})
+        with self.assertNumQueries(0):
+            self.client.get(reverse('like-status'), {'ids': ids})
+        balloons = self.client.get(reverse('like-status'), {'ids': f'{self.balloon.id}', 'type': 'balloon'})
+
+        self.assertEqual(response.data, {
+            str(self.flowers[0].id): False, str(self.flowers[1].id): True, str(self.flowers[2].id): False
+        })
+        self.assertEqual(balloons.data, {str(self.balloon.id): True})
+        self.assertEqual(self.client.get(reverse('like-status'), {'ids': '1,x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('like-status'), {'ids': '1', 'type': 'order'}).status_code, 400)
@@ -5,6 +5,9 @@ urlpatterns = [
     path('categories/', TopLevelCategoryListAPIView.as_view(), name='category-list'),
     path('flowers/', FlowerListCreateAPIView.as_view(), name='flower-list-create'),
     path('flowers/all/', FlowerListAPIView.as_view(), name='flower-list-public'),
+    path('flowers/facets/', FlowerFacetsAPIView.as_view(), name='flower-facets'),
+    path('flowers/export/', FlowerExportAPIView.as_view(), name='flower-export'),
+    path('trending/', TrendingAPIView.as_view(), name='trending'),
     path('flowers/<int:pk>/', FlowerRetrieveUpdateAPIView.as_view(), name='flower-detail-update'),
     path('reviews/', ReviewListCreateAPIView.as_view(), name='review-create'),
     path('package-flowers/', PackageFlowerAPIView.as_view(), name='package-flowers'),
@@ -13,6 +16,7 @@ urlpatterns = [
     path('banner-carousel/', BannerCarouselAPIView.as_view(), name='banner-carousel'),
     path('like/', LiketoFlowerCreateAPIView.as_view(), name='like-flower'),
     path('like/<int:flower_id>/', LiketoFlowerDeleteAPIView.as_view(), name='unlike-flower'),
+    path('likes/status/', LikeStatusAPIView.as_view(), name='like-status'),
     path('flower-seen/', ViewUsertoFlowerListView.as_view(), name='flower-seen'),
     path('balloon/', BalloonListAPIView.as_view(), name='balloon'),
     path('balloon/detail/<int:id>/', BalloonDetailAPIView.as_view(), name='balloon-detail'),
@@ -1,29 +1,47 @@
-from django.db.models import Q
+from django.conf import settings
+from django.utils.translation import get_language
+from parler import appsettings
 
+from apps.flowers.caching import cached_catalog_value, get_catalog_version
 from apps.flowers.models import Flower
 
 
 def get_distinct_product_attributes():
+    language = get_language()
+    return cached_catalog_value(
+        'distinct-product-attributes',
+        f'distinct-product-attributes:{get_catalog_version()}:{language}',
+        lambda: query_distinct_product_attributes(language),
+        settings.DISTINCT_PRODUCT_ATTRIBUTES_CACHE_TIMEOUT,
+    )
+
+
+def query_distinct_product_attributes(language):
+    """
+    Collect the distinct non-empty attribute values of the catalog with DISTINCT queries.
+
+    A flower's plantation is read like ``flower.plantation`` does: from its translation in
+    ``language``, or else from the first fallback language it has a translation in.
+    """
     distinct_plantation = set()
-    distinct_head_outer_diameter = set()
-    distinct_volume = set()
-    distinct_stem_height = set()
-
-    flowers = Flower.objects.all()
-
-    for flower in flowers:
-        if flower.plantation:
-            distinct_plantation.add(flower.plantation)
-        if flower.head_outer_diameter:
-            distinct_head_outer_diameter.add(flower.head_outer_diameter)
-        if flower.volume:
-            distinct_volume.add(flower.volume)
-        if flower.stem_height:
-            distinct_stem_height.add(flower.stem_height)
+    translations = Flower._parler_meta.root_model.objects
+    covered_languages = []
+    for language_code in appsettings.PARLER_LANGUAGES.get_active_choices(language):
+        plantations = translations.filter(language_code=language_code, plantation__gt='')
+        if covered_languages:
+            plantations = plantations.exclude(
+                master_id__in=translations.filter(language_code__in=covered_languages).values('master_id')
+            )
+        distinct_plantation.update(plantations.order_by().values_list('plantation', flat=True).distinct())
+        covered_languages.append(language_code)
+
+    def distinct_values(field):
+        flowers = Flower.objects.exclude(**{field: 0}).filter(**{f'{field}__isnull': False})
+        return list(flowers.order_by(field).values_list(field, flat=True).distinct())
 
     return {
-        'plantation': list(distinct_plantation),
-        'head_outer_diameter': list(distinct_head_outer_diameter),
-        'volume': list(distinct_volume),
-        'stem_height': list(distinct_stem_height),
-    }
\ No newline at end of file
+        'plantation': sorted(distinct_plantation),
+        'head_outer_diameter': distinct_values('head_outer_diameter'),
+        'volume': distinct_values('volume'),
+        'stem_height': distinct_values('stem_height'),
+    }
@@ -0,0 +1,141 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from apps.flowers.models import ViewUsertoFlower
+
+logger = logging.getLogger(__name__)
+
+
+class ViewEventBuffer:
+    """
+    Flower views of this process, kept in memory and written to ViewUsertoFlower in batches, so a detail
+    page view costs no query. Repeated views are merged, and a view of a flower the user has seen before
+    only moves its ``viewed_at`` forward, through the unique ``(flower, author)`` constraint.
+
+    With VIEW_EVENT_BACKGROUND_FLUSH a thread of the process writes them every VIEW_EVENT_FLUSH_INTERVAL
+    seconds, or as soon as VIEW_EVENT_BATCH_SIZE are waiting, so idle workers do not hold on to them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (flower_id, author_id) -> time of the last view
+        self.events = {}
+        self.oldest = None
+        self.wakeup = threading.Event()
+        self.flusher = None
+
+    def __len__(self):
+        return len(self.events)
+
+    def add(self, flower_id, author_id):
+        with self.lock:
+            if not self.events:
+                self.oldest = time.monotonic()
+            self.events[flower_id, author_id] = timezone.now()
+            full = len(self.events) >= settings.VIEW_EVENT_BATCH_SIZE
+        if settings.VIEW_EVENT_BACKGROUND_FLUSH:
+            self.start_flusher()
+            if full:
+                self.wakeup.set()
+
+    def start_flusher(self):
+        # A forked worker does not inherit the thread of its parent, so it starts its own
+        if self.flusher is not None and self.flusher.is_alive():
+            return
+        with self.lock:
+            if self.flusher is None or not self.flusher.is_alive():
+                self.flusher = threading.Thread(target=self.run_flusher, name='view-event-flusher', daemon=True)
+                self.flusher.start()
+
+    def run_flusher(self):
+        while settings.VIEW_EVENT_BACKGROUND_FLUSH:
+            self.wakeup.wait(settings.VIEW_EVENT_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            if self.events:
+                self.flush()
+                # The connection of this thread would otherwise stay open until the process exits
+                connections.close_all()
+
+    def is_due(self):
+        return bool(self.events) and (
+            len(self.events) >= settings.VIEW_EVENT_BATCH_SIZE
+            or time.monotonic() - self.oldest >= settings.VIEW_EVENT_FLUSH_INTERVAL
+        )
+
+    def flush(self):
+        """
+        Write the buffered views with one ``bulk_create`` per VIEW_EVENT_BATCH_SIZE of them. Returns their
+        number; on a database error they are kept for the next flush.
+        """
+        with self.lock:
+            events, self.events = self.events, {}
+        if not events:
+            return 0
+        try:
+            ViewUsertoFlower.objects.bulk_create(
+                [
+                    ViewUsertoFlower(flower_id=flower_id, author_id=author_id, viewed_at=viewed_at)
+                    for (flower_id, author_id), viewed_at in events.items()
+                ],
+                batch_size=settings.VIEW_EVENT_BATCH_SIZE,
+                update_conflicts=True, unique_fields=['flower', 'author'], update_fields=['viewed_at'],
+            )
+        except DatabaseError as error:
+            logger.warning("Cannot record %d flower views: %s", len(events), error)
+            with self.lock:
+                self.events = {**events, **self.events}
+                self.oldest = time.monotonic()
+            return 0
+        return len(events)
+
+
+view_events = ViewEventBuffer()
+atexit.register(view_events.flush)
+
+
+def record_flower_view(flower_id, author_id):
+    view_events.add(flower_id, author_id)
+
+
+def flush_view_events(force=False):
+    """
+    Write the buffered views when there are VIEW_EVENT_BATCH_SIZE of them or the oldest one has waited
+    VIEW_EVENT_FLUSH_INTERVAL seconds, or right away with ``force``. Only needed without
+    VIEW_EVENT_BACKGROUND_FLUSH, or to read views back at once.
+    """
+    if force or view_events.is_due():
+        return view_events.flush()
+    return 0
+
+
+def recently_viewed(user):
+    """
+    The views of ``user``, most recent first, bounded to the RECENTLY_VIEWED_SIZE latest ones.
+    """
+    return ViewUsertoFlower.objects.filter(author=user, flower__isnull=False).order_by('-viewed_at', '-id')[
+        :settings.RECENTLY_VIEWED_SIZE
+    ]
+
+
+def compact_flower_views(keep=None, batch_size=5000):
+    """
+    Delete the views of every user but their ``keep`` (RECENTLY_VIEWED_SIZE by default) latest ones, which
+    are all the recently viewed list shows. Returns the number of views deleted.
+    """
+    keep = keep or settings.RECENTLY_VIEWED_SIZE
+    stale_ids = list(
+        ViewUsertoFlower.objects.annotate(rank=Window(
+            RowNumber(), partition_by=F('author_id'), order_by=(F('viewed_at').desc(), F('id').desc())
+        )).filter(rank__gt=keep).values_list('id', flat=True)
+    )
+    for start in range(0, len(stale_ids), batch_size):
+        ViewUsertoFlower.objects.filter(id__in=stale_ids[start:start + batch_size]).delete()
+    return len(stale_ids)
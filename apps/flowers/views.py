@@ -1,40 +1,74 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from drf_yasg import openapi
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser, IsAuthenticatedOrReadOnly
 from rest_framework.views import APIView
 from drf_yasg.utils import swagger_auto_schema
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
 
+from apps.flowers.caching import cached_catalog_value, catalog_cache_key, record_cache_event
+from apps.flowers.categories import get_category_tree, represent_category_tree
+from apps.flowers.conditional import versioned_condition
+from apps.flowers.exporting import export_csv, export_ndjson
+from apps.flowers.facets import get_flower_facets
 from apps.flowers.filters import FlowerFilter
+from apps.flowers.fragments import render_fragments
+from apps.flowers.languages import LANGUAGE_QUERY_PARAM, get_display_languages, get_payload_languages
+from apps.flowers.likes import get_liked_balloon_ids, get_liked_flower_ids, unlike_product
 from apps.flowers.models import (
-    Flower, TopLevelCategory, CountryFlower, PackageFlower, SizesofFlower, BannerCarousel, LiketoFlower,
-    ViewUsertoFlower, Balloon, LiketoBalloon
+    Category, Flower, CountryFlower, PackageFlower, SizesofFlower, BannerCarousel, LiketoFlower, Balloon,
+    LiketoBalloon, Review
 )
-from apps.flowers.pagination import FlowerPagination
+from apps.flowers.pagination import FlowerPagination, RecentlyViewedPagination, ReviewPagination
+from apps.flowers.popularity import get_trending_ids
 from apps.flowers.serializers import (
-    FlowerListSerializer, ReviewSerializer, TopLevelCategoryWithSubCategoriesSerializer,
+    FlowerListSerializer, ReviewSerializer, ReviewListSerializer, FlowerCardSerializer,
     FlowerDetailSerializer, CountryFlowerSerializer, PackageFlowerSerializer, SizesofFlowerSerializer,
     BannerCarouselSerializer, LiketoFlowerSerializer, ViewUsertoFlowerSerializer, BalloonSerializer,
     LiketoBalloonSerializer
 )
+from apps.flowers.signals import CATALOG_MODELS
 from apps.flowers.utils import get_distinct_product_attributes
+from apps.flowers.view_events import flush_view_events, record_flower_view, recently_viewed
+
+LANGUAGE_PARAMETER = openapi.Parameter(
+    LANGUAGE_QUERY_PARAM, openapi.IN_QUERY,
+    description="Send translated fields flat in one language (ru, en) instead of a 'translations' object "
+                "with every language, falling back to another language when missing. "
+                "Leave empty to use the Accept-Language header",
+    type=openapi.TYPE_STRING
+)
+
+FIELDS_PARAMETER = openapi.Parameter(
+    'fields', openapi.IN_QUERY,
+    description="Comma-separated fields to return, e.g. 'id,name,price,discount_price,images'. "
+                "Translated field names select 'translations'; 'id' is always returned",
+    type=openapi.TYPE_STRING
+)
+OMIT_PARAMETER = openapi.Parameter(
+    'omit', openapi.IN_QUERY, description="Comma-separated fields to leave out, e.g. 'review,author'",
+    type=openapi.TYPE_STRING
+)
 
 
 class TopLevelCategoryListAPIView(APIView):
     permission_classes = [AllowAny]
 
+    @versioned_condition(Category, Category._parler_meta.root_model)
     @swagger_auto_schema(
         operation_summary="Retrieve All Top-Level Categories",
-        operation_description="Get a list of all top-level categories with their details.",
+        operation_description="Get the tree of top-level categories, each with its nested 'subcategories'.",
         tags=["Categories"]
     )
     def get(self, request):
-        categories = TopLevelCategory.objects.all()
-        serializer = TopLevelCategoryWithSubCategoriesSerializer(categories, many=True, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        tree = represent_category_tree(get_category_tree()['roots'], request)
+        return Response(tree, status=status.HTTP_200_OK)
 
 
 class FlowerListCreateAPIView(APIView):
@@ -47,11 +81,19 @@ class FlowerListCreateAPIView(APIView):
         operation_description="Retrieve a list of all flowers with their details with token.",
         tags=["Flowers"],
         manual_parameters=[
+            LANGUAGE_PARAMETER,
+            openapi.Parameter(
+                'q', openapi.IN_QUERY,
+                description="Full-text search over name, description, sort and plantation in every language. "
+                            "Results are ordered by relevance unless 'ordering' is given",
+                type=openapi.TYPE_STRING
+            ),
             openapi.Parameter(
                 'name', openapi.IN_QUERY, description="Filter by flower name (partial match)", type=openapi.TYPE_STRING
             ),
             openapi.Parameter(
-                'category', openapi.IN_QUERY, description="Filter by category ID", type=openapi.TYPE_INTEGER
+                'category', openapi.IN_QUERY, description="Filter by category ID, including its subcategories",
+                type=openapi.TYPE_INTEGER
             ),
             openapi.Parameter(
                 'package', openapi.IN_QUERY, description="Filter by package ID", type=openapi.TYPE_INTEGER
@@ -104,17 +146,29 @@ class FlowerListCreateAPIView(APIView):
                 'head_outer_diameter', openapi.IN_QUERY, description="Filter by head outer diameter (exact match)",
                 type=openapi.TYPE_NUMBER
             ),
+            openapi.Parameter(
+                'min_rating', openapi.IN_QUERY, description="Filter by minimum average rating", type=openapi.TYPE_NUMBER
+            ),
             openapi.Parameter(
                 'ordering', openapi.IN_QUERY,
                 description=(
-                        "Specify ordering of results. Use fields like 'price', '-price' for descending order, "
-                        "'name', '-name', etc."
+                        "Specify ordering of results. Use fields 'created', 'price', 'rating', 'popularity' and "
+                        "prefix them with '-' for descending order, e.g. '-popularity'."
                 ),
                 type=openapi.TYPE_STRING
             ),
             openapi.Parameter(
                 'page', openapi.IN_QUERY, description="Page number for pagination", type=openapi.TYPE_INTEGER
             ),
+            openapi.Parameter(
+                'pagination', openapi.IN_QUERY,
+                description="Set to 'cursor' to page with opaque next/previous cursors instead of page numbers",
+                type=openapi.TYPE_STRING
+            ),
+            openapi.Parameter(
+                'cursor', openapi.IN_QUERY, description="Cursor from the 'next' or 'previous' link (cursor mode)",
+                type=openapi.TYPE_STRING
+            ),
             openapi.Parameter(
                 'page_size', openapi.IN_QUERY, description="Number of results per page (default: 10)",
                 type=openapi.TYPE_INTEGER
@@ -127,7 +181,9 @@ class FlowerListCreateAPIView(APIView):
         filtered_queryset = self.filterset_class(request.GET, queryset=flowers)
         paginator = FlowerPagination()
         paginated_flowers = paginator.paginate_queryset(filtered_queryset.qs, request)
-        serializer = FlowerDetailSerializer(paginated_flowers, many=True)
+        serializer = FlowerDetailSerializer(
+            paginated_flowers, many=True, context={'payload_languages': get_payload_languages(request)}
+        )
         return paginator.get_paginated_response(serializer.data)
 
     @swagger_auto_schema(
@@ -149,18 +205,37 @@ class FlowerListAPIView(APIView):
     permission_classes = [AllowAny]
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
     filterset_class = FlowerFilter
+    cache_name = 'flower-list'
+    view_query_param = 'view'
+    fragment_dependencies = (('country_id', CountryFlower), ('author_id', get_user_model()))
 
+    @versioned_condition(*CATALOG_MODELS, vary=lambda request: sorted(get_liked_flower_ids(request.user)))
     @swagger_auto_schema(
         operation_summary="List All Flowers without Token",
         operation_description="Retrieve a list of all flowers with their details and without token.",
         tags=["Flowers"],
         manual_parameters=[
+            LANGUAGE_PARAMETER,
+            FIELDS_PARAMETER,
+            OMIT_PARAMETER,
+            openapi.Parameter(
+                'view', openapi.IN_QUERY,
+                description="'card' returns compact cards: id, name, price, discount_price, effective_price, "
+                            "image (the first one), average_rating, review_count, in_stock and like",
+                type=openapi.TYPE_STRING, enum=['card']
+            ),
+            openapi.Parameter(
+                'q', openapi.IN_QUERY,
+                description="Full-text search over name, description, sort and plantation in every language. "
+                            "Results are ordered by relevance unless 'ordering' is given",
+                type=openapi.TYPE_STRING
+            ),
             openapi.Parameter(
                 'name', openapi.IN_QUERY, description="Filter by flower name (partial match)", type=openapi.TYPE_STRING
             ),
             openapi.Parameter(
                 'category', openapi.IN_QUERY,
-                description="Filter by category IDs (comma-separated list of category IDs)",
+                description="Filter by category IDs (comma-separated list of category IDs), including their subcategories",
                 type=openapi.TYPE_ARRAY, items=openapi.Items(type=openapi.TYPE_INTEGER)
             ),
             openapi.Parameter(
@@ -214,17 +289,29 @@ class FlowerListAPIView(APIView):
                 'head_outer_diameter', openapi.IN_QUERY, description="Filter by head outer diameter (exact match)",
                 type=openapi.TYPE_NUMBER
             ),
+            openapi.Parameter(
+                'min_rating', openapi.IN_QUERY, description="Filter by minimum average rating", type=openapi.TYPE_NUMBER
+            ),
             openapi.Parameter(
                 'ordering', openapi.IN_QUERY,
                 description=(
-                        "Specify ordering of results. Use fields like 'price', '-price' for descending order, "
-                        "'name', '-name', etc."
+                        "Specify ordering of results. Use fields 'created', 'price', 'rating', 'popularity' and "
+                        "prefix them with '-' for descending order, e.g. '-popularity'."
                 ),
                 type=openapi.TYPE_STRING
             ),
             openapi.Parameter(
                 'page', openapi.IN_QUERY, description="Page number for pagination", type=openapi.TYPE_INTEGER
             ),
+            openapi.Parameter(
+                'pagination', openapi.IN_QUERY,
+                description="Set to 'cursor' to page with opaque next/previous cursors instead of page numbers",
+                type=openapi.TYPE_STRING
+            ),
+            openapi.Parameter(
+                'cursor', openapi.IN_QUERY, description="Cursor from the 'next' or 'previous' link (cursor mode)",
+                type=openapi.TYPE_STRING
+            ),
             openapi.Parameter(
                 'page_size', openapi.IN_QUERY, description="Number of results per page (default: 10)",
                 type=openapi.TYPE_INTEGER
@@ -233,12 +320,170 @@ class FlowerListAPIView(APIView):
         responses={200: FlowerDetailSerializer(many=True)}
     )
     def get(self, request):
+        cache_key = catalog_cache_key(self.cache_name, request)
+        data = cache.get(cache_key)
+        if data is None:
+            record_cache_event(self.cache_name, 'miss')
+            data = self.get_page_data(request)
+            cache.set(cache_key, data, settings.FLOWER_LIST_CACHE_TIMEOUT)
+            cache_status = 'MISS'
+        else:
+            record_cache_event(self.cache_name, 'hit')
+            cache_status = 'HIT'
+
+        liked_flower_ids = get_liked_flower_ids(request.user)
+        for item in data['results']:
+            if 'like' in item:
+                item['like'] = item['id'] in liked_flower_ids
+
+        return Response(data, headers={'X-Cache': cache_status})
+
+    def get_page_data(self, request):
         flowers = Flower.objects.all()
-        filtered_queryset = self.filterset_class(request.GET, queryset=flowers)
+        filtered_queryset = self.filterset_class(request.GET, queryset=flowers).qs
+        cards = request.query_params.get(self.view_query_param) == 'card'
+        if cards:
+            filtered_queryset = FlowerCardSerializer.card_rows(filtered_queryset, get_display_languages(request))
         paginator = FlowerPagination()
-        paginated_flowers = paginator.paginate_queryset(filtered_queryset.qs, request)
-        serializer = FlowerDetailSerializer(paginated_flowers, many=True, context={'request': request})
-        return paginator.get_paginated_response(serializer.data)
+        paginated_flowers = paginator.paginate_queryset(filtered_queryset, request)
+        # Likes are per user, so the cached page is rendered anonymously and they are merged in afterwards
+        context = {'request': request, 'liked_flower_ids': frozenset()}
+        if cards:
+            data = FlowerCardSerializer(paginated_flowers, many=True, context=context).data
+        else:
+            data = render_fragments(
+                FlowerDetailSerializer, paginated_flowers, context, self.fragment_dependencies
+            )
+        return paginator.get_paginated_response(data).data
+
+
+class FlowerFacetsAPIView(APIView):
+    permission_classes = [AllowAny]
+    cache_name = 'flower-facets'
+
+    @swagger_auto_schema(
+        operation_summary="Facet counts for the flower filters",
+        operation_description=(
+                "Accepts the same filter parameters as the flower list and returns, for every facet, its values "
+                "with the number of matching flowers. Each facet ignores its own parameter, so the other values "
+                "of a facet stay visible after one of them has been picked."
+        ),
+        tags=["Flower attributes"],
+        responses={
+            200: openapi.Response(
+                description="Value counts per facet",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    additional_properties=openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                'value': openapi.Schema(type=openapi.TYPE_STRING),
+                                'count': openapi.Schema(type=openapi.TYPE_INTEGER),
+                            }
+                        )
+                    )
+                )
+            )
+        }
+    )
+    def get(self, request):
+        facets = cached_catalog_value(
+            self.cache_name, catalog_cache_key(self.cache_name, request),
+            lambda: get_flower_facets(request.GET), settings.FLOWER_FACETS_CACHE_TIMEOUT,
+        )
+        return Response(facets, status=status.HTTP_200_OK)
+
+
+class TrendingAPIView(APIView):
+    permission_classes = [AllowAny]
+    limit_query_param = 'limit'
+    default_limit = 10
+
+    @swagger_auto_schema(
+        operation_summary="Trending flowers and balloons",
+        operation_description=(
+                "The best scored flowers and balloons, by their recent views, likes and orders. Rankings are "
+                "precomputed by the update_popularity command."
+        ),
+        tags=["Flowers"],
+        manual_parameters=[
+            LANGUAGE_PARAMETER,
+            FIELDS_PARAMETER,
+            OMIT_PARAMETER,
+            openapi.Parameter(
+                'limit', openapi.IN_QUERY, description="Number of products of each kind (default: 10, max: 50)",
+                type=openapi.TYPE_INTEGER
+            ),
+        ],
+        responses={200: openapi.Response(description="'flowers' and 'balloons', best scored first")}
+    )
+    def get(self, request):
+        limit = request.query_params.get(self.limit_query_param, '')
+        limit = min(int(limit), settings.TRENDING_SIZE) if limit.isdigit() else self.default_limit
+        context = {'request': request, 'liked_flower_ids': frozenset(), 'liked_balloon_ids': frozenset()}
+        flowers = self.get_trending(Flower, limit)
+        balloons = self.get_trending(Balloon, limit)
+        data = {
+            'flowers': render_fragments(
+                FlowerDetailSerializer, flowers, context, FlowerListAPIView.fragment_dependencies
+            ),
+            'balloons': render_fragments(BalloonSerializer, balloons, context),
+        }
+        for key, liked_ids in (('flowers', get_liked_flower_ids(request.user)),
+                               ('balloons', get_liked_balloon_ids(request.user))):
+            for item in data[key]:
+                if 'like' in item:
+                    item['like'] = item['id'] in liked_ids
+        return Response(data, status=status.HTTP_200_OK)
+
+    def get_trending(self, model, limit):
+        ids = get_trending_ids(model, limit)
+        products = model.objects.in_bulk(ids)
+        return [products[pk] for pk in ids if pk in products]
+
+
+class FlowerExportAPIView(APIView):
+    permission_classes = [IsAdminUser]
+    filterset_class = FlowerFilter
+    # Not 'format', which DRF reads to pick a renderer
+    output_query_param = 'output'
+    outputs = {
+        'ndjson': (export_ndjson, 'application/x-ndjson', 'flowers.ndjson'),
+        'csv': (export_csv, 'text/csv; charset=utf-8', 'flowers.csv'),
+    }
+
+    @swagger_auto_schema(
+        operation_summary="Export the whole catalog (staff only)",
+        operation_description=(
+                "Streams every flower matching the flower list filters as JSON Lines or CSV, in the format "
+                "the import_flowers command reads. Rows are sent as they are read, so large catalogs "
+                "start downloading at once."
+        ),
+        tags=["Flowers"],
+        manual_parameters=[
+            openapi.Parameter(
+                'output', openapi.IN_QUERY, description="'ndjson' (default) or 'csv'",
+                type=openapi.TYPE_STRING, enum=['ndjson', 'csv']
+            ),
+        ],
+        responses={200: openapi.Response(description="One flower per line")}
+    )
+    def get(self, request):
+        output = request.query_params.get(self.output_query_param) or 'ndjson'
+        if output not in self.outputs:
+            return Response(
+                {self.output_query_param: f"Expected one of: {', '.join(self.outputs)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        export, content_type, filename = self.outputs[output]
+        filterset = self.filterset_class(request.GET, queryset=Flower.objects.all())
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(export(filterset.qs), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
 
 class FlowerRetrieveUpdateAPIView(APIView):
@@ -248,18 +493,14 @@ class FlowerRetrieveUpdateAPIView(APIView):
         operation_summary="Retrieve a Flower",
         operation_description="Retrieve the details of a specific flower by its ID.",
         tags=["Flowers"],
+        manual_parameters=[LANGUAGE_PARAMETER, FIELDS_PARAMETER, OMIT_PARAMETER],
         responses={200: FlowerDetailSerializer}
     )
     def get(self, request, pk):
-
-        if request.user.is_authenticated:
-            flower = get_object_or_404(Flower, id=pk)
-            user = request.user
-            if not ViewUsertoFlower.objects.filter(flower=flower, author=user).exists():
-                ViewUsertoFlower.objects.create(flower=flower, author=user)
-                serializer = FlowerDetailSerializer(flower, context={'request': request})
-                return Response(serializer.data, status=status.HTTP_200_OK)
         flower = get_object_or_404(Flower, id=pk)
+        if request.user.is_authenticated:
+            # Written in batches after the response, see apps.flowers.view_events
+            record_flower_view(flower.pk, request.user.pk)
         serializer = FlowerDetailSerializer(flower, context={'request': request})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -280,7 +521,46 @@ class FlowerRetrieveUpdateAPIView(APIView):
 
 
 class ReviewListCreateAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    flower_query_param = 'flower'
+
+    @swagger_auto_schema(
+        operation_summary="List the Reviews of a Flower",
+        operation_description=(
+                "Page through the reviews of one flower with opaque next/previous cursors, newest first by "
+                "default. Flower responses only embed the newest few."
+        ),
+        tags=["Reviews"],
+        manual_parameters=[
+            openapi.Parameter(
+                'flower', openapi.IN_QUERY, description="ID of the flower", type=openapi.TYPE_INTEGER, required=True
+            ),
+            openapi.Parameter(
+                'ordering', openapi.IN_QUERY,
+                description="'created' or 'rating', prefixed with '-' for descending order (default: '-created')",
+                type=openapi.TYPE_STRING
+            ),
+            openapi.Parameter(
+                'cursor', openapi.IN_QUERY, description="Cursor from the 'next' or 'previous' link",
+                type=openapi.TYPE_STRING
+            ),
+            openapi.Parameter(
+                'page_size', openapi.IN_QUERY, description="Number of results per page (default: 10)",
+                type=openapi.TYPE_INTEGER
+            )
+        ],
+        responses={200: ReviewListSerializer(many=True)}
+    )
+    def get(self, request):
+        flower_id = request.query_params.get(self.flower_query_param, '')
+        if not flower_id.isdigit():
+            return Response(
+                {self.flower_query_param: "A flower ID is required."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        paginator = ReviewPagination()
+        reviews = paginator.paginate_queryset(Review.objects.filter(flower_id=flower_id), request)
+        serializer = ReviewListSerializer(reviews, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
     @swagger_auto_schema(
         operation_summary="Create a New Review",
@@ -300,7 +580,8 @@ class ReviewListCreateAPIView(APIView):
 class PackageFlowerAPIView(APIView):
     permission_classes = [AllowAny]
 
-    @swagger_auto_schema(tags=['Package Flowers'])
+    @versioned_condition(PackageFlower, PackageFlower._parler_meta.root_model)
+    @swagger_auto_schema(tags=['Package Flowers'], manual_parameters=[LANGUAGE_PARAMETER])
     def get(self, request):
         reviews = PackageFlower.objects.all()
         serializer = PackageFlowerSerializer(reviews, many=True, context={'request': request})
@@ -310,17 +591,23 @@ class PackageFlowerAPIView(APIView):
 class BalloonListAPIView(APIView):
     permission_classes = [AllowAny]
 
-    @swagger_auto_schema(tags=['Balloon'])
+    @swagger_auto_schema(tags=['Balloon'], manual_parameters=[LANGUAGE_PARAMETER, FIELDS_PARAMETER, OMIT_PARAMETER])
     def get(self, request):
-        reviews = Balloon.objects.all()
-        serializer = BalloonSerializer(reviews, many=True, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        balloons = list(Balloon.objects.all())
+        data = render_fragments(
+            BalloonSerializer, balloons, {'request': request, 'liked_balloon_ids': frozenset()}
+        )
+        liked_balloon_ids = get_liked_balloon_ids(request.user)
+        for item in data:
+            if 'like' in item:
+                item['like'] = item['id'] in liked_balloon_ids
+        return Response(data, status=status.HTTP_200_OK)
 
 
 class BalloonDetailAPIView(APIView):
     permission_classes = [AllowAny]
 
-    @swagger_auto_schema(tags=['Balloon'])
+    @swagger_auto_schema(tags=['Balloon'], manual_parameters=[LANGUAGE_PARAMETER, FIELDS_PARAMETER, OMIT_PARAMETER])
     def get(self, request, *args, **kwargs):
 
         balloon = get_object_or_404(Balloon, id=kwargs.get('id'))
@@ -330,7 +617,8 @@ class BalloonDetailAPIView(APIView):
 
 class CountryFlowerAPIView(APIView):
     permission_classes = [AllowAny]
-    @swagger_auto_schema(tags=['Country Flowers'])
+    @versioned_condition(CountryFlower, CountryFlower._parler_meta.root_model)
+    @swagger_auto_schema(tags=['Country Flowers'], manual_parameters=[LANGUAGE_PARAMETER])
     def get(self, request):
         countries = CountryFlower.objects.all()
         serializer = CountryFlowerSerializer(countries, many=True, context={'request': request})
@@ -348,7 +636,8 @@ class SizesofFlowerAPIView(APIView):
 
 class BannerCarouselAPIView(APIView):
     permission_classes = [AllowAny]
-    @swagger_auto_schema(tags=['Banner Carousel'])
+    @versioned_condition(BannerCarousel, BannerCarousel._parler_meta.root_model)
+    @swagger_auto_schema(tags=['Banner Carousel'], manual_parameters=[LANGUAGE_PARAMETER])
     def get(self, request):
         countries = BannerCarousel.objects.all()
         serializer = BannerCarouselSerializer(countries, many=True, context={'request': request})
@@ -390,7 +679,7 @@ class LiketoFlowerCreateAPIView(APIView):
 
     @swagger_auto_schema(
         tags=['Like'],
-        operation_description="Like a flower. This will create a new like for the user.",
+        operation_description="Like a flower. Liking a flower again keeps the existing like.",
         request_body=LiketoFlowerSerializer,
         responses={
             201: LiketoFlowerSerializer,
@@ -412,43 +701,111 @@ class LiketoFlowerDeleteAPIView(APIView):
 
     @swagger_auto_schema(
         tags=['Like'],
-        operation_description="Unlike a flower. This will delete the like of a user.",
+        operation_description="Unlike a flower. Unliking a flower that is not liked does nothing.",
         responses={
             204: "Like removed successfully",
-            404: "You haven't liked this flower",
         }
     )
     def delete(self, request, *args, **kwargs):
-        flower_id = kwargs.get('flower_id')
-        try:
-            like = LiketoFlower.objects.get(flower_id=flower_id, author=request.user)
-        except LiketoFlower.DoesNotExist:
-            return Response({"error": "You haven't liked this flower"}, status=status.HTTP_404_NOT_FOUND)
-
-        like.delete()
+        unlike_product(LiketoFlower, 'flower', kwargs.get('flower_id'), request.user)
         return Response({"message": "Like removed successfully"}, status=status.HTTP_204_NO_CONTENT)
 
 
+class LikeStatusAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    ids_query_param = 'ids'
+    type_query_param = 'type'
+    liked_ids_getters = {'flower': get_liked_flower_ids, 'balloon': get_liked_balloon_ids}
+    max_ids = 100
+
+    @swagger_auto_schema(
+        operation_summary="Like state of many products",
+        operation_description=(
+                "Whether the user likes each of the given flowers or balloons, e.g. for every card of a page, "
+                "from at most one query."
+        ),
+        tags=['Like'],
+        manual_parameters=[
+            openapi.Parameter(
+                'ids', openapi.IN_QUERY, description="Comma-separated product IDs (at most 100)",
+                type=openapi.TYPE_ARRAY, items=openapi.Items(type=openapi.TYPE_INTEGER), required=True
+            ),
+            openapi.Parameter(
+                'type', openapi.IN_QUERY, description="'flower' (default) or 'balloon'",
+                type=openapi.TYPE_STRING, enum=['flower', 'balloon']
+            ),
+        ],
+        responses={
+            200: openapi.Response(
+                description="Product ID -> whether it is liked",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT, additional_properties=openapi.Schema(type=openapi.TYPE_BOOLEAN)
+                )
+            )
+        }
+    )
+    def get(self, request):
+        product_type = request.query_params.get(self.type_query_param) or 'flower'
+        if product_type not in self.liked_ids_getters:
+            return Response(
+                {self.type_query_param: f"Expected one of: {', '.join(self.liked_ids_getters)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ids = request.query_params.get(self.ids_query_param, '')
+        ids = [part.strip() for part in ids.split(',') if part.strip()]
+        if not all(part.isdigit() for part in ids) or len(ids) > self.max_ids:
+            return Response(
+                {self.ids_query_param: f"Expected at most {self.max_ids} comma-separated IDs."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # The user's liked ids are cached, so this is one query at most
+        liked_ids = self.liked_ids_getters[product_type](request.user)
+        return Response({pk: int(pk) in liked_ids for pk in ids}, status=status.HTTP_200_OK)
+
+
 class ViewUsertoFlowerListView(APIView):
     permission_classes = [IsAuthenticated]
 
     @swagger_auto_schema(
         operation_summary="Retrieve a list of flowers viewed by the user",
-        operation_description="Fetch a list of all the flowers that the authenticated user has viewed.",
+        operation_description=(
+                "Fetch the flowers the authenticated user has viewed most recently, latest view first. Only the "
+                "last 50 are kept."
+        ),
         tags=["Flowers seen by user"],
+        manual_parameters=[
+            LANGUAGE_PARAMETER,
+            openapi.Parameter(
+                'page', openapi.IN_QUERY, description="Page number for pagination", type=openapi.TYPE_INTEGER
+            ),
+            openapi.Parameter(
+                'page_size', openapi.IN_QUERY, description="Number of results per page (default: 10)",
+                type=openapi.TYPE_INTEGER
+            )
+        ],
         responses={
             200: ViewUsertoFlowerSerializer(many=True),
             401: "Unauthorized - User is not authenticated"
         }
     )
     def get(self, request):
-        queryset = ViewUsertoFlower.objects.select_related('author').filter(
-            author=request.user
+        # Views still buffered by this process are written first, so they show up right away
+        flush_view_events(force=True)
+        paginator = RecentlyViewedPagination()
+        views = paginator.paginate_queryset(recently_viewed(request.user), request)
+        flowers = Flower.objects.in_bulk([view.flower_id for view in views])
+        views = [view for view in views if view.flower_id in flowers]
+        rendered = render_fragments(
+            FlowerDetailSerializer, [flowers[view.flower_id] for view in views],
+            {'request': request, 'liked_flower_ids': frozenset()}, FlowerListAPIView.fragment_dependencies
         )
-
-        serializer = ViewUsertoFlowerSerializer(queryset, many=True, context={'request': request})
-
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        liked_flower_ids = get_liked_flower_ids(request.user)
+        data = []
+        for view, flower in zip(views, rendered):
+            if 'like' in flower:
+                flower['like'] = flower['id'] in liked_flower_ids
+            data.append({'id': view.id, 'flower': flower, 'viewed_at': view.viewed_at})
+        return paginator.get_paginated_response(data)
 
 
 class LiketoBalloonCreateAPIView(APIView):
@@ -456,7 +813,7 @@ class LiketoBalloonCreateAPIView(APIView):
 
     @swagger_auto_schema(
         tags=['Like Balloon'],
-        operation_description="Like a balloon. This will create a new like for the user.",
+        operation_description="Like a balloon. Liking a balloon again keeps the existing like.",
         request_body=LiketoBalloonSerializer,
         responses={
             201: LiketoBalloonSerializer,
@@ -478,19 +835,12 @@ class LiketoBalloonDeleteAPIView(APIView):
 
     @swagger_auto_schema(
         tags=['Like Balloon'],
-        operation_description="Unlike a Balloon. This will delete the like of a user.",
+        operation_description="Unlike a Balloon. Unliking a balloon that is not liked does nothing.",
         responses={
             204: "Like removed successfully",
-            404: "You haven't liked this flower",
         }
     )
     def delete(self, request, *args, **kwargs):
-        balloon_id = kwargs.get('balloon_id')
-        try:
-            like = LiketoBalloon.objects.get(balloon=balloon_id, author=request.user)
-        except LiketoFlower.DoesNotExist:
-            return Response({"error": "You haven't liked this balloon"}, status=status.HTTP_404_NOT_FOUND)
-
-        like.delete()
+        unlike_product(LiketoBalloon, 'balloon', kwargs.get('balloon_id'), request.user)
         return Response({"message": "Like removed successfully"}, status=status.HTTP_204_NO_CONTENT)
 
@@ -1,7 +1,10 @@
 # Import necessary modules and functions
+from django.conf import settings
 from django.http import JsonResponse
 from rest_framework import status
 
+from config.media import serve_media
+
 
 # Middleware for handling JSON error responses
 class JsonErrorResponseMiddleware:
@@ -43,3 +46,14 @@ class Custom404Middleware:
         data = {"detail": "Page not Found"}
         return JsonResponse(data, status=status.HTTP_404_NOT_FOUND)
 
+
+# Middleware serving MEDIA_URL after CORS but ahead of the rest of the stack, so uploads skip auth and the JSON 404 page
+class MediaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.MEDIA_URL if settings.MEDIA_URL.startswith('/') else f'/{settings.MEDIA_URL}'
+
+    def __call__(self, request):
+        if request.path.startswith(self.prefix):
+            return serve_media(request, request.path[len(self.prefix):])
+        return self.get_response(request)
@@ -58,6 +58,7 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'config.middleware.middleware.MediaMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -140,12 +141,56 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "/var/www/flower/media/")
 
+# Media is served by config.middleware.middleware.MediaMiddleware. Set MEDIA_SENDFILE to 'x-accel-redirect'
+# (nginx, with an internal location at MEDIA_ACCEL_REDIRECT_LOCATION aliased to MEDIA_ROOT) or 'x-sendfile'
+# to let the front server send the files.
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_REDIRECT_LOCATION = '/protected-media/'
+MEDIA_MAX_AGE = 60 * 60
+# Names with a content hash before the extension, like rose.3f2a9c1b7d4e.jpg, are cached for good
+MEDIA_IMMUTABLE_PATTERN = r'\.[0-9a-f]{12,}\.\w+$'
+MEDIA_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+# Resized copies of uploaded product and banner images, see apps.flowers.images
+IMAGE_VARIANT_WIDTHS = (320, 640, 1280)
+IMAGE_VARIANT_FORMATS = ('webp', 'jpeg')
+IMAGE_VARIANT_QUALITY = 80
+# Uploads are downscaled to fit this size by the image processing queue
+IMAGE_MAX_DIMENSION = 2560
+IMAGE_PROCESSING_MAX_ATTEMPTS = 5
+# Seconds a claimed task stays hidden from other workers; it is retried after that if its worker died
+IMAGE_PROCESSING_LEASE = 60 * 5
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+LIKED_IDS_CACHE_TIMEOUT = 60 * 60
+FLOWER_LIST_CACHE_TIMEOUT = 60 * 10
+FLOWER_FACETS_CACHE_TIMEOUT = 60 * 30
+DISTINCT_PRODUCT_ATTRIBUTES_CACHE_TIMEOUT = 60 * 60
+CATEGORY_TREE_CACHE_TIMEOUT = 60 * 60
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Newest reviews embedded in flower responses; the rest are paged from reviews/?flower=
+REVIEW_EMBED_LIMIT = 5
+
+# Flower views are buffered per process and written once this many are waiting or the oldest is this old,
+# by a thread of the process; without it, at the end of the request that finds them due
+VIEW_EVENT_BATCH_SIZE = 500
+VIEW_EVENT_FLUSH_INTERVAL = 5
+VIEW_EVENT_BACKGROUND_FLUSH = True
+# Latest views listed per user; compact_flower_views deletes the older ones
+RECENTLY_VIEWED_SIZE = 50
+
+# Popularity scores: weight of every kind of event, halved every POPULARITY_HALF_LIFE_DAYS
+POPULARITY_WEIGHTS = {'view': 1, 'like': 3, 'order': 5}
+POPULARITY_HALF_LIFE_DAYS = 7
+# Best scored products flagged is_popular, and the length of the trending rankings
+POPULAR_PRODUCTS_COUNT = 20
+TRENDING_SIZE = 50
+
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+        'config.renderers.FastJSONRenderer',
     ],
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -9,4 +9,19 @@ DATABASES = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
-}
\ No newline at end of file
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# The browsable API is only served locally
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': [
+        *REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'],
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
@@ -14,4 +14,13 @@ DATABASES = {
         "HOST": "localhost",
         "PORT": 5432,
     }
-}
\ No newline at end of file
+}
+
+# Shared between gunicorn workers, so invalidation in one worker is seen by all of them; the catalog
+# version counters rely on its atomic incr
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379/1',
+    }
+}